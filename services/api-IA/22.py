@@ -3,14 +3,25 @@ import cv2
 import numpy as np
 import pickle
 import os
-import base64
 from flask import Flask, Response, request, render_template_string, jsonify
 
+from caches import CacheTTL
+from detectores import escalar_ubicaciones, obtener_detector, reducir_a_rgb
+from imagenes import decodificar_imagen_rgb
+from seguimiento import SeguidorRostros
+
 # --- 1. Configuración Inicial y Carga de Datos ---
 
 # Nombre del archivo donde guardaremos los rostros conocidos
 DATOS_ROSTROS = "rostros_conocidos.dat"
 
+# Detector de rostros para el video y las capturas (hog, cnn, haar, auto, auto-haar)
+DETECTOR_STREAM = os.environ.get('DETECTOR_STREAM', 'cnn')
+# Rostro mas pequeño a detectar como fraccion del lado menor del frame (fija la escala)
+FRACCION_ROSTRO_STREAM = float(os.environ.get('FRACCION_ROSTRO_STREAM', '0.15'))
+# Sesiones del navegador sin frames por este tiempo se descartan
+SESION_STREAM_TTL_SEGUNDOS = float(os.environ.get('SESION_STREAM_TTL_SEGUNDOS', '60'))
+
 print("Cargando rostros conocidos...")
 
 try:
@@ -45,6 +56,39 @@ def guardar_rostros():
     except Exception as e:
         print(f"Error al guardar los datos: {e}")
 
+# Función que identifica rostros ya detectados (encoding + comparación)
+def identificar_rostros(rgb_small_frame, face_locations):
+    """Retorna un nombre por ubicación. Guarda el primer desconocido para /guardar."""
+    global ultimo_encoding_desconocido
+
+    nombres = []
+    for face_encoding in face_recognition.face_encodings(rgb_small_frame, face_locations):
+        nombre = "Desconocido"
+        if encodings_conocidos:
+            matches = face_recognition.compare_faces(encodings_conocidos, face_encoding, tolerance=0.6)
+            face_distances = face_recognition.face_distance(encodings_conocidos, face_encoding)
+            best_match_index = np.argmin(face_distances)
+            if matches[best_match_index]:
+                nombre = nombres_conocidos[best_match_index]
+
+        if nombre == "Desconocido" and ultimo_encoding_desconocido is None:
+            # Guardamos el encoding del primer desconocido que veamos
+            # para que la ruta /guardar pueda usarlo.
+            ultimo_encoding_desconocido = face_encoding
+            print("Capturado un rostro 'Desconocido' listo para guardar.")
+
+        nombres.append(nombre)
+    return nombres
+
+
+def nuevo_seguidor():
+    return SeguidorRostros(obtener_detector(DETECTOR_STREAM), identificar_rostros)
+
+
+# Un seguidor por sesión del navegador (/upload_frame)
+seguidores_sesion = CacheTTL(capacidad=256, ttl=SESION_STREAM_TTL_SEGUNDOS)
+
+
 # --- 2. Inicializar la Cámara (opcional) ---
 # Por defecto no intentamos acceder a la cámara del host. Si quieres usarla,
 # establece la variable de entorno USE_HOST_CAMERA=1 al iniciar el contenedor.
@@ -65,12 +109,13 @@ app = Flask(__name__)
 
 def generate_frames():
     """Generador que captura video, procesa rostros y devuelve frames como JPEG."""
-    global ultimo_encoding_desconocido
-
     if video_capture is None:
         # No hay cámara local disponible
         return
 
+    # La identidad se conserva entre frames; solo algunos se detectan y codifican completos
+    seguidor = nuevo_seguidor()
+
     while True:
         # Capturamos un solo fotograma de video
         ret, frame = video_capture.read()
@@ -78,42 +123,15 @@ def generate_frames():
             print("Error al capturar frame de la cámara.")
             break
 
-        # Convertimos y re-escalamos (¡más rápido!)
-        rgb_small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-        rgb_small_frame = cv2.cvtColor(rgb_small_frame, cv2.COLOR_BGR2RGB)
-
-        # Encontrar rostros y encodings
-        face_locations = face_recognition.face_locations(rgb_small_frame, model="cnn")
-        face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+        # Convertimos y re-escalamos según la resolución (¡más rápido!)
+        escala = seguidor.detector_completo.escala_para(frame.shape[0], frame.shape[1], FRACCION_ROSTRO_STREAM)
+        rgb_small_frame = reducir_a_rgb(frame, escala)
 
-        nombres_en_frame = []
-        
-        for i, face_encoding in enumerate(face_encodings):
-            matches = face_recognition.compare_faces(encodings_conocidos, face_encoding, tolerance=0.6)
-            nombre = "Desconocido"
+        # Encontrar rostros (seguidos o detectados de nuevo) y sus nombres
+        rostros = seguidor.procesar(rgb_small_frame)
+        ubicaciones = escalar_ubicaciones([caja for caja, _ in rostros], rgb_small_frame.shape, frame.shape)
 
-            face_distances = face_recognition.face_distance(encodings_conocidos, face_encoding)
-            
-            if len(face_distances) > 0:
-                best_match_index = np.argmin(face_distances)
-                if matches[best_match_index]:
-                    nombre = nombres_conocidos[best_match_index]
-            
-            if nombre == "Desconocido":
-                # Guardamos el encoding del primer desconocido que veamos
-                # para que la ruta /guardar pueda usarlo.
-                if ultimo_encoding_desconocido is None:
-                     ultimo_encoding_desconocido = face_encoding
-                     print("Capturado un rostro 'Desconocido' listo para guardar.")
-
-            nombres_en_frame.append(nombre)
-
-           
-            top, right, bottom, left = face_locations[i]
-            top *= 4
-            right *= 4
-            bottom *= 4
-            left *= 4
+        for (top, right, bottom, left), (_, nombre) in zip(ubicaciones, rostros):
 
             cv2.rectangle(frame, (left, top), (right, bottom), (0, 0, 255), 2)
             cv2.rectangle(frame, (left, bottom - 35), (right, bottom), (0, 0, 255), cv2.FILLED)
@@ -191,6 +209,8 @@ def index():
         }
 
         let sending = false;
+        // Identifica a esta pestaña para que el servidor siga sus rostros entre frames
+        const sesion = Math.random().toString(36).slice(2);
         function startSending() {
             if (sending) return;
             sending = true;
@@ -208,7 +228,7 @@ def index():
                     const res = await fetch('/upload_frame', {
                         method: 'POST',
                         headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ image: dataURL })
+                        body: JSON.stringify({ image: dataURL, sesion })
                     });
                     if (!res.ok) {
                         const text = await res.text();
@@ -287,60 +307,38 @@ def guardar_nuevo_rostro():
 @app.route('/upload_frame', methods=['POST'])
 def upload_frame():
     """Recibe un JSON con { image: dataURL } desde el navegador, procesa el frame y devuelve nombres y cajas."""
-    global ultimo_encoding_desconocido, nombres_conocidos, encodings_conocidos
-
     data = request.get_json()
     if not data or 'image' not in data:
         return 'Falta campo image en JSON', 400
 
-    img_data = data['image']
-    # data:image/jpeg;base64,...
-    if ',' in img_data:
-        header, img_base64 = img_data.split(',', 1)
-    else:
-        img_base64 = img_data
+    # One tracker per browser session (falls back to the client address)
+    sesion = data.get('sesion') or request.remote_addr
+    seguidor = seguidores_sesion.obtener(sesion)
+    if seguidor is None:
+        seguidor = nuevo_seguidor()
+    # Re-store on every frame so active sessions don't expire
+    seguidores_sesion.guardar(sesion, seguidor)
 
+    # Decode straight to RGB at the detection scale (data:image/jpeg;base64,...)
+    detector = seguidor.detector_completo
     try:
-        img_bytes = base64.b64decode(img_base64)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if frame is None:
-            return 'No se pudo decodificar la imagen', 400
-    except Exception as e:
-        return f'Error decodificando imagen: {e}', 400
-
-    # Convert to RGB and resize as in generate_frames
-    rgb_small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-    rgb_small_frame = cv2.cvtColor(rgb_small_frame, cv2.COLOR_BGR2RGB)
+        rgb_small_frame, forma_original = decodificar_imagen_rgb(
+            data['image'],
+            lambda alto, ancho: detector.escala_para(alto, ancho, FRACCION_ROSTRO_STREAM)
+        )
+    except ValueError as e:
+        return str(e), 400
 
-    face_locations = face_recognition.face_locations(rgb_small_frame, model="cnn")
-    face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+    rostros = seguidor.procesar(rgb_small_frame)
+    ubicaciones = escalar_ubicaciones([caja for caja, _ in rostros], rgb_small_frame.shape, forma_original)
 
     names_in_frame = []
     boxes = []
 
-    for i, face_encoding in enumerate(face_encodings):
-        matches = face_recognition.compare_faces(encodings_conocidos, face_encoding, tolerance=0.6)
-        nombre = 'Desconocido'
-
-        if encodings_conocidos:
-            face_distances = face_recognition.face_distance(encodings_conocidos, face_encoding)
-            best_match_index = np.argmin(face_distances)
-            if matches[best_match_index]:
-                nombre = nombres_conocidos[best_match_index]
-
-        # If unknown, store the encoding so /guardar can use it
-        if nombre == 'Desconocido' and ultimo_encoding_desconocido is None:
-            ultimo_encoding_desconocido = face_encoding
-
+    for (top, right, bottom, left), (_, nombre) in zip(ubicaciones, rostros):
         names_in_frame.append(nombre)
 
-        # Scale face_locations back to original frame size
-        top, right, bottom, left = face_locations[i]
-        top *= 4
-        right *= 4
-        bottom *= 4
-        left *= 4
+        # Face locations already scaled back to original frame size
         width = right - left
         height = bottom - top
 
@@ -0,0 +1,185 @@
+"""
+Control de admision para las peticiones de reconocimiento
+Acota las peticiones en curso. Las que no pueden empezar dentro de su plazo se
+rechazan de inmediato (503 + Retry-After) en vez de esperar detras de la
+inferencia hasta que el proxy corte la conexion y el kiosko reintente.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from metricas import Contador, Histograma, Medidor
+from planificador import PLANIFICADOR_MAX_LOTE, PLANIFICADOR_VENTANA_MS
+from trabajadores import TRABAJADORES
+
+# Peticiones de reconocimiento en curso por proceso (0 = sin control de admision).
+# Con el planificador de micro-lotes solo las peticiones admitidas entran a un
+# lote, asi que un lote nunca supera este valor: por defecto al menos
+# PLANIFICADOR_MAX_LOTE para no achicar los lotes
+ADMISION_MAX_EN_CURSO = int(os.environ.get('ADMISION_MAX_EN_CURSO', str(max(
+    2, TRABAJADORES * 2, PLANIFICADOR_MAX_LOTE if PLANIFICADOR_VENTANA_MS > 0 else 0
+))))
+
+# Segundos que una peticion puede esperar para empezar; el cliente puede pedir menos con X-Plazo-Ms
+ADMISION_PLAZO_SEGUNDOS = float(os.environ.get('ADMISION_PLAZO_SEGUNDOS', '10'))
+
+# Peticiones en espera, en total y por terminal (0 = sin limite por terminal), antes
+# de rechazar sin esperar. El limite por terminal solo sirve si los clientes envian
+# X-Terminal-Id: sin el, todos los kioscos detras de un proxy son una sola terminal
+ADMISION_MAX_COLA = int(os.environ.get('ADMISION_MAX_COLA', str(ADMISION_MAX_EN_CURSO * 4)))
+ADMISION_MAX_COLA_TERMINAL = int(os.environ.get('ADMISION_MAX_COLA_TERMINAL', '0'))
+
+
+class PeticionRechazada(Exception):
+    """La peticion no puede empezar a tiempo. `reintentar_en` va en el header Retry-After."""
+
+    def __init__(self, mensaje, motivo, reintentar_en):
+        super().__init__(mensaje)
+        self.motivo = motivo
+        self.reintentar_en = reintentar_en
+
+
+class _Espera:
+    __slots__ = ('evento', 'admitida')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.admitida = False
+
+
+class ControlAdmision:
+    """
+    Hasta `max_en_curso` peticiones a la vez; las demas esperan en una
+    cola por terminal. Al liberarse un lugar se atiende a la siguiente
+    terminal por turnos (no a la peticion mas antigua), asi que una
+    terminal con una rafaga no deja sin servicio a las demas. Con
+    `max_por_terminal` > 0 cada terminal tiene ademas a lo sumo esa
+    cantidad de peticiones en espera.
+
+    Una peticion que no obtiene lugar dentro de su plazo, o que llega con
+    la cola llena, recibe PeticionRechazada con el tiempo sugerido para
+    reintentar (estimado con la duracion media de las peticiones).
+    """
+
+    def __init__(self, max_en_curso=ADMISION_MAX_EN_CURSO, plazo=ADMISION_PLAZO_SEGUNDOS,
+                 max_cola=ADMISION_MAX_COLA, max_por_terminal=ADMISION_MAX_COLA_TERMINAL):
+        self.max_en_curso = max_en_curso
+        self.plazo = plazo
+        self.max_cola = max_cola
+        self.max_por_terminal = max_por_terminal
+
+        self._lock = threading.Lock()
+        self._colas = OrderedDict()
+        self.en_curso = 0
+        self.en_cola = 0
+        self._duracion_media = None
+
+        self.peticiones = Contador(
+            'admision_peticiones_total', 'Peticiones de reconocimiento por resultado de admision', ('resultado',)
+        )
+        self.espera_segundos = Histograma(
+            'admision_espera_segundos', 'Espera antes de empezar a procesar una peticion admitida',
+            [0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+        )
+        Medidor('admision_en_curso', 'Peticiones de reconocimiento en curso', funcion=lambda: self.en_curso)
+        Medidor('admision_en_cola', 'Peticiones de reconocimiento esperando lugar', funcion=lambda: self.en_cola)
+
+    def _reintentar_en(self):
+        """Segundos estimados hasta que haya lugar (minimo 1)."""
+        duracion = self._duracion_media or 1.0
+        return max(1, math.ceil(duracion * (self.en_cola / self.max_en_curso + 1)))
+
+    def _rechazar(self, motivo, mensaje):
+        self.peticiones.inc(resultado=motivo)
+        with self._lock:
+            reintentar_en = self._reintentar_en()
+        raise PeticionRechazada(mensaje, motivo, reintentar_en)
+
+    def _entrar(self, terminal, plazo):
+        with self._lock:
+            if self.en_curso < self.max_en_curso and not self.en_cola:
+                self.en_curso += 1
+                return
+            cola = self._colas.get(terminal)
+            llena = self.en_cola >= self.max_cola
+            if not llena and self.max_por_terminal and cola is not None and len(cola) >= self.max_por_terminal:
+                llena = True
+            if not llena:
+                espera = _Espera()
+                if cola is None:
+                    cola = self._colas[terminal] = deque()
+                cola.append(espera)
+                self.en_cola += 1
+        if llena:
+            self._rechazar('cola_llena', "Servicio saturado, reintente mas tarde")
+
+        if espera.evento.wait(plazo):
+            return
+        with self._lock:
+            # El lugar pudo llegar justo al vencer el plazo
+            if espera.admitida:
+                return
+            cola = self._colas[terminal]
+            cola.remove(espera)
+            if not cola:
+                del self._colas[terminal]
+            self.en_cola -= 1
+        self._rechazar('plazo', f"No se pudo atender la peticion en {plazo:.1f}s")
+
+    def _salir(self, duracion):
+        with self._lock:
+            # Media movil exponencial de la duracion, para Retry-After
+            if self._duracion_media is None:
+                self._duracion_media = duracion
+            else:
+                self._duracion_media += 0.1 * (duracion - self._duracion_media)
+            if not self._colas:
+                self.en_curso -= 1
+                return
+            # El lugar pasa a la primera terminal de la rotacion, que vuelve al final
+            terminal, cola = next(iter(self._colas.items()))
+            espera = cola.popleft()
+            if cola:
+                self._colas.move_to_end(terminal)
+            else:
+                del self._colas[terminal]
+            self.en_cola -= 1
+            espera.admitida = True
+            espera.evento.set()
+
+    @contextmanager
+    def admitir(self, terminal, plazo=None):
+        """
+        Espera un lugar para `terminal` hasta `plazo` segundos (por defecto y
+        como maximo el configurado) y lo libera al salir del bloque. Lanza
+        PeticionRechazada si no lo obtiene.
+        """
+        plazo = self.plazo if plazo is None else min(plazo, self.plazo)
+        llegada = time.perf_counter()
+        self._entrar(terminal, plazo)
+        inicio = time.perf_counter()
+        self.peticiones.inc(resultado='admitida')
+        self.espera_segundos.observar(inicio - llegada)
+        try:
+            yield
+        finally:
+            self._salir(time.perf_counter() - inicio)
+
+    def estado(self):
+        """Resumen para /health."""
+        with self._lock:
+            estado = {
+                'en_curso': self.en_curso,
+                'max_en_curso': self.max_en_curso,
+                'en_cola': self.en_cola,
+                'max_cola': self.max_cola,
+                'terminales_en_espera': len(self._colas),
+                'plazo_segundos': self.plazo,
+                'duracion_media_segundos': round(self._duracion_media, 4) if self._duracion_media is not None else None
+            }
+        estado['peticiones'] = {clave[0]: valor for clave, valor in self.peticiones.valores().items()}
+        return estado
@@ -0,0 +1,388 @@
+"""
+Persistencia de la galeria de rostros
+Instantanea binaria abierta con np.memmap + registro de escritura anticipada (WAL) solo-anexar
+"""
+
+import fcntl
+import json
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+import numpy as np
+
+# Instantanea (.gal):
+#   cabecera de 64 bytes | matriz N x D float32 | normas N float32 | IDs utf-8 separados por '\n'
+MAGIA_INSTANTANEA = b'GALROST1'
+CABECERA_INSTANTANEA = struct.Struct('<8sIQQIQQ')
+TAM_CABECERA_INSTANTANEA = 64
+VERSION_FORMATO = 1
+
+# WAL (.wal):
+#   cabecera: magia + generacion de la instantanea a la que aplica
+#   registros: largo u32 | crc32 u32 | operacion u8 | largo id u16 | id | cantidad u32 | float32 x cantidad x D
+MAGIA_WAL = b'GALWAL01'
+CABECERA_WAL = struct.Struct('<8sQ')
+CABECERA_REGISTRO = struct.Struct('<II')
+OP_REEMPLAZAR = ord('R')
+OP_ELIMINAR = ord('D')
+
+# Compactar cuando el WAL supere este tamaño
+COMPACTAR_WAL_BYTES = int(os.environ.get('COMPACTAR_WAL_BYTES', str(8 * 1024 * 1024)))
+
+
+class AlmacenGaleria:
+    """
+    Guarda la galeria en una instantanea de ancho fijo que se abre con
+    np.memmap (sin copiar al iniciar) y en un WAL donde cada enrolamiento
+    solo anexa sus encodings. Las operaciones del WAL son idempotentes
+    (reemplazar / eliminar usuario), asi que reaplicarlas es seguro.
+
+    La compactacion escribe una instantanea nueva con la siguiente
+    generacion y luego reinicia el WAL; si el proceso se cae entre ambos
+    pasos, el WAL de la generacion anterior se descarta al iniciar.
+
+    Varios procesos pueden compartir los archivos (workers de gunicorn,
+    enrolamiento): las escrituras toman un flock sobre <ruta_base>.lock y
+    antes de escribir aplican lo que los demas anexaron. `actualizar`
+    hace lo mismo para un proceso que solo lee.
+    """
+
+    def __init__(self, ruta_base, dimension=128, compactar_bytes=COMPACTAR_WAL_BYTES):
+        self.ruta_instantanea = f"{ruta_base}.gal"
+        self.ruta_wal = f"{ruta_base}.wal"
+        self.ruta_marca = f"{ruta_base}.sync"
+        self.ruta_estado_sync = f"{ruta_base}.sync-estado"
+        self.ruta_bloqueo = f"{ruta_base}.lock"
+        self.dimension = dimension
+        self.compactar_bytes = compactar_bytes
+        self.generacion = 0
+        self._wal = None
+        # WAL leido hasta ahora (inodo, bytes): otro inodo significa que otro proceso compacto
+        self._inodo_wal = None
+        self._posicion_wal = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _bloqueo(self):
+        """Excluye a los demas hilos de este proceso y, con flock, a los demas procesos."""
+        with self._lock, open(self.ruta_bloqueo, 'a') as archivo:
+            fcntl.flock(archivo, fcntl.LOCK_EX)
+            yield
+
+    # ------------------------------------------
+    # Lectura
+    # ------------------------------------------
+
+    def existe(self):
+        return os.path.exists(self.ruta_instantanea) or os.path.exists(self.ruta_wal)
+
+    def _leer_instantanea(self):
+        """Retorna (generacion, ids, matriz, normas) mapeando la matriz en memoria."""
+        with open(self.ruta_instantanea, 'rb') as f:
+            cabecera = f.read(TAM_CABECERA_INSTANTANEA)
+            magia, version, generacion, n, dimension, offset_ids, largo_ids = \
+                CABECERA_INSTANTANEA.unpack_from(cabecera)
+            if magia != MAGIA_INSTANTANEA or version != VERSION_FORMATO:
+                raise ValueError(f"Formato de galeria no soportado: {self.ruta_instantanea}")
+            if dimension != self.dimension:
+                raise ValueError(f"Dimension {dimension} distinta a la esperada {self.dimension}")
+            f.seek(offset_ids)
+            datos_ids = f.read(largo_ids)
+
+        ids = datos_ids.decode('utf-8').split('\n') if n else []
+        if n == 0:
+            matriz = np.empty((0, dimension), dtype=np.float32)
+            normas = np.empty(0, dtype=np.float32)
+        else:
+            # mode='c': copia-en-escritura, las paginas solo se copian si se modifican
+            matriz = np.memmap(self.ruta_instantanea, dtype='<f4', mode='c',
+                               offset=TAM_CABECERA_INSTANTANEA, shape=(n, dimension))
+            normas = np.memmap(self.ruta_instantanea, dtype='<f4', mode='c',
+                               offset=TAM_CABECERA_INSTANTANEA + n * dimension * 4, shape=(n,))
+        return generacion, ids, matriz, normas
+
+    def _generacion_en_disco(self):
+        if not os.path.exists(self.ruta_instantanea):
+            return 0
+        with open(self.ruta_instantanea, 'rb') as f:
+            return CABECERA_INSTANTANEA.unpack_from(f.read(TAM_CABECERA_INSTANTANEA))[2]
+
+    def _leer_registros(self, desde=None):
+        """
+        Lee los registros (operacion, usuario_id, encodings) del WAL a partir
+        del byte `desde` (por defecto el primero). Se detiene en el primer
+        registro incompleto o corrupto.
+        Retorna (generacion, registros, posicion valida).
+        """
+        registros = []
+        with open(self.ruta_wal, 'rb') as f:
+            magia, generacion = CABECERA_WAL.unpack(f.read(CABECERA_WAL.size))
+            if magia != MAGIA_WAL:
+                raise ValueError(f"WAL invalido: {self.ruta_wal}")
+            inicio_datos = desde or CABECERA_WAL.size
+            f.seek(inicio_datos)
+            datos = f.read()
+
+        posicion = 0
+        while posicion + CABECERA_REGISTRO.size <= len(datos):
+            largo, crc = CABECERA_REGISTRO.unpack_from(datos, posicion)
+            inicio = posicion + CABECERA_REGISTRO.size
+            carga = datos[inicio:inicio + largo]
+            if len(carga) < largo or zlib.crc32(carga) != crc:
+                break
+            operacion = carga[0]
+            (largo_id,) = struct.unpack_from('<H', carga, 1)
+            usuario_id = carga[3:3 + largo_id].decode('utf-8')
+            (cantidad,) = struct.unpack_from('<I', carga, 3 + largo_id)
+            encodings = np.frombuffer(carga, dtype='<f4', offset=7 + largo_id,
+                                      count=cantidad * self.dimension).reshape(cantidad, self.dimension)
+            registros.append((operacion, usuario_id, encodings))
+            posicion = inicio + largo
+        return generacion, registros, inicio_datos + posicion
+
+    @staticmethod
+    def _aplicar_registros(galeria, registros):
+        for operacion, usuario_id, encodings in registros:
+            if operacion == OP_REEMPLAZAR:
+                galeria.reemplazar_usuario(usuario_id, encodings)
+            elif operacion == OP_ELIMINAR:
+                galeria.eliminar_usuario(usuario_id)
+
+    def _cargar(self, galeria):
+        if os.path.exists(self.ruta_instantanea):
+            self.generacion, ids, matriz, normas = self._leer_instantanea()
+            galeria.adoptar(ids, matriz, normas)
+        else:
+            vacia = np.empty((0, self.dimension), dtype=np.float32)
+            galeria.adoptar([], vacia, vacia[:, 0])
+        self._cerrar_wal()
+        self._inodo_wal, self._posicion_wal = None, 0
+
+        aplicados = 0
+        if os.path.exists(self.ruta_wal):
+            generacion, registros, valido = self._leer_registros()
+            if generacion == self.generacion:
+                self._aplicar_registros(galeria, registros)
+                aplicados = len(registros)
+                # Descartar una cola incompleta de una escritura interrumpida
+                if valido < os.path.getsize(self.ruta_wal):
+                    with open(self.ruta_wal, 'r+b') as f:
+                        f.truncate(valido)
+                self._inodo_wal, self._posicion_wal = os.stat(self.ruta_wal).st_ino, valido
+            else:
+                self._reiniciar_wal()
+        return aplicados
+
+    def cargar(self, galeria):
+        """Carga la instantanea y reaplica el WAL sobre la galeria (reemplaza su contenido)."""
+        with self._bloqueo():
+            return self._cargar(galeria)
+
+    def _cambios_externos(self):
+        """Solo un stat: True si el WAL en disco no es el que se leyo hasta ahora."""
+        try:
+            estado = os.stat(self.ruta_wal)
+        except FileNotFoundError:
+            return self._inodo_wal is not None
+        return estado.st_ino != self._inodo_wal or estado.st_size > self._posicion_wal
+
+    def _ponerse_al_dia(self, galeria):
+        """
+        Aplica lo que otros procesos escribieron desde la ultima lectura: la
+        cola nueva del WAL o, si otro proceso compacto, la galeria completa.
+        Llamar con el bloqueo tomado. Retorna True si hubo cambios.
+        """
+        if not self._cambios_externos():
+            return False
+        inodo = os.stat(self.ruta_wal).st_ino if os.path.exists(self.ruta_wal) else None
+        if inodo != self._inodo_wal:
+            self._cargar(galeria)
+            return True
+        _, registros, valido = self._leer_registros(self._posicion_wal)
+        self._aplicar_registros(galeria, registros)
+        self._posicion_wal = valido
+        return bool(registros)
+
+    def actualizar(self, galeria):
+        """
+        Retorna una galeria nueva con los cambios que otros procesos
+        escribieron en disco, o None si no hubo; `galeria` (la publicada)
+        no se modifica. Sin cambios solo cuesta un stat. Si otro proceso
+        compacto, la nueva se carga desde la instantanea en vez de derivarse
+        de `galeria`.
+        """
+        if not self._cambios_externos():
+            return None
+        with self._bloqueo():
+            if not self._cambios_externos():
+                return None
+            inodo = os.stat(self.ruta_wal).st_ino if os.path.exists(self.ruta_wal) else None
+            nueva = galeria.vacia() if inodo != self._inodo_wal else galeria.derivar()
+            return nueva if self._ponerse_al_dia(nueva) else None
+
+    # ------------------------------------------
+    # Escritura
+    # ------------------------------------------
+
+    def _cerrar_wal(self):
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+
+    def _reiniciar_wal(self):
+        self._cerrar_wal()
+        temporal = f"{self.ruta_wal}.tmp"
+        with open(temporal, 'wb') as f:
+            f.write(CABECERA_WAL.pack(MAGIA_WAL, self.generacion))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.ruta_wal)
+        self._inodo_wal = os.stat(self.ruta_wal).st_ino
+        self._posicion_wal = CABECERA_WAL.size
+
+    def _anexar(self, operacion, usuario_id, encodings):
+        id_bytes = usuario_id.encode('utf-8')
+        encodings = np.ascontiguousarray(encodings, dtype='<f4').reshape(-1, self.dimension)
+        carga = b''.join((
+            struct.pack('<BH', operacion, len(id_bytes)),
+            id_bytes,
+            struct.pack('<I', encodings.shape[0]),
+            encodings.tobytes()
+        ))
+        if self._wal is None:
+            if not os.path.exists(self.ruta_wal):
+                self._reiniciar_wal()
+            self._wal = open(self.ruta_wal, 'ab')
+        self._wal.write(CABECERA_REGISTRO.pack(len(carga), zlib.crc32(carga)) + carga)
+
+    def aplicar_cambios(self, galeria, reemplazos=None, eliminados=()):
+        """
+        Aplica un lote de cambios a la galeria y los registra en el WAL con
+        una sola sincronizacion a disco.
+
+        reemplazos: dict usuario_id -> encodings (N x D)
+        eliminados: usuario_ids a eliminar
+        """
+        reemplazos = reemplazos or {}
+        if not reemplazos and not eliminados:
+            return
+        vacio = np.empty((0, self.dimension), dtype=np.float32)
+        with self._bloqueo():
+            self._ponerse_al_dia(galeria)
+            for usuario_id in eliminados:
+                galeria.eliminar_usuario(usuario_id)
+                self._anexar(OP_ELIMINAR, usuario_id, vacio)
+            for usuario_id, encodings in reemplazos.items():
+                galeria.reemplazar_usuario(usuario_id, encodings)
+                self._anexar(OP_REEMPLAZAR, usuario_id, encodings)
+            self._wal.flush()
+            os.fsync(self._wal.fileno())
+            self._posicion_wal = self._wal.tell()
+            if self._posicion_wal >= self.compactar_bytes:
+                self._compactar(galeria)
+
+    def cerrar(self):
+        """Cierra el WAL abierto (el proximo cambio lo vuelve a abrir)."""
+        with self._lock:
+            self._cerrar_wal()
+
+    def reemplazar_usuario(self, galeria, usuario_id, encodings):
+        """Reemplaza los encodings del usuario en la galeria y lo registra en el WAL."""
+        self.aplicar_cambios(galeria, reemplazos={usuario_id: encodings})
+
+    def eliminar_usuario(self, galeria, usuario_id):
+        """Elimina al usuario de la galeria y lo registra en el WAL."""
+        self.aplicar_cambios(galeria, eliminados=[usuario_id])
+
+    # ------------------------------------------
+    # Marca de sincronizacion con el backend
+    # ------------------------------------------
+
+    def version_marca(self):
+        """Identifica la ultima escritura de la marca (otro proceso pudo guardarla)."""
+        try:
+            return os.stat(self.ruta_marca).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def leer_marca(self):
+        """
+        Ultima marca de sincronizacion y los IDs de usuarios que vinieron del
+        backend ((None, None) si no hay; IDs None en el formato anterior).
+        """
+        if not self.existe():
+            return None, None
+        try:
+            with open(self.ruta_marca) as f:
+                datos = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None, None
+        ids_backend = datos.get('ids_backend')
+        return datos.get('marca'), set(ids_backend) if ids_backend is not None else None
+
+    def guardar_marca(self, marca, ids_backend):
+        """Guarda la marca despues de que los cambios ya estan en el WAL."""
+        temporal = f"{self.ruta_marca}.tmp"
+        with open(temporal, 'w') as f:
+            json.dump({'marca': marca, 'ids_backend': sorted(ids_backend)}, f)
+        os.replace(temporal, self.ruta_marca)
+
+    def descartar_marca(self):
+        """
+        Borra la marca cuando la galeria se reescribio sin los usuarios del
+        backend: la proxima sincronizacion sera completa y los vuelve a traer.
+        """
+        try:
+            os.remove(self.ruta_marca)
+        except FileNotFoundError:
+            pass
+
+    def leer_estado_sincronizacion(self):
+        """Resultado de la ultima sincronizacion, de cualquier proceso ({} si no hay)."""
+        try:
+            with open(self.ruta_estado_sync) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def guardar_estado_sincronizacion(self, estado):
+        """Publica el resultado de una sincronizacion para los demas procesos."""
+        temporal = f"{self.ruta_estado_sync}.{os.getpid()}.tmp"
+        with open(temporal, 'w') as f:
+            json.dump(estado, f)
+        os.replace(temporal, self.ruta_estado_sync)
+
+    def _compactar(self, galeria):
+        ids, matriz, normas = galeria.instantanea()
+        ids_bytes = '\n'.join(ids).encode('utf-8')
+        n = len(ids)
+        offset_ids = TAM_CABECERA_INSTANTANEA + n * self.dimension * 4 + n * 4
+        # Otro proceso pudo compactar despues de la ultima lectura
+        generacion = max(self.generacion, self._generacion_en_disco()) + 1
+
+        temporal = f"{self.ruta_instantanea}.tmp"
+        with open(temporal, 'wb') as f:
+            cabecera = CABECERA_INSTANTANEA.pack(
+                MAGIA_INSTANTANEA, VERSION_FORMATO, generacion, n,
+                self.dimension, offset_ids, len(ids_bytes)
+            )
+            f.write(cabecera.ljust(TAM_CABECERA_INSTANTANEA, b'\0'))
+            f.write(np.ascontiguousarray(matriz, dtype='<f4').tobytes())
+            f.write(np.ascontiguousarray(normas, dtype='<f4').tobytes())
+            f.write(ids_bytes)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.ruta_instantanea)
+
+        self.generacion = generacion
+        self._reiniciar_wal()
+
+    def compactar(self, galeria):
+        """
+        Escribe una instantanea nueva con toda la galeria y reinicia el WAL.
+        `galeria` reemplaza lo que haya en disco (sincronizacion completa).
+        """
+        with self._bloqueo():
+            self._compactar(galeria)
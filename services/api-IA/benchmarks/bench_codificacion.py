@@ -0,0 +1,76 @@
+"""
+Comparacion del formato compacto de encodings contra base64(pickle)
+Uso (desde services/api-IA):
+    python -m benchmarks.bench_codificacion --cantidad 5000
+"""
+
+import argparse
+import base64
+import json
+import pickle
+import time
+import numpy as np
+
+from codificacion import FORMATOS, codificar_encoding, decodificar_encodings
+from benchmarks.sintetico import galeria_sintetica
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cantidad', type=int, default=5000)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--json', help='Archivo donde guardar el reporte')
+    args = parser.parse_args()
+
+    _, encodings, _ = galeria_sintetica(args.cantidad, por_usuario=1)
+    # face_recognition entrega float64
+    encodings = encodings.astype(np.float64)
+
+    antiguos = [base64.b64encode(pickle.dumps(e)).decode('utf-8') for e in encodings]
+    tiempo_antiguo = medir(
+        lambda: [pickle.loads(base64.b64decode(t)) for t in antiguos], args.repeticiones
+    )
+    reporte = {
+        'cantidad': args.cantidad,
+        'pickle': {
+            'bytes_base64': len(antiguos[0]),
+            'decodificacion_ms': round(tiempo_antiguo * 1000, 2)
+        }
+    }
+
+    for formato in FORMATOS:
+        textos = [codificar_encoding(e, formato) for e in encodings]
+        tiempo = medir(lambda: decodificar_encodings(textos), args.repeticiones)
+        matriz, _ = decodificar_encodings(textos)
+        reporte[formato] = {
+            'bytes_base64': len(textos[0]),
+            'ahorro_tamano': round(1 - len(textos[0]) / len(antiguos[0]), 3),
+            'decodificacion_ms': round(tiempo * 1000, 2),
+            'aceleracion': round(tiempo_antiguo / tiempo, 1),
+            'error_max_componente': float(np.abs(matriz - encodings).max())
+        }
+
+    print(f"{'formato':>8} {'bytes':>7} {'ahorro':>8} {'decod. ms':>10} {'aceleracion':>12} {'error max':>10}")
+    print(f"{'pickle':>8} {reporte['pickle']['bytes_base64']:>7} {'-':>8} "
+          f"{reporte['pickle']['decodificacion_ms']:>10} {'-':>12} {'-':>10}")
+    for formato in FORMATOS:
+        r = reporte[formato]
+        print(f"{formato:>8} {r['bytes_base64']:>7} {r['ahorro_tamano']:>8} {r['decodificacion_ms']:>10} "
+              f"{r['aceleracion']:>12} {r['error_max_componente']:>10.2e}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reporte, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
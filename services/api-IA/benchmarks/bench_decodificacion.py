@@ -0,0 +1,63 @@
+"""
+Decodificacion completa + resize vs decodificacion reducida (IMREAD_REDUCED_*) a RGB
+Uso (desde services/api-IA):
+    python -m benchmarks.bench_decodificacion --escala 0.25 --repeticiones 100
+"""
+
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+
+from benchmarks.bench_subida import imagen_sintetica
+from imagenes import decodificar_imagen, decodificar_imagen_rgb
+
+RESOLUCIONES = [(320, 240), (640, 480), (1280, 720), (1920, 1080)]
+
+
+def completa(jpeg, escala):
+    """Camino anterior: frame BGR completo, resize y conversion aparte."""
+    frame = decodificar_imagen(jpeg)
+    if escala != 1.0:
+        frame = cv2.resize(frame, (0, 0), fx=escala, fy=escala)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def reducida(jpeg, escala):
+    return decodificar_imagen_rgb(jpeg, lambda alto, ancho: escala)[0]
+
+
+def medir(funcion, jpeg, escala, repeticiones):
+    funcion(jpeg, escala)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(jpeg, escala)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return round(float(np.percentile(tiempos, 50)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--escala', type=float, default=0.25)
+    parser.add_argument('--repeticiones', type=int, default=100)
+    parser.add_argument('--json', help='Archivo donde guardar el reporte')
+    args = parser.parse_args()
+
+    reporte = []
+    print(f"{'resolucion':>10} {'completa ms':>12} {'reducida ms':>12} {'aceleracion':>11}")
+    for ancho, alto in RESOLUCIONES:
+        jpeg = imagen_sintetica(ancho, alto)
+        t_completa = medir(completa, jpeg, args.escala, args.repeticiones)
+        t_reducida = medir(reducida, jpeg, args.escala, args.repeticiones)
+        reporte.append({'resolucion': f'{ancho}x{alto}', 'completa_ms': t_completa, 'reducida_ms': t_reducida})
+        print(f"{reporte[-1]['resolucion']:>10} {t_completa:>12.3f} {t_reducida:>12.3f} {t_completa / t_reducida:>10.2f}x")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'escala': args.escala, 'resultados': reporte}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Latencia y tasa de deteccion por resolucion: escala fija 0.25 vs escala adaptativa
+Cada foto (con un rostro) se pega en un frame de la resolucion indicada ocupando
+--ocupacion de su alto, simulando personas a distinta distancia de la camara.
+Uso (desde services/api-IA):
+    python -m benchmarks.bench_escalas --imagenes 'fotos/*.jpg' --detector hog
+"""
+
+import argparse
+import glob
+import json
+import time
+import cv2
+import numpy as np
+
+from detectores import obtener_detector, reducir_a_rgb
+
+RESOLUCIONES = [(320, 240), (640, 480), (1280, 720), (1920, 1080)]
+
+
+def componer_frame(foto, ancho, alto, ocupacion):
+    """Fondo gris de ancho x alto con la foto centrada ocupando `ocupacion` del alto."""
+    frame = np.full((alto, ancho, 3), 110, dtype=np.uint8)
+    escala = min(ocupacion * alto / foto.shape[0], ancho / foto.shape[1])
+    reducida = cv2.resize(foto, (0, 0), fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+    h, w = reducida.shape[:2]
+    y, x = (alto - h) // 2, (ancho - w) // 2
+    frame[y:y + h, x:x + w] = reducida
+    return frame
+
+
+def medir(detector, frames, escala_de):
+    """Retorna (ms por frame, tasa de frames con al menos un rostro)."""
+    tiempos = []
+    encontrados = 0
+    for frame in frames:
+        inicio = time.perf_counter()
+        rgb = reducir_a_rgb(frame, escala_de(frame))
+        encontrados += bool(detector.detectar(rgb))
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos = np.array(tiempos)
+    return {
+        'p50_ms': round(float(np.percentile(tiempos, 50)), 2),
+        'p95_ms': round(float(np.percentile(tiempos, 95)), 2),
+        'tasa_deteccion': round(encontrados / len(frames), 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--imagenes', required=True, help='Patron glob de fotos con un rostro')
+    parser.add_argument('--detector', default='hog')
+    parser.add_argument('--fraccion', type=float, default=0.15, help='Fraccion de rostro minima (escala adaptativa)')
+    parser.add_argument('--ocupacion', type=float, nargs='+', default=[0.9, 0.5, 0.3])
+    parser.add_argument('--json', help='Archivo donde guardar el reporte')
+    args = parser.parse_args()
+
+    fotos = [cv2.imread(ruta) for ruta in sorted(glob.glob(args.imagenes))]
+    fotos = [foto for foto in fotos if foto is not None]
+    if not fotos:
+        parser.error('No se encontraron imagenes')
+
+    detector = obtener_detector(args.detector)
+    modos = {
+        'fija_0.25': lambda frame: 0.25,
+        'adaptativa': lambda frame: detector.escala_para(frame.shape[0], frame.shape[1], args.fraccion),
+    }
+
+    reporte = []
+    print(f"{'resolucion':>10} {'ocup':>5} {'modo':>11} {'escala':>6} {'p50 ms':>8} {'p95 ms':>8} {'deteccion':>9}")
+    for ancho, alto in RESOLUCIONES:
+        for ocupacion in args.ocupacion:
+            frames = [componer_frame(foto, ancho, alto, ocupacion) for foto in fotos]
+            for modo, escala_de in modos.items():
+                resultado = medir(detector, frames, escala_de)
+                resultado.update({
+                    'resolucion': f'{ancho}x{alto}', 'ocupacion': ocupacion,
+                    'modo': modo, 'escala': round(escala_de(frames[0]), 3)
+                })
+                reporte.append(resultado)
+                print(f"{resultado['resolucion']:>10} {ocupacion:>5.2f} {modo:>11} {resultado['escala']:>6.2f} "
+                      f"{resultado['p50_ms']:>8.2f} {resultado['p95_ms']:>8.2f} {resultado['tasa_deteccion']:>9.3f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'detector': args.detector, 'fotos': len(fotos), 'resultados': reporte}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
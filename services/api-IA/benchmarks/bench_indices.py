@@ -0,0 +1,132 @@
+"""
+Reporte de recall vs latencia de los indices de la galeria (centroides e IVF contra busqueda exacta)
+Los centroides tambien se miden con rostros desconocidos, su peor caso
+Uso (desde services/api-IA):
+    python -m benchmarks.bench_indices --usuarios 30000 --por-usuario 4 --sondeos 1,4,8,16,32
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+
+from galeria import GaleriaRostros
+from indices import IndiceCentroides, IndiceExacto, IndiceIVF
+from benchmarks.sintetico import consultas_desconocidas, consultas_sinteticas, galeria_sintetica
+
+
+def medir_busquedas(galeria, consultas, k):
+    """Busca cada consulta por separado (como en produccion) y mide latencias."""
+    latencias = []
+    ids = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resultado, _ = galeria.buscar(consulta[None, :], k=k)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        ids.append(resultado[0])
+    return np.array(ids, dtype=object), np.array(latencias)
+
+
+def resumen_latencias(latencias):
+    return {
+        'p50_ms': round(float(np.percentile(latencias, 50)), 4),
+        'p95_ms': round(float(np.percentile(latencias, 95)), 4),
+        'p99_ms': round(float(np.percentile(latencias, 99)), 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--usuarios', type=int, default=30000)
+    parser.add_argument('--por-usuario', type=int, default=4)
+    parser.add_argument('--consultas', type=int, default=500)
+    parser.add_argument('--k', type=int, default=1)
+    parser.add_argument('--listas', type=int, default=0, help='0 = 4*sqrt(N)')
+    parser.add_argument('--sondeos', default='1,4,8,16,32')
+    parser.add_argument('--cota', type=float, default=0.6, help='Umbral de reconocimiento para centroides')
+    parser.add_argument('--json', help='Archivo donde guardar el reporte')
+    args = parser.parse_args()
+
+    ids, encodings, centros = galeria_sintetica(args.usuarios, args.por_usuario)
+    consultas, _ = consultas_sinteticas(centros, args.consultas)
+    desconocidas = consultas_desconocidas(args.consultas)
+
+    exacta = GaleriaRostros(indice=IndiceExacto())
+    exacta.cargar(ids, encodings)
+    ids_exactos, latencias_exactas = medir_busquedas(exacta, consultas, args.k)
+    ids_exactos_desconocidas, latencias_exactas_desconocidas = medir_busquedas(exacta, desconocidas, args.k)
+
+    reporte = {
+        'encodings': len(ids),
+        'usuarios': args.usuarios,
+        'consultas': args.consultas,
+        'k': args.k,
+        'exacto': resumen_latencias(latencias_exactas),
+        'exacto_desconocidos': resumen_latencias(latencias_exactas_desconocidas),
+        'ivf': []
+    }
+
+    indice = IndiceIVF(listas=args.listas, min_entrenamiento=0)
+    galeria = GaleriaRostros(indice=indice)
+    inicio = time.perf_counter()
+    galeria.cargar(ids, encodings)
+    tiempo_construccion = time.perf_counter() - inicio
+    reporte['ivf_construccion_s'] = round(tiempo_construccion, 3)
+
+    centroides = IndiceCentroides(cota=args.cota)
+    galeria_centroides = GaleriaRostros(indice=centroides)
+    galeria_centroides.cargar(ids, encodings)
+    ids_centroides, latencias = medir_busquedas(galeria_centroides, consultas, args.k)
+    reporte['centroides'] = {
+        f'recall@{args.k}': round(float(np.mean([
+            len(set(a) & set(b)) / args.k for a, b in zip(ids_exactos, ids_centroides)
+        ])), 4),
+        'filas_por_consulta': round(centroides.filas_revisadas / args.consultas, 1),
+        **resumen_latencias(latencias)
+    }
+    filas_antes = centroides.filas_revisadas
+    ids_desconocidas, latencias = medir_busquedas(galeria_centroides, desconocidas, args.k)
+    distancias_exactas = exacta.buscar(desconocidas, k=1)[1][:, 0]
+    bajo_cota = distancias_exactas < args.cota
+    reporte['centroides_desconocidos'] = {
+        # Bajo la cota el resultado debe ser el exacto; sobre ella no se reconoce a nadie
+        'iguales_bajo_cota': bool((ids_desconocidas[bajo_cota, 0] == ids_exactos_desconocidas[bajo_cota, 0]).all()),
+        'filas_por_consulta': round((centroides.filas_revisadas - filas_antes) / args.consultas, 1),
+        'busquedas_exactas': centroides.busquedas_exactas,
+        **resumen_latencias(latencias)
+    }
+    reporte['ivf_listas'] = galeria.estadisticas_indice()['listas']
+
+    for sondeos in [int(s) for s in args.sondeos.split(',')]:
+        indice.sondeos = sondeos
+        ids_ivf, latencias = medir_busquedas(galeria, consultas, args.k)
+        recall = float(np.mean([
+            len(set(a) & set(b)) / args.k for a, b in zip(ids_exactos, ids_ivf)
+        ]))
+        fila = {'sondeos': sondeos, f'recall@{args.k}': round(recall, 4)}
+        fila.update(resumen_latencias(latencias))
+        fila['aceleracion_p50'] = round(reporte['exacto']['p50_ms'] / max(fila['p50_ms'], 1e-9), 2)
+        reporte['ivf'].append(fila)
+
+    print(f"Galeria: {reporte['encodings']} encodings, {args.usuarios} usuarios, "
+          f"{reporte['ivf_listas']} listas IVF (construccion {tiempo_construccion:.2f}s)")
+    print(f"Exacto: p50={reporte['exacto']['p50_ms']}ms p95={reporte['exacto']['p95_ms']}ms")
+    c = reporte['centroides']
+    print(f"Centroides: recall={c[f'recall@{args.k}']} p50={c['p50_ms']}ms p95={c['p95_ms']}ms "
+          f"filas revisadas por consulta={c['filas_por_consulta']}")
+    c = reporte['centroides_desconocidos']
+    print(f"Desconocidos: exacto p50={reporte['exacto_desconocidos']['p50_ms']}ms, centroides "
+          f"p50={c['p50_ms']}ms p95={c['p95_ms']}ms filas revisadas por consulta={c['filas_por_consulta']} "
+          f"(pasada exacta en {c['busquedas_exactas']})")
+    print(f"{'sondeos':>8} {'recall':>8} {'p50 ms':>10} {'p95 ms':>10} {'aceleracion':>12}")
+    for fila in reporte['ivf']:
+        print(f"{fila['sondeos']:>8} {fila[f'recall@{args.k}']:>8} {fila['p50_ms']:>10} "
+              f"{fila['p95_ms']:>10} {fila['aceleracion_p50']:>12}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reporte, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+"""
+Benchmark del pipeline de reconocimiento completo con galerias sinteticas
+Mide latencia por etapa (decodificar, redimensionar, detectar, codificar,
+emparejar, llamada al backend), /recognize por el cliente de pruebas de Flask
+a varios niveles de concurrencia y el pico de RSS. El reporte JSON incluye el
+commit para comparar entre versiones.
+
+Uso (desde services/api-IA):
+    python -m benchmarks.bench_pipeline --imagenes 'fotos/*.jpg' --tamanos 1000 10000 200000 \\
+        --json antes.json
+    python -m benchmarks.bench_pipeline --imagenes 'fotos/*.jpg' --json despues.json --comparar antes.json
+
+Sin --imagenes se usa un corpus sintetico determinista (benchmarks/corpus.py):
+escenas de 1280x720 con un rostro dibujado, los mismos bytes para la misma
+--semilla. El reporte guarda la huella SHA-256 del corpus y --comparar avisa
+si los dos reportes no midieron las mismas imagenes; para numeros
+representativos de produccion conviene un corpus de fotos reales.
+
+El corpus debe tener rostros que el detector de produccion encuentre: si no
+encuentra ninguno el benchmark termina con error (--sin-rostros lo permite,
+por ejemplo para medir solo la decodificacion). Cada hilo de la medicion de
+concurrencia envia su propio X-Terminal-Id, como un kiosko distinto.
+
+El servicio se importa en un directorio temporal (no toca la galeria ni la
+cola de marcajes reales) con la cache de resultados desactivada y el backend
+apuntando a un servidor local que responde 201. La configuracion del servicio
+(DETECTOR_RECONOCIMIENTO, INDICE_GALERIA, TRABAJADORES, PLANIFICADOR_VENTANA_MS,
+...) se toma de las variables de entorno como en produccion.
+"""
+
+import argparse
+import base64
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import face_recognition
+
+from benchmarks.bench_indices import resumen_latencias
+from benchmarks.corpus import huella_corpus, rostros_sinteticos
+from benchmarks.sintetico import consultas_sinteticas, galeria_sintetica
+from detectores import obtener_detector, reducir_a_rgb
+from imagenes import decodificar_imagen_rgb, imagen_base64_a_array, imagen_bytes_a_array
+
+
+class _BackendFalso(BaseHTTPRequestHandler):
+    """Responde 201 a cualquier POST, como el backend al registrar un marcaje."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        cuerpo = b'{"success": true, "data": {}}'
+        self.send_response(201)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def medir(funcion, argumentos, repeticiones):
+    """Llama a `funcion` ciclando los argumentos y retorna las latencias en ms."""
+    funcion(argumentos[0])
+    latencias = []
+    for i in range(repeticiones):
+        argumento = argumentos[i % len(argumentos)]
+        inicio = time.perf_counter()
+        funcion(argumento)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return np.array(latencias)
+
+
+def resumen(latencias):
+    return dict(resumen_latencias(latencias), media_ms=round(float(latencias.mean()), 4), muestras=len(latencias))
+
+
+def medir_concurrencia(app, cuerpos, hilos, peticiones):
+    """
+    POST /recognize con `hilos` clientes concurrentes; throughput y latencias.
+    Cada hilo es una terminal distinta (X-Terminal-Id), como los kioscos en
+    produccion: el control de admision reparte los lugares por terminal.
+    Las rechazadas por admision (503) se cuentan aparte de los errores.
+    """
+    def cliente(hilo):
+        prueba = app.test_client()
+        cabeceras = {'X-Terminal-Id': f'bench-{hilo}'}
+        latencias, errores, rechazadas = [], 0, 0
+        for i in range(hilo, peticiones, hilos):
+            inicio = time.perf_counter()
+            respuesta = prueba.post('/recognize', data=cuerpos[i % len(cuerpos)],
+                                    content_type='image/jpeg', headers=cabeceras)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            if respuesta.status_code == 503:
+                rechazadas += 1
+            elif respuesta.status_code != 200:
+                errores += 1
+        return latencias, errores, rechazadas
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(hilos) as ejecutor:
+        resultados = list(ejecutor.map(cliente, range(hilos)))
+    segundos = time.perf_counter() - inicio
+    latencias = np.array([l for parcial, _, _ in resultados for l in parcial])
+    return dict(
+        resumen_latencias(latencias),
+        hilos=hilos,
+        peticiones_por_segundo=round(peticiones / segundos, 2),
+        errores=sum(errores for _, errores, _ in resultados),
+        rechazadas=sum(rechazadas for _, _, rechazadas in resultados)
+    )
+
+
+def rss_pico_mb():
+    """Pico de memoria residente del proceso (ru_maxrss esta en KB en Linux y en bytes en macOS)."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def escala_de_produccion(reconocimiento):
+    """Detector y funcion de escala que usa /recognize."""
+    detector = obtener_detector(reconocimiento.DETECTOR_RECONOCIMIENTO)
+    fraccion = reconocimiento.FRACCION_ROSTRO_RECONOCIMIENTO
+
+    def escala_de(alto, ancho):
+        return detector.escala_para(alto, ancho, fraccion)
+    return detector, escala_de
+
+
+def imagenes_con_rostros(reconocimiento, jpegs):
+    """Cantidad de imagenes del corpus en que el detector de produccion encuentra un rostro."""
+    detector, escala_de = escala_de_produccion(reconocimiento)
+    return sum(bool(detector.detectar(decodificar_imagen_rgb(j, escala_de)[0])) for j in jpegs)
+
+
+def medir_etapas(reconocimiento, jpegs, repeticiones):
+    """Latencia de cada etapa por separado, con el detector y la escala de produccion."""
+    detector, escala_de = escala_de_produccion(reconocimiento)
+
+    data_urls = ['data:image/jpeg;base64,' + base64.b64encode(j).decode('ascii') for j in jpegs]
+    frames = [imagen_bytes_a_array(j) for j in jpegs]
+    reducidos = [reducir_a_rgb(f, escala_de(*f.shape[:2])) for f in frames]
+
+    etapas = {
+        'decodificar_base64': resumen(medir(imagen_base64_a_array, data_urls, repeticiones)),
+        'decodificar': resumen(medir(imagen_bytes_a_array, jpegs, repeticiones)),
+        'redimensionar': resumen(medir(lambda f: reducir_a_rgb(f, escala_de(*f.shape[:2])), frames, repeticiones)),
+        'decodificar_reducida': resumen(medir(lambda j: decodificar_imagen_rgb(j, escala_de), jpegs, repeticiones)),
+        'detectar': resumen(medir(detector.detectar, reducidos, repeticiones)),
+    }
+
+    con_rostros = [(rgb, ubicaciones) for rgb in reducidos for ubicaciones in [detector.detectar(rgb)] if ubicaciones]
+    if con_rostros:
+        etapas['codificar'] = resumen(medir(lambda par: face_recognition.face_encodings(*par), con_rostros, repeticiones))
+    else:
+        etapas['codificar'] = {'omitida': 'el corpus no tiene rostros detectables'}
+
+    etapas['marcaje_backend'] = resumen(medir(
+        lambda _: reconocimiento.registrar_marcaje_backend('0' * 24, 0.9), [None], repeticiones
+    ))
+    return etapas
+
+
+def comparar(base, actual):
+    """Imprime la variacion del p50 respecto de un reporte anterior."""
+    print(f"\nComparacion con {base['metadatos'].get('commit')} -> {actual['metadatos'].get('commit')}")
+    huella_antes = base['metadatos'].get('corpus', {}).get('huella')
+    if huella_antes != actual['metadatos']['corpus']['huella']:
+        print(f"AVISO: los reportes midieron corpus distintos ({huella_antes} vs "
+              f"{actual['metadatos']['corpus']['huella']}); las etapas no son comparables")
+    print(f"{'medicion':>40} {'p50 antes':>10} {'p50 ahora':>10} {'cambio':>8}")
+
+    def fila(nombre, antes, ahora):
+        if 'p50_ms' in antes and 'p50_ms' in ahora and antes['p50_ms'] > 0:
+            cambio = ahora['p50_ms'] / antes['p50_ms'] - 1
+            print(f"{nombre:>40} {antes['p50_ms']:>10.3f} {ahora['p50_ms']:>10.3f} {cambio:>+8.1%}")
+
+    for etapa, valores in actual['etapas'].items():
+        fila(etapa, base['etapas'].get(etapa, {}), valores)
+    anteriores = {g['encodings']: g for g in base['galerias']}
+    for galeria in actual['galerias']:
+        anterior = anteriores.get(galeria['encodings'])
+        if anterior is None:
+            continue
+        for medicion in ('emparejar', 'procesar_frame', 'endpoint_recognize'):
+            fila(f"{medicion}@{galeria['encodings']}", anterior.get(medicion, {}), galeria[medicion])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--imagenes', help='Patron glob del corpus de fotos con rostros '
+                                           '(por defecto un corpus sintetico determinista)')
+    parser.add_argument('--corpus', type=int, default=8, help='Imagenes del corpus sintetico')
+    parser.add_argument('--semilla', type=int, default=0, help='Semilla del corpus sintetico')
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[1000, 10000, 50000, 200000],
+                        help='Encodings en la galeria sintetica')
+    parser.add_argument('--por-usuario', type=int, default=4)
+    parser.add_argument('--repeticiones', type=int, default=50, help='Muestras por etapa')
+    parser.add_argument('--concurrencia', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--peticiones', type=int, default=64, help='Peticiones por nivel de concurrencia')
+    parser.add_argument('--json', help='Archivo donde guardar el reporte')
+    parser.add_argument('--comparar', help='Reporte JSON anterior contra el que comparar')
+    parser.add_argument('--sin-rostros', action='store_true',
+                        help='Aceptar un corpus sin rostros detectables (solo mide decodificacion y deteccion vacia)')
+    args = parser.parse_args()
+
+    if args.imagenes:
+        jpegs = []
+        for ruta in sorted(glob.glob(args.imagenes)):
+            with open(ruta, 'rb') as f:
+                jpegs.append(f.read())
+        if not jpegs:
+            parser.error(f"No hay imagenes que coincidan con {args.imagenes}")
+        origen = args.imagenes
+    else:
+        jpegs = rostros_sinteticos(args.corpus, args.semilla)
+        origen = f"sintetico (semilla {args.semilla})"
+    ruta_json = os.path.abspath(args.json) if args.json else None
+    ruta_comparar = os.path.abspath(args.comparar) if args.comparar else None
+    commit = commit_actual()
+
+    # El servicio crea sus archivos (galeria, cola de marcajes) en el directorio actual
+    os.chdir(tempfile.mkdtemp(prefix='bench-pipeline-'))
+    os.environ['RESULTADOS_CACHE_TTL_SEGUNDOS'] = '0'
+    os.environ['MARCAJES_ASINCRONOS'] = 'false'
+    os.environ.setdefault('LOG_NIVEL', 'WARNING')
+    backend = ThreadingHTTPServer(('127.0.0.1', 0), _BackendFalso)
+    os.environ['BACKEND_URL'] = f"http://127.0.0.1:{backend.server_address[1]}"
+
+    # Importar despues de fijar el entorno: la configuracion se lee al importar
+    import reconocimiento
+    # El pool hace fork: antes de iniciar cualquier hilo. Sin sincronizacion
+    # periodica, para que la galeria solo cambie cuando el benchmark lo decide
+    reconocimiento.iniciar_servicio(segundo_plano=False)
+    threading.Thread(target=backend.serve_forever, daemon=True).start()
+
+    # Sin rostros /recognize nunca codifica, empareja ni marca: los numeros no
+    # dirian nada del pipeline real
+    con_rostros = imagenes_con_rostros(reconocimiento, jpegs)
+    if not con_rostros and not args.sin_rostros:
+        reconocimiento.detener_servicio()
+        backend.shutdown()
+        parser.error(f"El detector {reconocimiento.DETECTOR_RECONOCIMIENTO} no encuentra rostros en ninguna de "
+                     f"las {len(jpegs)} imagenes del corpus ({origen}); use --imagenes con fotos de rostros "
+                     f"o --sin-rostros para medir igual")
+
+    reporte = {
+        'metadatos': {
+            'commit': commit,
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'detector': reconocimiento.DETECTOR_RECONOCIMIENTO,
+            'indice': os.environ.get('INDICE_GALERIA', 'auto'),
+            'trabajadores': os.environ.get('TRABAJADORES', '0'),
+            'planificador_ventana_ms': os.environ.get('PLANIFICADOR_VENTANA_MS', '0'),
+            'corpus': {'origen': origen, 'huella': huella_corpus(jpegs), 'imagenes': len(jpegs),
+                       'con_rostros': con_rostros}
+        },
+        'galerias': []
+    }
+
+    print(f"Corpus {origen}: {len(jpegs)} imagenes, {con_rostros} con rostros; midiendo etapas...", flush=True)
+    reporte['etapas'] = medir_etapas(reconocimiento, jpegs, args.repeticiones)
+    for etapa, valores in reporte['etapas'].items():
+        if 'p50_ms' in valores:
+            print(f"{etapa:>22} p50 {valores['p50_ms']:>9.3f} ms  p99 {valores['p99_ms']:>9.3f} ms")
+
+    for tamano in args.tamanos:
+        ids, encodings, centros = galeria_sintetica(max(1, tamano // args.por_usuario), args.por_usuario)
+        inicio = time.perf_counter()
+        nueva = reconocimiento.galeria.vacia()
+        nueva.cargar(ids, encodings)
+        reconocimiento.publicar_galeria(nueva)
+        carga = time.perf_counter() - inicio
+        del ids, encodings
+
+        consultas, _ = consultas_sinteticas(centros, args.repeticiones)
+        app = reconocimiento.app
+        resultado = {
+            'encodings': len(nueva),
+            'usuarios': nueva.total_usuarios(),
+            'carga_s': round(carga, 3),
+            'emparejar': resumen(medir(lambda c: reconocimiento.emparejar_encodings(c[None, :]),
+                                       list(consultas), args.repeticiones)),
+            'procesar_frame': resumen(medir(reconocimiento.procesar_frame_reconocimiento, jpegs, args.repeticiones)),
+            'endpoint_recognize': resumen(medir(
+                lambda j: app.test_client().post('/recognize', data=j, content_type='image/jpeg'),
+                jpegs, args.repeticiones
+            )),
+            'concurrencia': [medir_concurrencia(app, jpegs, hilos, args.peticiones) for hilos in args.concurrencia],
+            'rss_pico_mb': rss_pico_mb()
+        }
+        reporte['galerias'].append(resultado)
+
+        print(f"\nGaleria de {resultado['encodings']} encodings (carga {resultado['carga_s']}s, "
+              f"RSS pico {resultado['rss_pico_mb']} MB)")
+        for medicion in ('emparejar', 'procesar_frame', 'endpoint_recognize'):
+            print(f"{medicion:>22} p50 {resultado[medicion]['p50_ms']:>9.3f} ms  p99 {resultado[medicion]['p99_ms']:>9.3f} ms")
+        for nivel in resultado['concurrencia']:
+            print(f"{nivel['hilos']:>15} hilos {nivel['peticiones_por_segundo']:>9.2f} pet/s  "
+                  f"p95 {nivel['p95_ms']:>9.3f} ms  errores {nivel['errores']}  rechazadas {nivel['rechazadas']}")
+        sys.stdout.flush()
+
+    reconocimiento.detener_servicio()
+    backend.shutdown()
+
+    if ruta_json:
+        with open(ruta_json, 'w') as f:
+            json.dump(reporte, f, indent=2)
+    if ruta_comparar:
+        with open(ruta_comparar) as f:
+            comparar(json.load(f), reporte)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+CPU por peticion al recibir imagenes como JSON base64, multipart o image/jpeg crudo
+Uso (desde services/api-IA):
+    python -m benchmarks.bench_subida --imagen foto.jpg --peticiones 300
+"""
+
+import argparse
+import base64
+import json
+import time
+import cv2
+import numpy as np
+from flask import Flask, jsonify
+
+from imagenes import decodificar_imagen, obtener_imagenes_request
+
+
+def imagen_sintetica(ancho=640, alto=480, calidad=70):
+    """JPEG de prueba con degradados y formas (comprime como una foto real)."""
+    y, x = np.mgrid[0:alto, 0:ancho]
+    frame = np.dstack([(x * 255 // ancho), (y * 255 // alto), ((x + y) * 127 // (ancho + alto))]).astype(np.uint8)
+    cv2.circle(frame, (ancho // 2, alto // 2), alto // 4, (200, 170, 150), -1)
+    cv2.rectangle(frame, (ancho // 8, alto // 8), (ancho // 3, alto // 2), (40, 80, 160), -1)
+    _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, calidad])
+    return jpeg.tobytes()
+
+
+def cuerpo_multipart(jpeg, limite='----limite-bench'):
+    """Cuerpo multipart armado una sola vez, para no medir la codificacion del cliente."""
+    cuerpo = (
+        f'--{limite}\r\n'
+        'Content-Disposition: form-data; name="image"; filename="frame.jpg"\r\n'
+        'Content-Type: image/jpeg\r\n\r\n'
+    ).encode('ascii') + jpeg + f'\r\n--{limite}--\r\n'.encode('ascii')
+    return cuerpo, f'multipart/form-data; boundary={limite}'
+
+
+def crear_app():
+    app = Flask(__name__)
+
+    @app.route('/decodificar', methods=['POST'])
+    def decodificar():
+        imagenes, _ = obtener_imagenes_request()
+        frame = decodificar_imagen(imagenes[0])
+        return jsonify({'alto': frame.shape[0], 'ancho': frame.shape[1]})
+
+    return app
+
+
+def medir(cliente, preparar, peticiones):
+    """Retorna (CPU ms por peticion, bytes en el cable)."""
+    tamano = len(preparar()['data'])
+    cliente.post('/decodificar', **preparar())
+    inicio = time.process_time()
+    for _ in range(peticiones):
+        respuesta = cliente.post('/decodificar', **preparar())
+        assert respuesta.status_code == 200
+    return (time.process_time() - inicio) * 1000 / peticiones, tamano
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--imagen', help='JPEG a usar (por defecto uno sintetico de 640x480)')
+    parser.add_argument('--peticiones', type=int, default=300)
+    parser.add_argument('--json', help='Archivo donde guardar el reporte')
+    args = parser.parse_args()
+
+    if args.imagen:
+        with open(args.imagen, 'rb') as f:
+            jpeg = f.read()
+    else:
+        jpeg = imagen_sintetica()
+    data_url = 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii')
+    cuerpo_json = json.dumps({'image': data_url})
+    multipart, tipo_multipart = cuerpo_multipart(jpeg)
+
+    cliente = crear_app().test_client()
+    modos = {
+        'json_base64': lambda: {'data': cuerpo_json, 'content_type': 'application/json'},
+        'multipart': lambda: {'data': multipart, 'content_type': tipo_multipart},
+        'image_jpeg': lambda: {'data': jpeg, 'content_type': 'image/jpeg'},
+    }
+
+    reporte = {'jpeg_bytes': len(jpeg), 'peticiones': args.peticiones, 'modos': {}}
+    for nombre, preparar in modos.items():
+        cpu_ms, tamano = medir(cliente, preparar, args.peticiones)
+        reporte['modos'][nombre] = {'cpu_ms_por_peticion': round(cpu_ms, 3), 'bytes_cuerpo': tamano}
+
+    base = reporte['modos']['json_base64']['cpu_ms_por_peticion']
+    print(f"JPEG: {len(jpeg)} bytes")
+    print(f"{'modo':>12} {'CPU ms/pet':>11} {'ahorro':>8} {'bytes cuerpo':>13}")
+    for nombre, r in reporte['modos'].items():
+        r['ahorro_cpu'] = round(1 - r['cpu_ms_por_peticion'] / base, 3)
+        print(f"{nombre:>12} {r['cpu_ms_por_peticion']:>11} {r['ahorro_cpu']:>8} {r['bytes_cuerpo']:>13}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reporte, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Throughput de deteccion + encoding con hilos (TRABAJADORES=0) vs pool de procesos
+Uso (desde services/api-IA):
+    python -m benchmarks.bench_trabajadores --imagenes 'fotos/*.jpg' --trabajadores 0 1 2 4
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_subida import imagen_sintetica
+from trabajadores import PoolTrabajadores, detectar_y_codificar
+
+
+def medir(detectar, imagenes, concurrencia):
+    """Retorna imagenes por segundo procesando `imagenes` con `concurrencia` hilos."""
+    detectar(imagenes[0])
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(concurrencia) as ejecutor:
+        list(ejecutor.map(detectar, imagenes))
+    return len(imagenes) / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--imagenes', help='Patron glob de fotos (por defecto JPEG sinteticos de 1280x720)')
+    parser.add_argument('--cantidad', type=int, default=64, help='Imagenes por medicion')
+    parser.add_argument('--trabajadores', type=int, nargs='+', default=[0, 1, 2, os.cpu_count()])
+    parser.add_argument('--detector', default='hog')
+    parser.add_argument('--fraccion', type=float, default=0.15)
+    parser.add_argument('--json', help='Archivo donde guardar el reporte')
+    args = parser.parse_args()
+
+    if args.imagenes:
+        fotos = []
+        for ruta in sorted(glob.glob(args.imagenes)):
+            with open(ruta, 'rb') as f:
+                fotos.append(f.read())
+    else:
+        fotos = [imagen_sintetica(1280, 720)]
+    imagenes = [fotos[i % len(fotos)] for i in range(args.cantidad)]
+
+    reporte = []
+    print(f"{'trabajadores':>12} {'img/s':>8}")
+    for trabajadores in args.trabajadores:
+        if trabajadores == 0:
+            # Hilos en el mismo proceso, como app.run(threaded=True)
+            def detectar(imagen):
+                return detectar_y_codificar(imagen, args.detector, args.fraccion)
+            concurrencia = os.cpu_count()
+            pool = None
+        else:
+            pool = PoolTrabajadores(trabajadores, args.detector, max_pendientes=trabajadores * 2, espera=60)
+            pool.iniciar()
+
+            def detectar(imagen, pool=pool):
+                return pool.detectar(imagen, args.fraccion)
+            concurrencia = trabajadores * 2
+
+        por_segundo = medir(detectar, imagenes, concurrencia)
+        if pool is not None:
+            pool.cerrar()
+        reporte.append({'trabajadores': trabajadores, 'imagenes_por_segundo': round(por_segundo, 2)})
+        print(f"{trabajadores:>12} {por_segundo:>8.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'detector': args.detector, 'cantidad': args.cantidad, 'resultados': reporte}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
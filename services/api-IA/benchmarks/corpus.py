@@ -0,0 +1,106 @@
+"""
+Corpus de rostros sintetico y determinista para benchmarks del pipeline
+Cada imagen es una escena de 1280x720 con un rostro frontal dibujado
+(ovalo sombreado, pelo, cejas, ojos, nariz, boca, cuello y hombros) con
+posicion, tamano, tono de piel e iluminacion que dependen solo de la semilla:
+dos corridas con la misma semilla producen los mismos bytes JPEG, y la huella
+del corpus queda en el reporte para comparar entre commits.
+"""
+
+import hashlib
+
+import cv2
+import numpy as np
+
+# Tonos de piel en BGR, de claro a oscuro
+TONOS_PIEL = np.array([
+    (180, 205, 235), (150, 185, 225), (120, 160, 205), (95, 130, 175), (70, 95, 135)
+], dtype=np.float32)
+
+
+def _elipse(lienzo, centro, ejes, color, angulos=(0, 360)):
+    centro = tuple(int(round(v)) for v in centro)
+    ejes = tuple(max(1, int(round(v))) for v in ejes)
+    cv2.ellipse(lienzo, centro, ejes, 0, angulos[0], angulos[1], tuple(float(c) for c in color), -1, cv2.LINE_AA)
+
+
+def _dibujar_rostro(lienzo, cx, cy, ancho_rostro, piel, pelo, rng):
+    """Rostro frontal de ancho `ancho_rostro` centrado en (cx, cy)."""
+    a = ancho_rostro / 2
+    b = ancho_rostro * 0.66
+    sombra = piel * 0.72
+
+    # Hombros y cuello por detras del rostro
+    _elipse(lienzo, (cx, cy + b * 2.3), (a * 2.6, b * 1.1), rng.uniform(30, 120, 3))
+    cv2.rectangle(lienzo, (int(cx - a * 0.45), int(cy + b * 0.6)), (int(cx + a * 0.45), int(cy + b * 1.45)),
+                  tuple(float(c) for c in sombra), -1)
+
+    # Pelo: un ovalo algo mayor y corrido hacia arriba, que el rostro tapa abajo
+    _elipse(lienzo, (cx, cy - b * 0.18), (a * 1.08, b * 0.98), pelo)
+    _elipse(lienzo, (cx - a, cy + b * 0.02), (a * 0.13, b * 0.17), sombra)
+    _elipse(lienzo, (cx + a, cy + b * 0.02), (a * 0.13, b * 0.17), sombra)
+    _elipse(lienzo, (cx, cy), (a, b), piel)
+    _elipse(lienzo, (cx, cy - b * 0.78), (a * 0.95, b * 0.3), pelo, (180, 360))
+
+    ojo_y = cy - b * 0.08
+    for lado in (-1, 1):
+        ojo_x = cx + lado * a * 0.4
+        # Cuenca, esclerotica, iris y pupila
+        _elipse(lienzo, (ojo_x, ojo_y), (a * 0.24, a * 0.13), sombra)
+        _elipse(lienzo, (ojo_x, ojo_y), (a * 0.17, a * 0.075), (225, 230, 235))
+        cv2.circle(lienzo, (int(ojo_x), int(ojo_y)), max(1, int(a * 0.07)), tuple(float(c) for c in pelo * 0.8 + 20),
+                   -1, cv2.LINE_AA)
+        cv2.circle(lienzo, (int(ojo_x), int(ojo_y)), max(1, int(a * 0.035)), (10, 10, 10), -1, cv2.LINE_AA)
+        # Ceja
+        cv2.ellipse(lienzo, (int(ojo_x), int(ojo_y - a * 0.06)), (int(a * 0.27), int(a * 0.17)), 0, 200, 340,
+                    tuple(float(c) for c in pelo), max(2, int(a * 0.07)), cv2.LINE_AA)
+
+    # Nariz: lados en sombra, punta y fosas
+    punta_y = cy + b * 0.3
+    for lado in (-1, 1):
+        cv2.line(lienzo, (int(cx + lado * a * 0.1), int(ojo_y + a * 0.1)), (int(cx + lado * a * 0.16), int(punta_y)),
+                 tuple(float(c) for c in sombra), max(1, int(a * 0.05)), cv2.LINE_AA)
+        _elipse(lienzo, (cx + lado * a * 0.1, punta_y + a * 0.04), (a * 0.06, a * 0.03), piel * 0.45)
+    _elipse(lienzo, (cx, punta_y - a * 0.02), (a * 0.1, a * 0.07), np.minimum(piel * 1.08, 255))
+
+    # Boca: labios y comisura
+    boca_y = cy + b * 0.55
+    _elipse(lienzo, (cx, boca_y), (a * 0.36, a * 0.1), (piel[0] * 0.55, piel[1] * 0.5, piel[2] * 0.85))
+    cv2.line(lienzo, (int(cx - a * 0.34), int(boca_y)), (int(cx + a * 0.34), int(boca_y)),
+             tuple(float(c) for c in piel * 0.3), max(1, int(a * 0.03)), cv2.LINE_AA)
+
+
+def rostro_sintetico(rng, ancho=1280, alto=720, calidad=90):
+    """Una escena con un rostro; los parametros salen de `rng`."""
+    y, x = np.mgrid[0:alto, 0:ancho].astype(np.float32)
+    fondo = rng.uniform(60, 200, 3).astype(np.float32)
+    degradado = 0.75 + 0.5 * (y / alto)[..., None]
+    lienzo = np.clip(fondo * degradado, 0, 255).astype(np.float32)
+
+    ancho_rostro = rng.uniform(0.16, 0.32) * alto
+    cx = rng.uniform(ancho_rostro, ancho - ancho_rostro)
+    cy = rng.uniform(ancho_rostro * 0.9, alto - ancho_rostro * 1.2)
+    piel = TONOS_PIEL[rng.integers(len(TONOS_PIEL))] * rng.uniform(0.9, 1.05)
+    pelo = rng.uniform(10, 70) * np.array([1.0, 1.1, 1.3], dtype=np.float32)
+    _dibujar_rostro(lienzo, cx, cy, ancho_rostro, piel, pelo, rng)
+
+    # Iluminacion lateral, desenfoque de lente y ruido de sensor
+    luz = 1 + rng.uniform(-0.2, 0.2) * ((x - cx) / ancho_rostro).clip(-1, 1)[..., None]
+    lienzo = cv2.GaussianBlur(lienzo * luz, (0, 0), max(0.8, ancho_rostro / 150))
+    lienzo += rng.normal(0, 4, lienzo.shape).astype(np.float32)
+    _, jpeg = cv2.imencode('.jpg', np.clip(lienzo, 0, 255).astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, calidad])
+    return jpeg.tobytes()
+
+
+def rostros_sinteticos(cantidad=8, semilla=0, ancho=1280, alto=720):
+    """`cantidad` JPEGs con un rostro cada uno, siempre los mismos para la misma semilla."""
+    rng = np.random.default_rng(semilla)
+    return [rostro_sintetico(rng, ancho, alto) for _ in range(cantidad)]
+
+
+def huella_corpus(jpegs):
+    """SHA-256 de los bytes del corpus, para saber si dos reportes midieron lo mismo."""
+    huella = hashlib.sha256()
+    for jpeg in jpegs:
+        huella.update(hashlib.sha256(jpeg).digest())
+    return huella.hexdigest()[:16]
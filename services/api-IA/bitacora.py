@@ -0,0 +1,179 @@
+"""
+Logging estructurado y asincrono del servicio
+Los hilos de las peticiones solo dejan el registro en una cola en memoria; un
+hilo aparte lo formatea (JSON por defecto) y lo escribe en stdout.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Nivel minimo (DEBUG, INFO, WARNING, ERROR)
+LOG_NIVEL = os.environ.get('LOG_NIVEL', 'INFO').upper()
+
+# 'json' (una linea JSON por registro) o 'texto' (legible, para desarrollo)
+LOG_FORMATO = os.environ.get('LOG_FORMATO', 'json').lower()
+
+# 1 de cada N registros por frame (reconocimientos, imagenes rechazadas)
+LOG_MUESTREO_FRAMES = int(os.environ.get('LOG_MUESTREO_FRAMES', '100'))
+
+_CAMPOS_ESTANDAR = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def campos(muestreo=None, **datos):
+    """
+    Argumento `extra` para un registro: `datos` van como campos del JSON.
+    Con `muestreo=N` solo se escribe 1 de cada N registros con el mismo
+    mensaje (para los que ocurren por frame); el que pasa lleva en
+    `omitidos` cuantos se descartaron desde el anterior.
+    """
+    extra = {'campos': datos}
+    if muestreo and muestreo > 1:
+        extra['muestreo'] = muestreo
+    return extra
+
+
+class FiltroMuestreo(logging.Filter):
+    """Deja pasar 1 de cada `muestreo` registros por (logger, mensaje sin formatear)."""
+
+    def __init__(self):
+        super().__init__()
+        self._conteos = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        muestreo = getattr(record, 'muestreo', None)
+        if not muestreo:
+            return True
+        clave = (record.name, record.msg)
+        with self._lock:
+            conteo = self._conteos.get(clave, 0)
+            self._conteos[clave] = conteo + 1
+        if conteo % muestreo:
+            return False
+        if conteo:
+            record.omitidos = muestreo - 1
+        return True
+
+
+class FormateadorJSON(logging.Formatter):
+    """Una linea JSON por registro: fecha, nivel, logger, mensaje, campos y excepcion."""
+
+    def format(self, record):
+        registro = {
+            'fecha': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage()
+        }
+        registro.update(getattr(record, 'campos', None) or {})
+        if getattr(record, 'omitidos', None):
+            registro['omitidos'] = record.omitidos
+        # Atributos pasados con extra={...} directamente
+        for clave, valor in vars(record).items():
+            if clave not in _CAMPOS_ESTANDAR and clave not in ('campos', 'muestreo', 'omitidos'):
+                registro[clave] = valor
+        if record.exc_text:
+            registro['excepcion'] = record.exc_text
+        return json.dumps(registro, ensure_ascii=False, default=str)
+
+
+class _ManejadorCola(QueueHandler):
+    """
+    Solo arma el mensaje y el texto de la excepcion en el hilo que registra;
+    el formato final y la escritura ocurren en el hilo del QueueListener.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_cola = queue.SimpleQueue()
+_lock = threading.Lock()
+_configurado = False
+_escucha = None
+_pid_escucha = None
+
+
+def _crear_salida(formato):
+    salida = logging.StreamHandler(sys.stdout)
+    if formato == 'json':
+        salida.setFormatter(FormateadorJSON())
+    else:
+        salida.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    return salida
+
+
+def configurar_logging(nivel=LOG_NIVEL):
+    """
+    Reemplaza los handlers del logger raiz por uno que encola. No inicia
+    hilos (el pool de trabajadores hace fork despues): hasta llamar a
+    `iniciar_logging` los registros esperan en la cola.
+    """
+    global _configurado
+    with _lock:
+        if _configurado:
+            return
+        manejador = _ManejadorCola(_cola)
+        manejador.addFilter(FiltroMuestreo())
+        raiz = logging.getLogger()
+        for anterior in list(raiz.handlers):
+            raiz.removeHandler(anterior)
+        raiz.addHandler(manejador)
+        raiz.setLevel(nivel)
+        _configurado = True
+
+
+def iniciar_logging(formato=LOG_FORMATO):
+    """
+    Inicia el hilo que escribe los registros. Despues de un fork el hilo
+    del padre no existe en el hijo: en ese caso se crea uno nuevo.
+    """
+    global _escucha, _pid_escucha
+    configurar_logging()
+    with _lock:
+        if _escucha is not None and _pid_escucha == os.getpid():
+            return
+        _escucha = QueueListener(_cola, _crear_salida(formato))
+        _escucha.start()
+        _pid_escucha = os.getpid()
+    atexit.register(detener_logging)
+
+
+def detener_logging():
+    """Escribe los registros pendientes y detiene el hilo."""
+    global _escucha
+    with _lock:
+        if _escucha is None or _pid_escucha != os.getpid():
+            return
+        _escucha.stop()
+        _escucha = None
+
+
+def escribir_pendientes(formato=LOG_FORMATO):
+    """
+    Escribe en este hilo los registros en cola sin iniciar el hilo de
+    escritura. Para el maestro de gunicorn antes de crear los workers: si
+    no, cada worker heredaria una copia de la cola y los repetiria.
+    """
+    salida = _crear_salida(formato)
+    while True:
+        try:
+            registro = _cola.get_nowait()
+        except queue.Empty:
+            break
+        salida.handle(registro)
+    salida.flush()
@@ -0,0 +1,179 @@
+"""
+Caches en memoria con expiracion (TTL) y tamaño acotado (LRU)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+# Bits en 1 de cada byte, para la distancia de Hamming entre huellas
+_BITS_POR_BYTE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class CacheTTL:
+    """
+    Cache clave -> valor que expira cada entrada `ttl` segundos despues de
+    guardarla y, al superar `capacidad`, descarta la usada hace mas tiempo.
+
+    `obtener_o_calcular` evita trabajo duplicado: si otra peticion ya esta
+    calculando la misma clave, espera su resultado en vez de repetirlo.
+    """
+
+    def __init__(self, capacidad, ttl):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._en_vuelo = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.descartes = 0
+
+    def _leer(self, clave, ahora):
+        """Entrada (valor, expira) vigente de la clave o None. Llamar con el lock tomado."""
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        if entrada[1] <= ahora:
+            del self._entradas[clave]
+            return None
+        self._entradas.move_to_end(clave)
+        return entrada
+
+    def obtener(self, clave):
+        """Retorna el valor vigente o None."""
+        with self._lock:
+            entrada = self._leer(clave, time.monotonic())
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+            return entrada[0]
+
+    def _guardar(self, clave, valor):
+        """Guarda y descarta las menos usadas. Llamar con el lock tomado."""
+        self._entradas[clave] = (valor, time.monotonic() + self.ttl)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.capacidad:
+            self._entradas.popitem(last=False)
+            self.descartes += 1
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._guardar(clave, valor)
+
+    def invalidar(self, clave=None):
+        """Elimina una clave, o todas si no se indica."""
+        with self._lock:
+            if clave is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(clave, None)
+
+    def obtener_o_calcular(self, clave, calcular, guardar_si=None):
+        """
+        Retorna (valor, desde_cache). Si la clave no esta, llama a
+        `calcular()` una sola vez aunque haya peticiones concurrentes con la
+        misma clave, y guarda el resultado si `guardar_si(valor)` es
+        verdadero (por defecto siempre).
+        """
+        with self._lock:
+            entrada = self._leer(clave, time.monotonic())
+            if entrada is not None:
+                self.aciertos += 1
+                return entrada[0], True
+            futuro = self._en_vuelo.get(clave)
+            propio = futuro is None
+            if propio:
+                self.fallos += 1
+                futuro = self._en_vuelo[clave] = Future()
+            else:
+                self.aciertos += 1
+
+        if not propio:
+            return futuro.result(), True
+
+        try:
+            valor = calcular()
+        except Exception as e:
+            with self._lock:
+                self._en_vuelo.pop(clave, None)
+            futuro.set_exception(e)
+            raise
+        # Guardar antes de soltar la clave para que nadie la recalcule entre medio
+        if guardar_si is None or guardar_si(valor):
+            self.guardar(clave, valor)
+        with self._lock:
+            self._en_vuelo.pop(clave, None)
+        futuro.set_result(valor)
+        return valor, False
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'capacidad': self.capacidad,
+                'ttl_segundos': self.ttl,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'descartes': self.descartes,
+                'tasa_aciertos': round(self.aciertos / consultas, 3) if consultas else None
+            }
+
+
+class CacheHuellas(CacheTTL):
+    """
+    CacheTTL cuyas claves son huellas perceptuales (bytes, ver
+    imagenes.huella_imagen). Una consulta acierta con la huella guardada mas
+    cercana si difiere en a lo sumo `tolerancia` bits.
+
+    `invalidar()` vacia la cache y avanza la generacion: un resultado
+    calculado antes de invalidar se descarta al intentar guardarlo con la
+    generacion vieja, asi nunca queda un resultado de una galeria anterior.
+    """
+
+    def __init__(self, capacidad, ttl, tolerancia):
+        super().__init__(capacidad, ttl)
+        self.tolerancia = tolerancia
+        self.generacion = 0
+
+    def _mas_cercana(self, huella, ahora):
+        """Clave vigente mas cercana dentro de la tolerancia, o None. Con el lock tomado."""
+        vigentes = [clave for clave, (_, expira) in self._entradas.items() if expira > ahora]
+        if not vigentes:
+            return None
+        claves = np.frombuffer(b''.join(vigentes), dtype=np.uint8).reshape(len(vigentes), -1)
+        consulta = np.frombuffer(huella, dtype=np.uint8)
+        distancias = _BITS_POR_BYTE[claves ^ consulta].sum(axis=1, dtype=np.int32)
+        mejor = int(distancias.argmin())
+        return vigentes[mejor] if distancias[mejor] <= self.tolerancia else None
+
+    def obtener(self, huella):
+        with self._lock:
+            ahora = time.monotonic()
+            entrada = self._leer(huella, ahora)
+            if entrada is None and self.tolerancia > 0:
+                clave = self._mas_cercana(huella, ahora)
+                if clave is not None:
+                    entrada = self._leer(clave, ahora)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, huella, valor, generacion=None):
+        """Guarda salvo que la cache se haya invalidado desde `generacion`."""
+        with self._lock:
+            if generacion is not None and generacion != self.generacion:
+                return
+            self._guardar(huella, valor)
+
+    def invalidar(self, clave=None):
+        with self._lock:
+            self._entradas.clear()
+            self.generacion += 1
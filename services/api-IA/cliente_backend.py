@@ -0,0 +1,39 @@
+"""
+Sesion HTTP compartida para hablar con el backend
+Reutiliza conexiones keep-alive en vez de abrir una por peticion
+"""
+
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Conexiones keep-alive que se mantienen abiertas hacia el backend
+BACKEND_CONEXIONES = int(os.environ.get('BACKEND_CONEXIONES', '16'))
+
+# Timeout de las llamadas al backend (segundos)
+BACKEND_TIMEOUT_SEGUNDOS = float(os.environ.get('BACKEND_TIMEOUT_SEGUNDOS', '5'))
+
+
+def crear_sesion(conexiones=BACKEND_CONEXIONES, reintentos=2):
+    """
+    Session de requests con un pool de `conexiones` y reintentos cortos solo
+    ante errores de conexion (la peticion no llego a enviarse) y, para los
+    GET, ante 502/503/504. Un POST nunca se repite despues de un timeout de
+    lectura o de una respuesta: el backend pudo haberlo procesado y la
+    peticion del kiosko ya esta esperando. Esos marcajes los reintenta
+    ColaMarcajes en segundo plano con su clave de idempotencia.
+    """
+    politica = Retry(
+        total=reintentos,
+        connect=reintentos,
+        read=0,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False
+    )
+    adaptador = HTTPAdapter(pool_connections=2, pool_maxsize=conexiones, max_retries=politica)
+    sesion = requests.Session()
+    sesion.mount('http://', adaptador)
+    sesion.mount('https://', adaptador)
+    return sesion
@@ -0,0 +1,146 @@
+"""
+Formato binario compacto para intercambiar encodings con el backend
+Reemplaza base64(pickle(ndarray)) por una cabecera versionada + datos little-endian
+"""
+
+import base64
+import io
+import os
+import pickle
+import struct
+import numpy as np
+
+# Formato por defecto para los encodings que se envian al backend: f32, f16 o i8
+FORMATO_ENCODING = os.environ.get('FORMATO_ENCODING', 'f32')
+
+# Cabecera: magia (2) | version u8 | formato u8 | dimension u16 | escala f32
+# La escala solo se usa en i8 (cuantizacion simetrica por vector) y vale 1.0 en el resto
+MAGIA = b'\xfeE'
+VERSION = 1
+CABECERA = struct.Struct('<2sBBHf')
+
+FORMATOS = {
+    'f32': (1, np.dtype('<f4')),
+    'f16': (2, np.dtype('<f2')),
+    'i8': (3, np.dtype('i1')),
+}
+FORMATOS_POR_CODIGO = {codigo: (nombre, dtype) for nombre, (codigo, dtype) in FORMATOS.items()}
+
+
+class _UnpicklerNumpy(pickle.Unpickler):
+    """Unpickler que solo permite reconstruir arreglos de NumPy (formato antiguo)."""
+
+    PERMITIDOS = {
+        ('numpy.core.multiarray', '_reconstruct'),
+        ('numpy._core.multiarray', '_reconstruct'),
+        ('numpy', 'ndarray'),
+        ('numpy', 'dtype'),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self.PERMITIDOS:
+            raise pickle.UnpicklingError(f"Clase no permitida en encoding: {module}.{name}")
+        return super().find_class(module, name)
+
+
+def _decodificar_pickle(datos):
+    return np.asarray(_UnpicklerNumpy(io.BytesIO(datos)).load(), dtype=np.float32).ravel()
+
+
+def codificar_encoding(encoding, formato=FORMATO_ENCODING):
+    """Serializa un encoding (128,) en el formato compacto y lo retorna en base64."""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de encoding desconocido: {formato}")
+    codigo, dtype = FORMATOS[formato]
+    encoding = np.asarray(encoding, dtype=np.float32).ravel()
+
+    escala = 1.0
+    if formato == 'i8':
+        maximo = float(np.abs(encoding).max())
+        escala = maximo / 127.0 if maximo > 0 else 1.0
+        datos = np.round(encoding / escala).astype(dtype)
+    else:
+        datos = encoding.astype(dtype)
+
+    cabecera = CABECERA.pack(MAGIA, VERSION, codigo, encoding.shape[0], escala)
+    return base64.b64encode(cabecera + datos.tobytes()).decode('ascii')
+
+
+def decodificar_encodings(textos):
+    """
+    Decodifica un lote de encodings en base64 (formato compacto o pickle
+    antiguo). Los blobs compactos del mismo formato se decodifican juntos con
+    un solo np.frombuffer.
+
+    Retorna (matriz M x D float32, errores) donde errores es un dict
+    indice -> mensaje para los que no se pudieron decodificar; sus filas
+    quedan en cero.
+    """
+    errores = {}
+    binarios = []
+    for i, texto in enumerate(textos):
+        try:
+            binarios.append(base64.b64decode(texto))
+        except Exception as e:
+            binarios.append(None)
+            errores[i] = f"base64 invalido: {e}"
+
+    # Agrupar los compactos por (formato, dimension) para decodificarlos juntos
+    grupos = {}
+    antiguos = []
+    dimension = None
+    for i, datos in enumerate(binarios):
+        if datos is None:
+            continue
+        if datos[:2] == MAGIA and len(datos) >= CABECERA.size:
+            _, version, codigo, dim, _ = CABECERA.unpack_from(datos)
+            if version != VERSION or codigo not in FORMATOS_POR_CODIGO:
+                errores[i] = f"version {version} / formato {codigo} no soportado"
+                continue
+            grupos.setdefault((codigo, dim), []).append(i)
+            dimension = dimension or dim
+        else:
+            antiguos.append(i)
+
+    antiguos_decodificados = {}
+    for i in antiguos:
+        try:
+            antiguos_decodificados[i] = _decodificar_pickle(binarios[i])
+            dimension = dimension or antiguos_decodificados[i].shape[0]
+        except Exception as e:
+            errores[i] = f"pickle invalido: {e}"
+
+    matriz = np.zeros((len(textos), dimension or 128), dtype=np.float32)
+
+    for (codigo, dim), indices in grupos.items():
+        if dim != matriz.shape[1]:
+            for i in indices:
+                errores[i] = f"dimension {dim} distinta a {matriz.shape[1]}"
+            continue
+        _, dtype = FORMATOS_POR_CODIGO[codigo]
+        registro = np.dtype([('cabecera', 'V6'), ('escala', '<f4'), ('datos', dtype, (dim,))])
+        validos = [i for i in indices if len(binarios[i]) == registro.itemsize]
+        for i in set(indices) - set(validos):
+            errores[i] = "largo de encoding invalido"
+        if not validos:
+            continue
+        lote = np.frombuffer(b''.join(binarios[i] for i in validos), dtype=registro)
+        valores = lote['datos'].astype(np.float32)
+        if codigo == FORMATOS['i8'][0]:
+            valores *= lote['escala'][:, None]
+        matriz[validos] = valores
+
+    for i, fila in antiguos_decodificados.items():
+        if fila.shape[0] != matriz.shape[1]:
+            errores[i] = f"dimension {fila.shape[0]} distinta a {matriz.shape[1]}"
+            continue
+        matriz[i] = fila
+    return matriz, errores
+
+
+def decodificar_encoding(texto):
+    """Decodifica un solo encoding en base64 (compacto o pickle antiguo)."""
+    matriz, errores = decodificar_encodings([texto])
+    if errores:
+        raise ValueError(errores[0])
+    return matriz[0]
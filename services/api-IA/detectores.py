@@ -0,0 +1,238 @@
+"""
+Detectores de rostros intercambiables
+HOG y CNN de dlib (face_recognition), Haar de OpenCV y modo auto (rapido primero, CNN de respaldo)
+face_recognition se importa al detectar: cargar dlib no es necesario para usar Haar o la escala.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Cantidad de mediciones recientes que se guardan por detector para percentiles
+MUESTRAS_LATENCIA = 512
+
+# Limites de la escala de deteccion (no agrandar ni achicar sin control)
+ESCALA_MINIMA = float(os.environ.get('ESCALA_MINIMA', '0.1'))
+ESCALA_MAXIMA = float(os.environ.get('ESCALA_MAXIMA', '2.0'))
+
+
+class EstadisticasLatencia:
+    """Conteo, total y ventana de las ultimas latencias de un detector."""
+
+    def __init__(self, muestras=MUESTRAS_LATENCIA):
+        self._lock = threading.Lock()
+        self._recientes = deque(maxlen=muestras)
+        self.llamadas = 0
+        self.rostros = 0
+        self.total_segundos = 0.0
+
+    def registrar(self, segundos, rostros):
+        with self._lock:
+            self.llamadas += 1
+            self.rostros += rostros
+            self.total_segundos += segundos
+            self._recientes.append(segundos)
+
+    def resumen(self):
+        with self._lock:
+            recientes = np.array(self._recientes) * 1000
+            llamadas, rostros, total = self.llamadas, self.rostros, self.total_segundos
+        if llamadas == 0:
+            return {'llamadas': 0}
+        return {
+            'llamadas': llamadas,
+            'rostros': rostros,
+            'promedio_ms': round(total * 1000 / llamadas, 2),
+            'p50_ms': round(float(np.percentile(recientes, 50)), 2),
+            'p95_ms': round(float(np.percentile(recientes, 95)), 2),
+            'max_ms': round(float(recientes.max()), 2)
+        }
+
+
+class Detector:
+    """
+    Base de los detectores. Reciben una imagen RGB uint8 y retornan
+    ubicaciones (top, right, bottom, left) como face_recognition.
+    """
+
+    nombre = None
+    # Lado aproximado (px) del rostro mas pequeño que detecta a escala 1
+    rostro_minimo = 40
+
+    def __init__(self):
+        self.estadisticas = EstadisticasLatencia()
+
+    def escala_para(self, alto, ancho, fraccion_rostro):
+        """Escala de deteccion para un frame de alto x ancho (ver escala_deteccion)."""
+        return escala_deteccion(alto, ancho, self.rostro_minimo, fraccion_rostro)
+
+    def _detectar(self, rgb):
+        raise NotImplementedError
+
+    def detectar(self, rgb):
+        inicio = time.perf_counter()
+        ubicaciones = self._detectar(rgb)
+        self.estadisticas.registrar(time.perf_counter() - inicio, len(ubicaciones))
+        return ubicaciones
+
+
+class DetectorHOG(Detector):
+    """HOG de dlib: rapido en CPU, pierde rostros pequeños o muy girados."""
+
+    nombre = 'hog'
+    # Ventana de 80 px con un sobremuestreo (el valor por defecto de face_locations)
+    rostro_minimo = 40
+
+    def _detectar(self, rgb):
+        import face_recognition
+        return face_recognition.face_locations(rgb, model='hog')
+
+
+class DetectorCNN(Detector):
+    """CNN (MMOD) de dlib: el mas preciso, muy lento sin GPU."""
+
+    nombre = 'cnn'
+    rostro_minimo = 40
+
+    def _detectar(self, rgb):
+        import face_recognition
+        return face_recognition.face_locations(rgb, model='cnn')
+
+
+class DetectorHaar(Detector):
+    """Cascada Haar de OpenCV: el mas barato, solo rostros frontales."""
+
+    nombre = 'haar'
+
+    def __init__(self, cascada='haarcascade_frontalface_default.xml', tamano_minimo=40):
+        super().__init__()
+        self.ruta_cascada = cv2.data.haarcascades + cascada
+        self.tamano_minimo = tamano_minimo
+        self.rostro_minimo = tamano_minimo
+        # CascadeClassifier no es seguro entre hilos: uno por hilo
+        self._local = threading.local()
+
+    def _clasificador(self):
+        clasificador = getattr(self._local, 'clasificador', None)
+        if clasificador is None:
+            clasificador = cv2.CascadeClassifier(self.ruta_cascada)
+            if clasificador.empty():
+                raise RuntimeError(f"No se pudo cargar la cascada {self.ruta_cascada}")
+            self._local.clasificador = clasificador
+        return clasificador
+
+    def _detectar(self, rgb):
+        gris = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        rectangulos = self._clasificador().detectMultiScale(
+            gris, scaleFactor=1.1, minNeighbors=5,
+            minSize=(self.tamano_minimo, self.tamano_minimo)
+        )
+        return [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h in rectangulos]
+
+
+class DetectorAuto(Detector):
+    """Ejecuta el detector rapido y solo si no encuentra nada usa el de respaldo."""
+
+    nombre = 'auto'
+
+    def __init__(self, rapido, respaldo):
+        super().__init__()
+        self.rapido = rapido
+        self.respaldo = respaldo
+        self.respaldos_usados = 0
+        # La escala debe servir a ambos detectores
+        self.rostro_minimo = max(rapido.rostro_minimo, respaldo.rostro_minimo)
+
+    def _detectar(self, rgb):
+        ubicaciones = self.rapido.detectar(rgb)
+        if not ubicaciones:
+            self.respaldos_usados += 1
+            ubicaciones = self.respaldo.detectar(rgb)
+        return ubicaciones
+
+
+def escala_deteccion(alto, ancho, rostro_minimo, fraccion_rostro,
+                     escala_minima=ESCALA_MINIMA, escala_maxima=ESCALA_MAXIMA):
+    """
+    Escala a la que conviene correr el detector sobre un frame de alto x ancho.
+
+    `fraccion_rostro` es el tamaño del rostro mas pequeño que se quiere
+    encontrar, como fraccion del lado menor del frame. La escala lleva ese
+    rostro a `rostro_minimo` px: los frames grandes se achican (menos CPU) y
+    los pequeños se agrandan (no se pierden rostros), dentro de los limites.
+    """
+    rostro_px = fraccion_rostro * min(alto, ancho)
+    if rostro_px <= 0:
+        return 1.0
+    return float(np.clip(rostro_minimo / rostro_px, escala_minima, escala_maxima))
+
+
+def reducir_a_rgb(frame_bgr, escala):
+    """Redimensiona un frame BGR a la escala dada y lo convierte a RGB."""
+    if escala != 1.0:
+        interpolacion = cv2.INTER_AREA if escala < 1.0 else cv2.INTER_LINEAR
+        frame_bgr = cv2.resize(frame_bgr, (0, 0), fx=escala, fy=escala, interpolation=interpolacion)
+    return cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+
+
+def escalar_ubicaciones(ubicaciones, forma_reducida, forma_original):
+    """
+    Lleva ubicaciones (top, right, bottom, left) de la imagen reducida a la
+    original. Usa el factor real de cada eje (cv2.resize redondea el tamaño)
+    y recorta al borde del frame.
+    """
+    alto_r, ancho_r = forma_reducida[:2]
+    alto, ancho = forma_original[:2]
+    fy, fx = alto / alto_r, ancho / ancho_r
+    return [
+        (max(0, int(round(top * fy))), min(ancho, int(round(right * fx))),
+         min(alto, int(round(bottom * fy))), max(0, int(round(left * fx))))
+        for top, right, bottom, left in ubicaciones
+    ]
+
+
+_detectores = {}
+_lock = threading.RLock()
+
+
+def obtener_detector(nombre):
+    """
+    Retorna el detector compartido para un nombre: 'hog', 'cnn', 'haar',
+    'auto' (hog -> cnn) o 'auto-haar' (haar -> cnn).
+    """
+    with _lock:
+        if nombre not in _detectores:
+            if nombre == 'hog':
+                _detectores[nombre] = DetectorHOG()
+            elif nombre == 'cnn':
+                _detectores[nombre] = DetectorCNN()
+            elif nombre == 'haar':
+                _detectores[nombre] = DetectorHaar()
+            elif nombre in ('auto', 'auto-haar'):
+                rapido = 'haar' if nombre == 'auto-haar' else 'hog'
+                detector = DetectorAuto(obtener_detector(rapido), obtener_detector('cnn'))
+                detector.nombre = nombre
+                _detectores[nombre] = detector
+            else:
+                raise ValueError(f"Detector desconocido: {nombre}")
+        return _detectores[nombre]
+
+
+def detectores_en_uso():
+    """Copia del registro nombre -> detector de los detectores ya creados."""
+    with _lock:
+        return dict(_detectores)
+
+
+def estadisticas_detectores():
+    """Latencias de todos los detectores usados hasta ahora."""
+    detectores = detectores_en_uso()
+    resumen = {nombre: d.estadisticas.resumen() for nombre, d in detectores.items()}
+    for nombre, d in detectores.items():
+        if isinstance(d, DetectorAuto):
+            resumen[nombre]['respaldos_usados'] = d.respaldos_usados
+    return resumen
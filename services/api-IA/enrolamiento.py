@@ -0,0 +1,212 @@
+"""
+Registro masivo de rostros sin pasar por la API
+Recorre un directorio con una carpeta por usuario_id, calcula los encodings en
+paralelo en todos los nucleos y escribe la galeria (.gal + .wal) de una sola vez.
+
+Uso (desde services/api-IA):
+    python enrolamiento.py fotos/ --salida rostros_conocidos --trabajadores 8
+
+    fotos/
+      507f1f77bcf86cd799439011/
+        frente.jpg
+        perfil.jpg
+      507f1f77bcf86cd799439012/
+        ...
+
+Cada imagen debe tener exactamente un rostro, igual que en /train. El avance
+se guarda en un punto de control (<salida>.parcial.wal) despues de cada lote:
+si el proceso se interrumpe, al correrlo de nuevo se omiten los usuarios ya
+procesados. Un usuario sin ninguna imagen valida se reintenta.
+
+Sin --combinar la galeria queda solo con los usuarios del directorio y se
+borra la marca de sincronizacion (<salida>.sync): al iniciar, el servicio
+hace una sincronizacion completa que agrega de nuevo los usuarios con
+encoding en el backend, sin quitar los registrados aqui. Con --combinar se
+conservan la galeria existente y su marca.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from almacen import AlmacenGaleria
+from galeria import GaleriaRostros
+from indices import crear_indice
+from trabajadores import PoolTrabajadores, detectar_y_codificar, encoding_de_registro
+
+EXTENSIONES = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def buscar_imagenes(directorio):
+    """Retorna [(usuario_id, [rutas])] ordenado, una entrada por carpeta con imagenes."""
+    usuarios = []
+    for entrada in sorted(os.scandir(directorio), key=lambda e: e.name):
+        if not entrada.is_dir():
+            continue
+        rutas = []
+        for raiz, _, archivos in os.walk(entrada.path):
+            rutas.extend(os.path.join(raiz, a) for a in archivos if a.lower().endswith(EXTENSIONES))
+        if rutas:
+            usuarios.append((entrada.name, sorted(rutas)))
+    return usuarios
+
+
+def agrupar_en_lotes(usuarios, imagenes_por_lote):
+    """Agrupa usuarios completos hasta juntar al menos `imagenes_por_lote` imagenes."""
+    lote, cantidad = [], 0
+    for usuario in usuarios:
+        lote.append(usuario)
+        cantidad += len(usuario[1])
+        if cantidad >= imagenes_por_lote:
+            yield lote
+            lote, cantidad = [], 0
+    if lote:
+        yield lote
+
+
+def codificar_rutas(rutas, pool, nombre_detector, fraccion_rostro):
+    """
+    Lee y codifica las imagenes. Retorna por ruta (encoding, None) o
+    (None, motivo); un archivo ilegible no interrumpe el lote.
+    """
+    resultados = [None] * len(rutas)
+    legibles, imagenes = [], []
+    for i, ruta in enumerate(rutas):
+        try:
+            with open(ruta, 'rb') as f:
+                imagenes.append(f.read())
+            legibles.append(i)
+        except OSError as e:
+            resultados[i] = e
+
+    if pool is not None:
+        codificadas = pool.detectar_lote(
+            imagenes, fraccion_rostro, resolucion_completa=True, retornar_excepciones=True
+        )
+    else:
+        codificadas = []
+        for imagen in imagenes:
+            try:
+                codificadas.append(detectar_y_codificar(
+                    imagen, nombre_detector, fraccion_rostro, resolucion_completa=True
+                ))
+            except Exception as e:
+                codificadas.append(e)
+
+    for i, resultado in zip(legibles, codificadas):
+        resultados[i] = resultado
+    return [encoding_de_registro(resultado) for resultado in resultados]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directorio', help='Directorio con una carpeta de imagenes por usuario_id')
+    parser.add_argument('--salida', default='rostros_conocidos', help='Ruta base de la galeria (sin extension)')
+    parser.add_argument('--trabajadores', type=int, default=os.cpu_count(),
+                        help='Procesos de deteccion (0 = en este proceso)')
+    parser.add_argument('--detector', default=os.environ.get('DETECTOR_ENTRENAMIENTO', 'hog'))
+    parser.add_argument('--fraccion', type=float,
+                        default=float(os.environ.get('FRACCION_ROSTRO_ENTRENAMIENTO', '0.2')))
+    parser.add_argument('--lote', type=int, default=256, help='Imagenes por punto de control')
+    parser.add_argument('--combinar', action='store_true',
+                        help='Conservar los usuarios de la galeria existente que no esten en el directorio')
+    parser.add_argument('--reiniciar', action='store_true', help='Ignorar el punto de control anterior')
+    parser.add_argument('--reporte', help='Archivo JSON del reporte (por defecto <salida>.reporte.json)')
+    args = parser.parse_args()
+
+    destino = AlmacenGaleria(args.salida)
+    # El punto de control es un WAL que nunca se compacta: cada lote es un
+    # registro con una sola sincronizacion a disco
+    parcial = AlmacenGaleria(f"{args.salida}.parcial", compactar_bytes=sys.maxsize)
+    if args.reiniciar and os.path.exists(parcial.ruta_wal):
+        os.remove(parcial.ruta_wal)
+
+    hechos = GaleriaRostros(indice=crear_indice('exacto'))
+    if parcial.existe():
+        parcial.cargar(hechos)
+
+    usuarios = buscar_imagenes(args.directorio)
+    pendientes = [usuario for usuario in usuarios if usuario[0] not in hechos]
+    total_imagenes = sum(len(rutas) for _, rutas in pendientes)
+    print(f"{len(usuarios)} usuarios encontrados, {len(usuarios) - len(pendientes)} ya en el punto de control, "
+          f"{total_imagenes} imagenes por procesar", flush=True)
+
+    pool = None
+    if args.trabajadores > 0:
+        pool = PoolTrabajadores(args.trabajadores, args.detector,
+                                max_pendientes=args.trabajadores * 4, espera=None)
+        pool.iniciar()
+
+    fallas = []
+    procesadas = 0
+    inicio = time.perf_counter()
+    try:
+        for lote in agrupar_en_lotes(pendientes, args.lote):
+            rutas = [ruta for _, rutas_usuario in lote for ruta in rutas_usuario]
+            codificadas = iter(codificar_rutas(rutas, pool, args.detector, args.fraccion))
+
+            reemplazos = {}
+            for usuario_id, rutas_usuario in lote:
+                encodings = []
+                for ruta in rutas_usuario:
+                    encoding, motivo = next(codificadas)
+                    if motivo is None:
+                        encodings.append(encoding)
+                    else:
+                        fallas.append({'usuario_id': usuario_id, 'archivo': ruta, 'motivo': motivo})
+                if encodings:
+                    reemplazos[usuario_id] = encodings
+            parcial.aplicar_cambios(hechos, reemplazos)
+
+            procesadas += len(rutas)
+            segundos = time.perf_counter() - inicio
+            print(f"{procesadas}/{total_imagenes} imagenes, {hechos.total_usuarios()} usuarios, "
+                  f"{procesadas / segundos:.1f} img/s", flush=True)
+    finally:
+        if pool is not None:
+            pool.cerrar()
+    segundos = time.perf_counter() - inicio
+
+    # Galeria final en una sola escritura
+    final = hechos
+    if args.combinar and destino.existe():
+        final = GaleriaRostros(indice=crear_indice('exacto'))
+        destino.cargar(final)
+        for usuario_id in set(hechos.nombres()):
+            final.reemplazar_usuario(usuario_id, hechos.encodings_de(usuario_id))
+    destino.compactar(final)
+    if not args.combinar:
+        destino.descartar_marca()
+    parcial.cerrar()
+    for ruta in (parcial.ruta_wal, parcial.ruta_bloqueo):
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+    reporte = {
+        'directorio': args.directorio,
+        'salida': destino.ruta_instantanea,
+        'detector': args.detector,
+        'trabajadores': args.trabajadores,
+        'usuarios': len(usuarios),
+        'usuarios_en_galeria': final.total_usuarios(),
+        'usuarios_retomados': len(usuarios) - len(pendientes),
+        'imagenes_procesadas': procesadas,
+        'imagenes_fallidas': len(fallas),
+        'segundos': round(segundos, 2),
+        'imagenes_por_segundo': round(procesadas / segundos, 2) if segundos > 0 else None,
+        'fallas': fallas
+    }
+    ruta_reporte = args.reporte or f"{args.salida}.reporte.json"
+    with open(ruta_reporte, 'w') as f:
+        json.dump(reporte, f, indent=2, ensure_ascii=False)
+
+    print(f"Galeria escrita en {destino.ruta_instantanea}: {final.total_usuarios()} usuarios, "
+          f"{len(final)} encodings", flush=True)
+    print(f"{procesadas} imagenes en {segundos:.1f}s ({reporte['imagenes_por_segundo']} img/s), "
+          f"{len(fallas)} fallidas. Reporte: {ruta_reporte}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+"""
+Galeria de rostros conocidos
+Matriz contigua float32 (N x 128) con normas precalculadas y arreglo paralelo de IDs
+"""
+
+import threading
+import numpy as np
+
+from indices import VIVA, crear_indice
+
+DIMENSION_ENCODING = 128
+CAPACIDAD_INICIAL = 1024
+
+
+class _Filas:
+    """
+    Filas compartidas por una galeria y las versiones derivadas de ella.
+
+    Solo crece: una fila escrita nunca se mueve ni se sobrescribe, y
+    eliminarla solo anota en `muerte` la version desde la que ya no existe.
+    Las filas iniciales (`base`, por ejemplo un np.memmap de la instantanea)
+    no se copian nunca; las agregadas despues van a `cola`, que crece de
+    forma amortizada. `punta` es la unica version que puede seguir
+    escribiendo: cualquier otra que quiera modificar se separa primero.
+    """
+
+    def __init__(self, dimension, base_matriz, base_normas, nombres, capacidad=CAPACIDAD_INICIAL):
+        self.dimension = dimension
+        self.n_base = len(nombres)
+        self.base_matriz = base_matriz
+        self.base_normas = base_normas
+        self.cola_matriz = np.empty((capacidad, dimension), dtype=np.float32)
+        self.cola_normas = np.empty(capacidad, dtype=np.float32)
+        total = self.n_base + capacidad
+        self.ids = np.empty(total, dtype=object)
+        self.ids[:self.n_base] = nombres
+        self.muerte = np.full(total, VIVA, dtype=np.int64)
+        # usuario_id -> filas (vivas y muertas, en orden); se filtran por version
+        self.filas_por_usuario = {}
+        for fila, usuario_id in enumerate(nombres):
+            self.filas_por_usuario.setdefault(usuario_id, []).append(fila)
+        self.punta = 0
+
+    def asegurar_capacidad(self, n, requerida):
+        """
+        Deja lugar para `requerida` filas. Las versiones publicadas siguen
+        leyendo el arreglo anterior o el nuevo, que tienen las mismas filas.
+        """
+        if requerida <= self.ids.shape[0]:
+            return
+        usadas = n - self.n_base
+        capacidad = max(requerida - self.n_base, 2 * self.cola_matriz.shape[0])
+        matriz = np.empty((capacidad, self.dimension), dtype=np.float32)
+        normas = np.empty(capacidad, dtype=np.float32)
+        matriz[:usadas] = self.cola_matriz[:usadas]
+        normas[:usadas] = self.cola_normas[:usadas]
+        total = self.n_base + capacidad
+        ids = np.empty(total, dtype=object)
+        ids[:n] = self.ids[:n]
+        muerte = np.full(total, VIVA, dtype=np.int64)
+        muerte[:n] = self.muerte[:n]
+        self.cola_matriz, self.cola_normas = matriz, normas
+        self.ids, self.muerte = ids, muerte
+
+
+class GaleriaRostros:
+    """
+    Almacena los encodings conocidos en una matriz preasignada que crece de
+    forma amortizada, de modo que comparar contra toda la galeria es una sola
+    multiplicacion de matrices sin reconstruir nada por peticion.
+
+    Las busquedas se delegan en un indice (ver indices.py) que se mantiene
+    actualizado con cada modificacion.
+
+    Una galeria publicada (la que leen las peticiones) no se modifica: para
+    cambiarla se hace derivar -> modificar -> publicar. `derivar` no copia
+    filas: la version nueva comparte las filas (_Filas) y el indice con la
+    publicada, agrega las suyas al final y marca las que elimina con su
+    numero de version, que las versiones anteriores no ven. Por eso `buscar`
+    y `distancias` no toman el lock; este solo serializa a quien modifica
+    una version aun no publicada.
+    """
+
+    def __init__(self, dimension=DIMENSION_ENCODING, capacidad=CAPACIDAD_INICIAL, indice=None):
+        self.dimension = dimension
+        vacia = np.empty((0, dimension), dtype=np.float32)
+        self._filas = _Filas(dimension, vacia, vacia[:, 0], [], max(capacidad, 1))
+        # Filas escritas que ve esta version (vivas y muertas) y cuantas estan vivas
+        self._n = 0
+        self._vivas = 0
+        self._usuarios = 0
+        self._muertas = None
+        self._lock = threading.RLock()
+        self._indice = indice if indice is not None else crear_indice()
+        self.version = 0
+
+    # ------------------------------------------
+    # Consultas
+    # ------------------------------------------
+
+    def __len__(self):
+        return self._vivas
+
+    def __contains__(self, usuario_id):
+        return self._filas_de(usuario_id).shape[0] > 0
+
+    def total_usuarios(self):
+        """Cantidad de usuarios distintos en la galeria."""
+        return self._usuarios
+
+    def _filas_de(self, usuario_id):
+        """Filas vivas de un usuario en esta version."""
+        filas = self._filas.filas_por_usuario.get(usuario_id)
+        if not filas:
+            return np.empty(0, dtype=np.int64)
+        filas = np.asarray(filas, dtype=np.int64)
+        filas = filas[filas < self._n]
+        return filas[self._filas.muerte[filas] > self.version]
+
+    def _filas_muertas(self):
+        """Filas eliminadas que esta version todavia recorre (calculado una vez)."""
+        muertas = self._muertas
+        if muertas is None:
+            if self._vivas == self._n:
+                muertas = np.empty(0, dtype=np.int64)
+            else:
+                muertas = np.flatnonzero(self._filas.muerte[:self._n] <= self.version)
+            self._muertas = muertas
+        return muertas
+
+    def _filas_vivas(self):
+        """Filas vivas de esta version, en orden."""
+        if self._vivas == self._n:
+            return np.arange(self._n)
+        vivas = np.ones(self._n, dtype=bool)
+        vivas[self._filas_muertas()] = False
+        return np.flatnonzero(vivas)
+
+    def _bloques(self):
+        """(inicio, matriz, normas) de los tramos contiguos de filas de esta version."""
+        f = self._filas
+        en_base = min(self._n, f.n_base)
+        bloques = []
+        if en_base:
+            bloques.append((0, f.base_matriz[:en_base], f.base_normas[:en_base]))
+        if self._n > f.n_base:
+            fin = self._n - f.n_base
+            bloques.append((f.n_base, f.cola_matriz[:fin], f.cola_normas[:fin]))
+        return bloques
+
+    def _vectores(self, filas):
+        """Encodings y normas de las filas dadas (copias)."""
+        f = self._filas
+        filas = np.asarray(filas, dtype=np.int64)
+        if f.n_base == 0:
+            return f.cola_matriz[filas], f.cola_normas[filas]
+        en_base = filas < f.n_base
+        if en_base.all():
+            return f.base_matriz[filas], f.base_normas[filas]
+        matriz = np.empty((filas.shape[0], self.dimension), dtype=np.float32)
+        normas = np.empty(filas.shape[0], dtype=np.float32)
+        matriz[en_base] = f.base_matriz[filas[en_base]]
+        normas[en_base] = f.base_normas[filas[en_base]]
+        matriz[~en_base] = f.cola_matriz[filas[~en_base] - f.n_base]
+        normas[~en_base] = f.cola_normas[filas[~en_base] - f.n_base]
+        return matriz, normas
+
+    def nombres(self):
+        """Lista de IDs alineada con las filas de `encodings()`."""
+        return list(self._filas.ids[self._filas_vivas()])
+
+    def encodings_de(self, usuario_id):
+        """Encodings de un usuario (K x 128) o None si no existe."""
+        filas = self._filas_de(usuario_id)
+        return self._vectores(filas)[0] if filas.shape[0] else None
+
+    def encodings(self):
+        """Copia de los encodings (N x 128) para persistencia."""
+        return self._vectores(self._filas_vivas())[0]
+
+    def distancias(self, consultas):
+        """
+        Distancia euclidiana entre cada consulta (M x 128) y cada fila que
+        recorre esta version. Retorna matriz M x F en float32; las filas
+        eliminadas quedan en infinito.
+        """
+        consultas = np.atleast_2d(np.asarray(consultas, dtype=np.float32))
+        n = self._n
+        if n == 0:
+            return np.empty((consultas.shape[0], 0), dtype=np.float32)
+        bloques = self._bloques()
+        if len(bloques) == 1:
+            _, matriz, normas = bloques[0]
+            # ||e - q||^2 = ||e||^2 - 2 e.q + ||q||^2
+            d2 = consultas @ matriz.T
+            d2 *= -2.0
+            d2 += normas
+        else:
+            d2 = np.empty((consultas.shape[0], n), dtype=np.float32)
+            for inicio, matriz, normas in bloques:
+                tramo = d2[:, inicio:inicio + matriz.shape[0]]
+                tramo[:] = consultas @ matriz.T
+                tramo *= -2.0
+                tramo += normas
+        d2 += np.einsum('ij,ij->i', consultas, consultas)[:, None]
+        np.maximum(d2, 0.0, out=d2)
+        d = np.sqrt(d2, out=d2)
+        d[:, self._filas_muertas()] = np.inf
+        return d
+
+    def buscar(self, consultas, k=1):
+        """
+        Busca los k encodings mas cercanos para cada consulta (M x 128) en una
+        sola pasada vectorizada.
+
+        Retorna (ids, distancias), ambos M x k ordenados de menor a mayor
+        distancia. Si la galeria tiene menos de k filas, las columnas sobrantes
+        quedan con id None y distancia infinita.
+        """
+        consultas = np.atleast_2d(np.asarray(consultas, dtype=np.float32))
+        m = consultas.shape[0]
+        ids = np.full((m, k), None, dtype=object)
+        distancias = np.full((m, k), np.inf, dtype=np.float32)
+        if m == 0:
+            return ids, distancias
+
+        if self._vivas == 0:
+            return ids, distancias
+        filas, cercanas = self._indice.buscar(self, consultas, k)
+        kk = filas.shape[1]
+        ids[:, :kk] = np.where(filas >= 0, self._filas.ids[np.maximum(filas, 0)], None)
+        distancias[:, :kk] = cercanas
+        return ids, distancias
+
+    def estadisticas_indice(self):
+        """Estado del indice de busqueda."""
+        return self._indice.estadisticas()
+
+    # ------------------------------------------
+    # Versiones (para publicar una galeria nueva sin bloquear a los lectores)
+    # ------------------------------------------
+
+    def vacia(self):
+        """Galeria vacia con la misma dimension y tipo de indice."""
+        return GaleriaRostros(self.dimension, indice=self._indice.vacio())
+
+    def derivar(self):
+        """
+        Version nueva para modificar sin tocar esta: comparte las filas y el
+        indice, asi que cuesta O(1) y no copia la matriz (ni la saca de un
+        np.memmap).
+        """
+        with self._lock:
+            nueva = GaleriaRostros.__new__(GaleriaRostros)
+            nueva.dimension = self.dimension
+            nueva._filas = self._filas
+            nueva._n, nueva._vivas, nueva._usuarios = self._n, self._vivas, self._usuarios
+            nueva._muertas = self._muertas
+            nueva._lock = threading.RLock()
+            nueva._indice = self._indice.derivar()
+            nueva.version = self.version
+            return nueva
+
+    # ------------------------------------------
+    # Modificaciones
+    # ------------------------------------------
+
+    def _nuevas_filas(self, nombres, matriz, normas):
+        """Reemplaza todo el contenido por filas nuevas (no compartidas) y reconstruye el indice."""
+        self._filas = _Filas(self.dimension, matriz, normas, nombres)
+        self._n = self._vivas = len(nombres)
+        self._usuarios = len(self._filas.filas_por_usuario)
+        self._muertas = None
+        self.version += 1
+        self._filas.punta = self.version
+        self._indice.reconstruir(self)
+
+    def _compactar_filas(self):
+        """Copia las filas vivas a unas propias: deja de compartir y descarta las muertas."""
+        nombres = self.nombres()
+        matriz, normas = self._vectores(self._filas_vivas())
+        self._indice = self._indice.vacio()
+        self._nuevas_filas(nombres, matriz, normas)
+
+    def _modificar(self, cantidad_nueva):
+        """
+        Prepara una modificacion que agrega `cantidad_nueva` filas: si otra
+        version ya escribio en las filas compartidas (esta no es la punta) o
+        si la mitad de las filas estan muertas y hay que crecer, compacta.
+        Retorna la version de la modificacion.
+        """
+        f = self._filas
+        requerida = self._n + cantidad_nueva
+        if f.punta != self.version or (requerida > f.ids.shape[0] and self._vivas < self._n - self._vivas):
+            self._compactar_filas()
+            f = self._filas
+        f.asegurar_capacidad(self._n, requerida)
+        self.version += 1
+        f.punta = self.version
+        self._muertas = None
+        return self.version
+
+    def _agregar_filas(self, usuario_id, encodings):
+        f = self._filas
+        inicio, fin = self._n, self._n + encodings.shape[0]
+        f.cola_matriz[inicio - f.n_base:fin - f.n_base] = encodings
+        f.cola_normas[inicio - f.n_base:fin - f.n_base] = np.einsum('ij,ij->i', encodings, encodings)
+        f.ids[inicio:fin] = usuario_id
+        f.filas_por_usuario.setdefault(usuario_id, []).extend(range(inicio, fin))
+        self._n = fin
+        self._vivas += encodings.shape[0]
+        self._indice.agregar_filas(self, inicio, fin)
+
+    def _eliminar_filas(self, filas):
+        if filas.shape[0] == 0:
+            return
+        self._filas.muerte[filas] = self.version
+        self._vivas -= filas.shape[0]
+        self._indice.filas_eliminadas(self, filas)
+
+    def _cambiar_usuario(self, usuario_id, encodings, reemplazar):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dimension)
+        anteriores = self._filas_de(usuario_id)
+        if encodings.shape[0] == 0 and (not reemplazar or anteriores.shape[0] == 0):
+            return
+        self._modificar(encodings.shape[0])
+        if reemplazar:
+            self._eliminar_filas(self._filas_de(usuario_id))
+        if encodings.shape[0]:
+            self._agregar_filas(usuario_id, encodings)
+        existia, existe = anteriores.shape[0] > 0, usuario_id in self
+        self._usuarios += int(existe) - int(existia)
+        self._indice.usuarios_modificados(self, [usuario_id])
+
+    def agregar(self, usuario_id, encodings):
+        """Agrega uno o mas encodings para un usuario."""
+        with self._lock:
+            self._cambiar_usuario(usuario_id, encodings, reemplazar=False)
+
+    def reemplazar_usuario(self, usuario_id, encodings):
+        """Reemplaza todos los encodings de un usuario por los nuevos."""
+        with self._lock:
+            self._cambiar_usuario(usuario_id, encodings, reemplazar=True)
+
+    def eliminar_usuario(self, usuario_id):
+        """Elimina todos los encodings de un usuario."""
+        with self._lock:
+            self._cambiar_usuario(usuario_id, (), reemplazar=True)
+
+    def instantanea(self):
+        """Copia consistente de (nombres, encodings, normas) para persistencia."""
+        vivas = self._filas_vivas()
+        matriz, normas = self._vectores(vivas)
+        return list(self._filas.ids[vivas]), matriz, normas
+
+    def adoptar(self, nombres, matriz, normas):
+        """
+        Usa directamente las matrices dadas (por ejemplo un np.memmap) sin
+        copiarlas. Las filas que se agreguen despues van a memoria propia;
+        las adoptadas nunca se copian.
+        """
+        with self._lock:
+            self._nuevas_filas(list(nombres), matriz, normas)
+
+    def cargar(self, nombres, encodings):
+        """Reemplaza el contenido completo de la galeria."""
+        with self._lock:
+            encodings = np.array(encodings, dtype=np.float32).reshape(-1, self.dimension)
+            self._nuevas_filas(list(nombres), encodings, np.einsum('ij,ij->i', encodings, encodings))
@@ -0,0 +1,87 @@
+"""
+Configuracion de gunicorn para produccion
+    gunicorn -c gunicorn.conf.py reconocimiento:app
+
+Con preload_app el maestro importa reconocimiento una sola vez: los modelos
+de dlib (se cargan al importar face_recognition) y la galeria (np.memmap)
+quedan en memoria antes del fork y los workers comparten esas paginas por
+copia-en-escritura. Lo que no sobrevive a un fork (pool de procesos,
+conexion SQLite, hilos) se crea en cada worker con iniciar_servicio().
+
+Cada worker aplica cada GALERIA_REFRESCO_SEGUNDOS los cambios que los demas
+escribieron en la galeria (/train, sincronizacion, enrolamiento): no hace
+falta reiniciar al cambiar la galeria. Solo un worker (el lider) sincroniza
+con el backend y envia la cola de marcajes. `kill -HUP <pid del maestro>`
+reemplaza los workers de forma ordenada; los nuevos parten de la galeria
+en disco.
+
+Con TRABAJADORES > 0 cada worker tiene su propio pool: en total se crean
+GUNICORN_WORKERS x TRABAJADORES procesos de deteccion. Con 0 (el valor por
+defecto fuera de docker-compose) cada imagen se procesa en el hilo de su
+peticion y /train y /train-bulk no procesan sus imagenes en paralelo.
+
+Lo que sigue siendo de cada worker:
+  - Metricas: /metrics muestra los contadores e histogramas del worker que
+    atendio el scrape (serie proceso_info{pid, lider}), no la suma de todos.
+    Para medir el servicio completo usar GUNICORN_WORKERS=1, o sumar por
+    pid sabiendo que cada scrape ve un solo worker. El estado de la
+    sincronizacion si es comun: el lider lo guarda junto a la galeria
+    (<galeria>.sync-estado) y todos lo reportan en /health y /metrics.
+  - Cache de marcajes (MARCAJE_CACHE_TTL_SEGUNDOS) y de resultados: un
+    usuario cuyos frames caen en workers distintos puede marcar una vez por
+    worker dentro de la ventana.
+  - Control de admision y planificador: los limites son por worker.
+  - Memoria compartida: las filas de la instantanea (np.memmap) se
+    comparten entre workers y nunca se copian; los cambios posteriores
+    (/train, sincronizacion, refresco) agregan filas en memoria propia de
+    cada worker. Cuando otro proceso compacta, el worker recarga la
+    instantanea nueva y vuelve a compartir todo.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PUERTO', '5000')}"
+
+# Procesos que atienden peticiones e hilos por proceso
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+worker_class = 'gthread'
+
+# Segundos sin responder antes de reiniciar un worker / para terminar las peticiones en curso
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+
+# Segundos que se mantiene abierta una conexion keep-alive (kioscos que envian frames seguidos)
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+# Conexiones en espera de ser aceptadas
+backlog = int(os.environ.get('GUNICORN_BACKLOG', '256'))
+
+# Reemplazar cada worker despues de N peticiones (0 = nunca)
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+preload_app = True
+
+# Las peticiones ya quedan en /metrics; los errores de gunicorn van a stderr
+accesslog = None
+errorlog = '-'
+loglevel = os.environ.get('LOG_NIVEL', 'info').lower()
+
+
+def when_ready(server):
+    # Registros de la carga en el maestro (galeria, migracion): escribirlos una sola vez
+    from bitacora import escribir_pendientes
+    escribir_pendientes()
+
+
+def post_fork(server, worker):
+    import reconocimiento
+    reconocimiento.iniciar_servicio()
+
+
+def worker_exit(server, worker):
+    import reconocimiento
+    from bitacora import detener_logging
+    reconocimiento.detener_servicio()
+    detener_logging()
@@ -0,0 +1,207 @@
+"""
+Decodificacion de imagenes recibidas por la API
+Acepta data URLs base64 (JSON) o bytes crudos (multipart / image/jpeg)
+"""
+
+import base64
+import struct
+import cv2
+import numpy as np
+from flask import request
+
+
+def imagen_bytes_a_array(img_bytes):
+    """
+    Decodifica una imagen desde un buffer (bytes, bytearray o memoryview)
+    sin copiarlo antes de cv2.imdecode.
+    """
+    try:
+        img_array = np.frombuffer(img_bytes, dtype=np.uint8)
+        
+        # Decodificar imagen
+        frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        
+        if frame is None:
+            raise ValueError("No se pudo decodificar la imagen")
+        
+        return frame
+    except Exception as e:
+        raise ValueError(f"Error decodificando imagen: {e}")
+
+
+def base64_a_bytes(imagen_base64):
+    """Bytes de una imagen en base64, con o sin prefijo data:image."""
+    try:
+        # Eliminar prefijo data:image si existe
+        if ',' in imagen_base64:
+            imagen_base64 = imagen_base64.split(',')[1]
+        
+        # Decodificar base64
+        return base64.b64decode(imagen_base64)
+    except Exception as e:
+        raise ValueError(f"Error decodificando imagen: {e}")
+
+
+def imagen_base64_a_array(imagen_base64):
+    """Convierte una imagen base64 a array numpy para OpenCV."""
+    return imagen_bytes_a_array(base64_a_bytes(imagen_base64))
+
+
+def decodificar_imagen(imagen):
+    """Decodifica una imagen en base64 (str) o en bytes crudos."""
+    if isinstance(imagen, str):
+        return imagen_base64_a_array(imagen)
+    return imagen_bytes_a_array(imagen)
+
+
+# Marcadores SOF de JPEG que llevan el alto y el ancho (todos menos DHT, JPG y DAC)
+_MARCADORES_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Reduccion nativa del decodificador JPEG (1/2, 1/4, 1/8 con escalado DCT)
+_LECTURAS_REDUCIDAS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+    (1, cv2.IMREAD_COLOR),
+)
+
+
+def dimensiones_imagen(datos):
+    """
+    (alto, ancho) leidos de la cabecera JPEG o PNG, sin decodificar la imagen.
+    Retorna None si el formato no se reconoce.
+    """
+    datos = memoryview(datos).cast('B')
+    if bytes(datos[:8]) == b'\x89PNG\r\n\x1a\n' and len(datos) >= 24:
+        ancho, alto = struct.unpack_from('>II', datos, 16)
+        return alto, ancho
+    if bytes(datos[:2]) != b'\xff\xd8':
+        return None
+    posicion = 2
+    while posicion + 4 <= len(datos):
+        if datos[posicion] != 0xFF:
+            return None
+        marcador = datos[posicion + 1]
+        if marcador == 0xFF:
+            # Byte de relleno antes del marcador
+            posicion += 1
+            continue
+        if marcador in (0x01, 0xD8) or 0xD0 <= marcador <= 0xD7:
+            posicion += 2
+            continue
+        (largo,) = struct.unpack_from('>H', datos, posicion + 2)
+        if marcador in _MARCADORES_SOF:
+            if posicion + 9 > len(datos):
+                return None
+            alto, ancho = struct.unpack_from('>HH', datos, posicion + 5)
+            return alto, ancho
+        posicion += 2 + largo
+    return None
+
+
+def huella_imagen(imagen, lado=16):
+    """
+    Huella perceptual (dHash) de la imagen: gris reducido a lado x (lado+1)
+    y un bit por par de pixeles vecinos (el de la derecha es mas claro).
+    Retorna lado*lado/8 bytes. Decodifica a 1/8 del tamaño, es muy barata.
+    """
+    datos = base64_a_bytes(imagen) if isinstance(imagen, str) else imagen
+    gris = cv2.imdecode(np.frombuffer(datos, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gris is None:
+        raise ValueError("Error decodificando imagen: No se pudo decodificar la imagen")
+    reducida = cv2.resize(gris, (lado + 1, lado), interpolation=cv2.INTER_AREA)
+    return np.packbits(reducida[:, 1:] > reducida[:, :-1]).tobytes()
+
+
+def decodificar_imagen_rgb(imagen, escala_de=None):
+    """
+    Decodifica una imagen (base64 o bytes) directamente a RGB a la escala
+    pedida, sin construir el frame completo cuando no hace falta.
+
+    `escala_de(alto, ancho)` retorna la escala deseada a partir de las
+    dimensiones originales (leidas de la cabecera). El decodificador JPEG
+    reduce 1/2, 1/4 u 1/8 mientras decodifica; el resto de la escala se
+    aplica con un resize pequeño y la conversion a RGB se hace en el mismo
+    buffer.
+
+    Retorna (rgb, forma_original) con forma_original = (alto, ancho) de la
+    imagen completa, para llevar las ubicaciones de vuelta.
+    """
+    datos = base64_a_bytes(imagen) if isinstance(imagen, str) else imagen
+    dimensiones = dimensiones_imagen(datos)
+    buffer = np.frombuffer(datos, dtype=np.uint8)
+
+    if escala_de is None:
+        escala = 1.0
+    elif dimensiones is None:
+        # Formato sin cabecera conocida: decodificar completo y escalar despues
+        escala = None
+    else:
+        escala = escala_de(*dimensiones)
+
+    lectura = cv2.IMREAD_COLOR
+    if escala is not None:
+        # La mayor reduccion que no deja la imagen por debajo de la escala pedida
+        for factor, bandera in _LECTURAS_REDUCIDAS:
+            if escala * factor <= 1.0:
+                lectura = bandera
+                break
+
+    try:
+        decodificada = cv2.imdecode(buffer, lectura)
+    except Exception as e:
+        raise ValueError(f"Error decodificando imagen: {e}")
+    if decodificada is None:
+        raise ValueError("Error decodificando imagen: No se pudo decodificar la imagen")
+
+    if dimensiones is None:
+        dimensiones = decodificada.shape[:2]
+        escala = escala_de(*dimensiones) if escala_de is not None else 1.0
+    alto, ancho = dimensiones
+    # La orientacion EXIF puede rotar la imagen decodificada
+    if (decodificada.shape[0] > decodificada.shape[1]) != (alto > ancho):
+        alto, ancho = ancho, alto
+
+    destino = (max(1, int(round(ancho * escala))), max(1, int(round(alto * escala))))
+    if (decodificada.shape[1], decodificada.shape[0]) != destino:
+        interpolacion = cv2.INTER_AREA if destino[0] < decodificada.shape[1] else cv2.INTER_LINEAR
+        decodificada = cv2.resize(decodificada, destino, interpolation=interpolacion)
+
+    # BGR -> RGB sobre el mismo buffer, sin otra copia
+    cv2.cvtColor(decodificada, cv2.COLOR_BGR2RGB, dst=decodificada)
+    return decodificada, (alto, ancho)
+
+
+def leer_buffer_archivo(archivo):
+    """Buffer de un archivo multipart sin copia cuando Werkzeug lo tiene en memoria."""
+    stream = archivo.stream
+    if hasattr(stream, 'getbuffer'):
+        return stream.getbuffer()
+    return stream.read()
+
+
+def obtener_imagenes_request():
+    """
+    Extrae las imagenes y los parametros de la peticion. Soporta:
+      - application/json con "image" / "imagenes" en base64 (formato original)
+      - multipart/form-data con archivos "image" / "imagenes" y campos de formulario
+      - cuerpo crudo image/jpeg o image/png con los parametros en la query string
+    Retorna (imagenes, datos): imagenes es una lista de str base64 o buffers binarios.
+    """
+    tipo_contenido = request.mimetype or ''
+    
+    if tipo_contenido.startswith('image/'):
+        return [request.get_data(cache=False)], request.args.to_dict()
+    
+    if tipo_contenido == 'multipart/form-data':
+        datos = request.args.to_dict()
+        datos.update(request.form.to_dict())
+        archivos = request.files.getlist('imagenes') or request.files.getlist('image')
+        return [leer_buffer_archivo(archivo) for archivo in archivos], datos
+    
+    datos = request.get_json(silent=True) or {}
+    if 'imagenes' in datos and isinstance(datos['imagenes'], list):
+        return datos['imagenes'], datos
+    if 'image' in datos:
+        return [datos['image']], datos
+    return [], datos
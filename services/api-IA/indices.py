@@ -0,0 +1,484 @@
+"""
+Indices de busqueda para la galeria de rostros
+Busqueda exacta, prefiltro por centroide de usuario e IVF en NumPy puro para galerias grandes
+"""
+
+import copy
+import os
+import numpy as np
+
+# Configuracion del indice (ver crear_indice)
+INDICE_GALERIA = os.environ.get('INDICE_GALERIA', 'auto')
+IVF_MIN_ENTRENAMIENTO = int(os.environ.get('IVF_MIN_ENTRENAMIENTO', '20000'))
+IVF_LISTAS = int(os.environ.get('IVF_LISTAS', '0'))
+IVF_SONDEOS = int(os.environ.get('IVF_SONDEOS', '8'))
+CENTROIDES_CANDIDATOS = int(os.environ.get('CENTROIDES_CANDIDATOS', '8'))
+# Con 'auto', filas desde las que conviene el prefiltro por centroide (debajo, fuerza bruta)
+CENTROIDES_MIN_FILAS = int(os.environ.get('CENTROIDES_MIN_FILAS', '4000'))
+# Fraccion de las filas a revisar desde la que una consulta usa la pasada exacta
+CENTROIDES_FRACCION_EXACTA = float(os.environ.get('CENTROIDES_FRACCION_EXACTA', '0.2'))
+
+# Version de muerte de una fila (o de un centroide) que sigue vivo
+VIVA = np.iinfo(np.int64).max
+
+
+def _distancias_filas(galeria, filas, consulta):
+    """Distancias exactas entre una consulta y un subconjunto de filas."""
+    matriz, normas = galeria._vectores(filas)
+    d2 = matriz @ consulta
+    d2 *= -2.0
+    d2 += normas
+    d2 += consulta @ consulta
+    np.maximum(d2, 0.0, out=d2)
+    return np.sqrt(d2, out=d2)
+
+
+def _k_menores(distancias, k):
+    """Posiciones de los k valores menores, ordenadas."""
+    if k < distancias.shape[0]:
+        posiciones = np.argpartition(distancias, k - 1)[:k]
+    else:
+        posiciones = np.arange(distancias.shape[0])
+    return posiciones[np.argsort(distancias[posiciones])]
+
+
+class IndiceExacto:
+    """
+    Comparacion contra todas las filas de la galeria (una multiplicacion de matrices).
+
+    Cada version de la galeria tiene su indice (`derivar`). Las filas nunca
+    se mueven: se agregan al final y las eliminadas quedan marcadas en la
+    galeria, de modo que un indice derivado puede compartir los arreglos del
+    anterior y solo escribir mas alla de lo que el anterior ve.
+    """
+
+    nombre = 'exacto'
+
+    def vacio(self):
+        """Nuevo indice vacio con la misma configuracion."""
+        return IndiceExacto()
+
+    def derivar(self):
+        """Indice para una version derivada de la galeria (sin estado: el mismo)."""
+        return self
+
+    def reconstruir(self, galeria):
+        pass
+
+    def agregar_filas(self, galeria, inicio, fin):
+        pass
+
+    def filas_eliminadas(self, galeria, filas):
+        pass
+
+    def usuarios_modificados(self, galeria, usuarios):
+        pass
+
+    def buscar(self, galeria, consultas, k):
+        """
+        Retorna (filas, distancias) de tamaño M x k' con k' = min(k, N),
+        ordenadas por distancia. Se llama sin lock sobre la galeria publicada,
+        desde varios hilos a la vez: no modifica el indice salvo contadores y
+        caches que toleran esas carreras.
+        """
+        d = galeria.distancias(consultas)
+        m, n = d.shape
+        # Las filas eliminadas estan en infinito: nunca entran si kk <= filas vivas
+        kk = min(k, len(galeria))
+        if kk == 0:
+            return np.empty((m, 0), dtype=np.int64), d
+        if kk < n:
+            filas = np.argpartition(d, kk - 1, axis=1)[:, :kk]
+        else:
+            filas = np.broadcast_to(np.arange(n), (m, n))
+        cercanas = np.take_along_axis(d, filas, axis=1)
+        orden = np.argsort(cercanas, axis=1)
+        return (np.take_along_axis(filas, orden, axis=1),
+                np.take_along_axis(cercanas, orden, axis=1))
+
+    def estadisticas(self):
+        return {'tipo': self.nombre}
+
+
+class IndiceIVF(IndiceExacto):
+    """
+    Indice de archivo invertido (IVF): agrupa los encodings con k-means y en
+    cada busqueda solo revisa las listas de los centroides mas cercanos,
+    calculando distancias exactas sobre esos candidatos.
+
+    Mientras la galeria tenga menos de `min_entrenamiento` filas se comporta
+    como busqueda exacta. Las filas nuevas se asignan incrementalmente a su
+    centroide mas cercano y los centroides se reentrenan cuando la galeria
+    duplica el tamaño con que fueron entrenados. Reentrenar crea arreglos
+    nuevos: las versiones anteriores siguen con los suyos.
+    """
+
+    nombre = 'ivf'
+
+    def __init__(self, listas=IVF_LISTAS, sondeos=IVF_SONDEOS,
+                 min_entrenamiento=IVF_MIN_ENTRENAMIENTO, iteraciones=10, semilla=0):
+        self.listas = listas
+        self.sondeos = sondeos
+        self.min_entrenamiento = min_entrenamiento
+        self.iteraciones = iteraciones
+        self.semilla = semilla
+        self._centroides = None
+        self._asignacion = np.empty(0, dtype=np.int32)
+        self._n = 0
+        self._n_entrenado = 0
+        self._listas = None
+
+    def vacio(self):
+        return IndiceIVF(self.listas, self.sondeos, self.min_entrenamiento,
+                         self.iteraciones, self.semilla)
+
+    def derivar(self):
+        return copy.copy(self)
+
+    @property
+    def entrenado(self):
+        return self._centroides is not None
+
+    def _asegurar_capacidad(self, requerida):
+        if requerida <= self._asignacion.shape[0]:
+            return
+        nueva = np.empty(max(requerida, self._asignacion.shape[0] * 2), dtype=np.int32)
+        nueva[:self._n] = self._asignacion[:self._n]
+        self._asignacion = nueva
+
+    def _asignar(self, vectores, normas):
+        """Centroide mas cercano para cada vector."""
+        c = self._centroides
+        d2 = vectores @ c.T
+        d2 *= -2.0
+        d2 += (c * c).sum(axis=1)
+        d2 += normas[:, None]
+        return np.argmin(d2, axis=1).astype(np.int32)
+
+    def _entrenar(self, galeria):
+        vivas = galeria._filas_vivas()
+        n = vivas.shape[0]
+        listas = self.listas or max(1, int(4 * np.sqrt(n)))
+        listas = min(listas, n)
+        rng = np.random.default_rng(self.semilla)
+
+        # k-means sobre una muestra acotada
+        tam_muestra = min(n, max(listas * 64, 10000))
+        muestra, normas_muestra = galeria._vectores(np.sort(vivas[rng.choice(n, tam_muestra, replace=False)]))
+        centroides = muestra[rng.choice(tam_muestra, listas, replace=False)].copy()
+        self._centroides = centroides
+        for _ in range(self.iteraciones):
+            asignacion = self._asignar(muestra, normas_muestra)
+            sumas = np.zeros_like(centroides)
+            np.add.at(sumas, asignacion, muestra)
+            conteos = np.bincount(asignacion, minlength=listas)
+            llenos = conteos > 0
+            centroides[llenos] = sumas[llenos] / conteos[llenos, None]
+
+        # Arreglo nuevo: las versiones anteriores siguen leyendo el suyo
+        self._asignacion = np.empty(max(galeria._n, 1), dtype=np.int32)
+        for inicio, matriz, normas in galeria._bloques():
+            self._asignacion[inicio:inicio + matriz.shape[0]] = self._asignar(matriz, normas)
+        self._n = galeria._n
+        self._n_entrenado = n
+        self._listas = None
+
+    def reconstruir(self, galeria):
+        self._centroides = None
+        self._asignacion = np.empty(0, dtype=np.int32)
+        self._n = galeria._n
+        self._n_entrenado = 0
+        self._listas = None
+        if len(galeria) >= self.min_entrenamiento:
+            self._entrenar(galeria)
+
+    def agregar_filas(self, galeria, inicio, fin):
+        self._listas = None
+        if not self.entrenado or len(galeria) >= 2 * self._n_entrenado:
+            self._n = fin
+            if len(galeria) >= self.min_entrenamiento:
+                self._entrenar(galeria)
+            return
+        self._asegurar_capacidad(fin)
+        self._asignacion[inicio:fin] = self._asignar(*galeria._vectores(np.arange(inicio, fin)))
+        self._n = fin
+
+    def filas_eliminadas(self, galeria, filas):
+        self._listas = None
+
+    def _ordenar_listas(self, galeria):
+        """
+        Listas invertidas contiguas (orden, inicios) de las filas vivas,
+        reconstruidas solo si hubo cambios. Se guardan en un solo atributo
+        porque las busquedas concurrentes pueden llegar aqui a la vez sin lock.
+        """
+        listas = self._listas
+        if listas is None:
+            vivas = galeria._filas_vivas()
+            asignacion = self._asignacion[vivas]
+            conteos = np.bincount(asignacion, minlength=self._centroides.shape[0])
+            listas = self._listas = (
+                vivas[np.argsort(asignacion, kind='stable')], np.concatenate(([0], np.cumsum(conteos)))
+            )
+        return listas
+
+    def buscar(self, galeria, consultas, k):
+        if not self.entrenado or len(galeria) == 0:
+            return super().buscar(galeria, consultas, k)
+        orden, inicios = self._ordenar_listas(galeria)
+
+        m = consultas.shape[0]
+        sondeos = min(self.sondeos, self._centroides.shape[0])
+        normas_consultas = np.einsum('ij,ij->i', consultas, consultas)
+        d_centroides = consultas @ self._centroides.T
+        d_centroides *= -2.0
+        d_centroides += (self._centroides * self._centroides).sum(axis=1)
+        d_centroides += normas_consultas[:, None]
+        sondeadas = np.argpartition(d_centroides, sondeos - 1, axis=1)[:, :sondeos]
+
+        kk = min(k, len(galeria))
+        filas = np.full((m, kk), -1, dtype=np.int64)
+        distancias = np.full((m, kk), np.inf, dtype=np.float32)
+        for i in range(m):
+            candidatos = np.concatenate([
+                orden[inicios[lista]:inicios[lista + 1]]
+                for lista in sondeadas[i]
+            ])
+            if candidatos.shape[0] == 0:
+                continue
+            d = _distancias_filas(galeria, candidatos, consultas[i])
+            mejores = _k_menores(d, kk)
+            filas[i, :mejores.shape[0]] = candidatos[mejores]
+            distancias[i, :mejores.shape[0]] = d[mejores]
+        return filas, distancias
+
+    def estadisticas(self):
+        return {
+            'tipo': self.nombre,
+            'entrenado': self.entrenado,
+            'listas': 0 if self._centroides is None else int(self._centroides.shape[0]),
+            'sondeos': self.sondeos
+        }
+
+
+class IndiceCentroides(IndiceExacto):
+    """
+    Busqueda en dos etapas sobre un centroide por usuario:
+      1. Compara la consulta contra el centroide de cada usuario.
+      2. Re-ordena con distancias exactas contra los encodings de los
+         usuarios candidatos.
+
+    Cada usuario guarda el radio de sus encodings respecto al centroide, asi
+    que d(q, centroide) - radio es una cota inferior de la distancia a
+    cualquiera de sus encodings. Se revisan todos los usuarios cuya cota quede
+    bajo la k-esima mejor distancia encontrada (o bajo `cota`), por lo que
+    todo vecino con distancia menor a `cota` es exacto. Sobre `cota` solo se
+    garantiza que el resultado pertenece a los usuarios revisados.
+
+    Si esos usuarios suman mas de `fraccion_exacta` de las filas (un rostro
+    desconocido queda cerca de muchos centroides), la consulta se resuelve
+    con la pasada exacta: juntar tantas filas sueltas cuesta mas que recorrer
+    la matriz completa.
+
+    Mientras la galeria tenga menos de `min_filas` filas busca por fuerza
+    bruta, que con pocas filas es mas rapida que las dos etapas; los
+    centroides se mantienen igual para no reconstruirlos al cruzar el umbral.
+    """
+
+    nombre = 'centroides'
+
+    def __init__(self, candidatos=CENTROIDES_CANDIDATOS, cota=float('inf'), capacidad=256, min_filas=0,
+                 fraccion_exacta=CENTROIDES_FRACCION_EXACTA):
+        self.candidatos = candidatos
+        self.cota = cota
+        self.min_filas = min_filas
+        self.fraccion_exacta = fraccion_exacta
+        self._capacidad = capacidad
+        self._iniciar(capacidad, 0)
+        self.filas_revisadas = 0
+        self.busquedas_exactas = 0
+
+    def _iniciar(self, capacidad, dimension):
+        """Arreglos nuevos (no compartidos con versiones anteriores)."""
+        self._centroides = np.empty((capacidad, dimension), dtype=np.float32)
+        self._normas = np.empty(capacidad, dtype=np.float32)
+        self._radios = np.empty(capacidad, dtype=np.float32)
+        self._usuarios = np.empty(capacidad, dtype=object)
+        # Filas vivas del usuario cuando se calculo el centroide (no cambian mientras este vivo)
+        self._miembros = np.empty(capacidad, dtype=object)
+        self._cantidades = np.zeros(capacidad, dtype=np.int64)
+        self._muerte = np.full(capacidad, VIVA, dtype=np.int64)
+        self._posicion = {}
+        self._u = 0
+        self._vivos = 0
+        self._muertos = None
+
+    def vacio(self):
+        return IndiceCentroides(self.candidatos, self.cota, min_filas=self.min_filas,
+                                fraccion_exacta=self.fraccion_exacta)
+
+    def derivar(self):
+        return copy.copy(self)
+
+    def _asegurar_capacidad(self, requerida, galeria):
+        """
+        Deja lugar para `requerida` centroides. Al crecer se copian solo los
+        vivos a arreglos nuevos: las versiones anteriores siguen con los suyos.
+        """
+        if requerida <= self._usuarios.shape[0] and self._centroides.shape[1] == galeria.dimension:
+            return
+        vivos = np.flatnonzero(self._muerte[:self._u] > galeria.version)
+        anteriores = (self._centroides, self._normas, self._radios, self._usuarios,
+                      self._miembros, self._cantidades)
+        self._iniciar(max(requerida - self._u + vivos.shape[0], 2 * vivos.shape[0], self._capacidad),
+                      galeria.dimension)
+        u = vivos.shape[0]
+        if anteriores[0].shape[1] == galeria.dimension:
+            self._centroides[:u] = anteriores[0][vivos]
+        self._normas[:u] = anteriores[1][vivos]
+        self._radios[:u] = anteriores[2][vivos]
+        self._usuarios[:u] = anteriores[3][vivos]
+        self._miembros[:u] = anteriores[4][vivos]
+        self._cantidades[:u] = anteriores[5][vivos]
+        self._posicion = {usuario_id: posicion for posicion, usuario_id in enumerate(self._usuarios[:u])}
+        self._u = self._vivos = u
+
+    def _actualizar(self, galeria, usuario_id):
+        """
+        El centroide anterior del usuario se marca muerto en esta version y,
+        si le quedan encodings, se agrega uno nuevo al final.
+        """
+        self._muertos = None
+        anterior = self._posicion.pop(usuario_id, None)
+        if anterior is not None:
+            self._muerte[anterior] = galeria.version
+            self._vivos -= 1
+        filas = galeria._filas_de(usuario_id)
+        if filas.shape[0] == 0:
+            return
+        miembros = galeria._vectores(filas)[0]
+        centroide = miembros.mean(axis=0)
+        # Margen para absorber el redondeo de float32 y mantener la cota valida
+        radio = float(np.sqrt(((miembros - centroide) ** 2).sum(axis=1)).max()) + 1e-4
+        self._asegurar_capacidad(self._u + 1, galeria)
+        posicion = self._u
+        self._centroides[posicion] = centroide
+        self._normas[posicion] = centroide @ centroide
+        self._radios[posicion] = radio
+        self._usuarios[posicion] = usuario_id
+        self._miembros[posicion] = filas
+        self._cantidades[posicion] = filas.shape[0]
+        self._muerte[posicion] = VIVA
+        self._posicion[usuario_id] = posicion
+        self._u += 1
+        self._vivos += 1
+
+    def reconstruir(self, galeria):
+        self._iniciar(max(galeria.total_usuarios(), self._capacidad), galeria.dimension)
+        for usuario_id in list(galeria._filas.filas_por_usuario):
+            self._actualizar(galeria, usuario_id)
+
+    def usuarios_modificados(self, galeria, usuarios):
+        for usuario_id in usuarios:
+            self._actualizar(galeria, usuario_id)
+
+    def _centroides_muertos(self, galeria):
+        """Centroides reemplazados o eliminados que esta version todavia recorre."""
+        muertos = self._muertos
+        if muertos is None:
+            muertos = self._muertos = np.flatnonzero(self._muerte[:self._u] <= galeria.version)
+        return muertos
+
+    def _filas_de_usuarios(self, posiciones):
+        """Filas de todos los usuarios dados (posiciones de centroide) en una sola concatenacion."""
+        if posiciones.shape[0] == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(self._miembros[posiciones])
+
+    def buscar(self, galeria, consultas, k):
+        if self._vivos == 0 or len(galeria) < max(1, self.min_filas):
+            return super().buscar(galeria, consultas, k)
+
+        m = consultas.shape[0]
+        u = self._u
+        kk = min(k, len(galeria))
+        limite_filas = self.fraccion_exacta * len(galeria)
+
+        # Etapa 1: distancia a los centroides y cota inferior por usuario
+        d2 = consultas @ self._centroides[:u].T
+        d2 *= -2.0
+        d2 += self._normas[:u]
+        d2 += np.einsum('ij,ij->i', consultas, consultas)[:, None]
+        np.maximum(d2, 0.0, out=d2)
+        cotas = np.sqrt(d2, out=d2)
+        cotas -= self._radios[:u]
+        cotas[:, self._centroides_muertos(galeria)] = np.inf
+
+        # Los muertos estan en infinito: no entran mientras c <= vivos
+        c = min(self.candidatos, self._vivos)
+        if c < u:
+            primeros = np.argpartition(cotas, c - 1, axis=1)[:, :c]
+        else:
+            primeros = np.broadcast_to(np.arange(u), (m, u))
+
+        filas = np.full((m, kk), -1, dtype=np.int64)
+        distancias = np.full((m, kk), np.inf, dtype=np.float32)
+        exactas = []
+        for i in range(m):
+            # Etapa 2: re-ranking exacto de los candidatos y de todos los
+            # usuarios cuya cota quede bajo la k-esima distancia (o bajo `cota`).
+            # Revisar mas usuarios solo baja la k-esima, asi que basta una pasada.
+            filas_i = self._filas_de_usuarios(primeros[i])
+            d_i = _distancias_filas(galeria, filas_i, consultas[i])
+            kesima = np.partition(d_i, kk - 1)[kk - 1] if d_i.shape[0] >= kk else np.inf
+            pendientes = cotas[i] < min(kesima, self.cota)
+            pendientes[primeros[i]] = False
+            pendientes = np.flatnonzero(pendientes)
+            if filas_i.shape[0] + self._cantidades[pendientes].sum() > limite_filas:
+                exactas.append(i)
+                continue
+            if pendientes.shape[0]:
+                filas_extra = self._filas_de_usuarios(pendientes)
+                filas_i = np.concatenate((filas_i, filas_extra))
+                d_i = np.concatenate((d_i, _distancias_filas(galeria, filas_extra, consultas[i])))
+            self.filas_revisadas += filas_i.shape[0]
+
+            mejores = _k_menores(d_i, kk)
+            filas[i, :mejores.shape[0]] = filas_i[mejores]
+            distancias[i, :mejores.shape[0]] = d_i[mejores]
+
+        if exactas:
+            self.busquedas_exactas += len(exactas)
+            self.filas_revisadas += len(exactas) * len(galeria)
+            filas[exactas], distancias[exactas] = super().buscar(galeria, consultas[exactas], k)
+        return filas, distancias
+
+    def estadisticas(self):
+        return {
+            'tipo': self.nombre,
+            'usuarios': int(self._vivos),
+            'candidatos': self.candidatos,
+            'min_filas': self.min_filas,
+            'filas_revisadas': int(self.filas_revisadas),
+            'busquedas_exactas': int(self.busquedas_exactas)
+        }
+
+
+def crear_indice(tipo=INDICE_GALERIA, cota=float('inf')):
+    """
+    Crea el indice configurado:
+      - 'exacto': siempre fuerza bruta
+      - 'centroides': prefiltro por centroide de usuario con re-ranking
+        exacto (mismo resultado que fuerza bruta bajo `cota`)
+      - 'auto': fuerza bruta hasta CENTROIDES_MIN_FILAS filas, luego centroides
+      - 'ivf': fuerza bruta hasta IVF_MIN_ENTRENAMIENTO filas, luego IVF aproximado
+    """
+    if tipo == 'exacto':
+        return IndiceExacto()
+    if tipo == 'centroides':
+        return IndiceCentroides(cota=cota)
+    if tipo == 'auto':
+        return IndiceCentroides(cota=cota, min_filas=CENTROIDES_MIN_FILAS)
+    if tipo == 'ivf':
+        return IndiceIVF()
+    raise ValueError(f"Tipo de indice desconocido: {tipo}")
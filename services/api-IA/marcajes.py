@@ -0,0 +1,215 @@
+"""
+Registro de marcajes en el backend
+Envio directo por la sesion compartida o, en modo asincrono, una cola durable
+en SQLite que se vacia en lotes con reintentos y backoff exponencial.
+"""
+
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from bitacora import campos
+
+log = logging.getLogger(__name__)
+
+# Encolar los marcajes y responder sin esperar al backend
+MARCAJES_ASINCRONOS = os.environ.get('MARCAJES_ASINCRONOS', 'false').lower() == 'true'
+
+# Base de datos de la cola de marcajes pendientes
+RUTA_COLA_MARCAJES = os.environ.get('RUTA_COLA_MARCAJES', 'marcajes_pendientes.db')
+
+# Marcajes por envio y cada cuantos segundos se vacia la cola
+MARCAJES_LOTE = int(os.environ.get('MARCAJES_LOTE', '50'))
+MARCAJES_INTERVALO_SEGUNDOS = float(os.environ.get('MARCAJES_INTERVALO_SEGUNDOS', '1'))
+
+# Espera maxima entre reintentos de un marcaje
+MARCAJES_BACKOFF_MAX_SEGUNDOS = float(os.environ.get('MARCAJES_BACKOFF_MAX_SEGUNDOS', '60'))
+
+# Token compartido con el backend; sin el, el backend registra los marcajes en cola con su propia hora
+TOKEN_SERVICIO_INTERNO = os.environ.get('TOKEN_SERVICIO_INTERNO', '')
+
+
+def nuevo_marcaje(usuario_id, confianza, tipo='entrada'):
+    """
+    Datos de un marcaje con su clave de idempotencia y la hora del
+    reconocimiento (el backend la usa si el envio llega tarde).
+    """
+    return {
+        'usuarioId': usuario_id,
+        'confianza': float(confianza),
+        'tipo': tipo,
+        'fecha': datetime.now(timezone.utc).isoformat(),
+        'claveIdempotencia': uuid.uuid4().hex
+    }
+
+
+def enviar_marcaje(sesion, backend_url, marcaje, timeout):
+    """POST de un marcaje; retorna la respuesta de requests."""
+    return sesion.post(
+        f"{backend_url}/marcajes/reconocimiento",
+        json=marcaje,
+        headers={'Idempotency-Key': marcaje['claveIdempotencia']},
+        timeout=timeout
+    )
+
+
+class ColaMarcajes:
+    """
+    Cola durable de marcajes pendientes.
+
+    `encolar` escribe el marcaje en SQLite (confirmado en disco) y retorna;
+    un hilo envia los pendientes en lotes a /marcajes/reconocimiento/lote.
+    Los que fallan por red o 5xx se reintentan con backoff exponencial y
+    jitter; los que el backend rechaza (4xx) se descartan. Como cada
+    marcaje lleva su clave de idempotencia, reenviar un lote cuya
+    respuesta se perdio no duplica marcajes.
+
+    El backend solo respeta la hora de reconocimiento de cada marcaje si
+    el lote trae `token` (X-Token-Servicio); sin el usa la hora de llegada.
+    """
+
+    def __init__(self, ruta, sesion, backend_url, timeout, lote=MARCAJES_LOTE,
+                 intervalo=MARCAJES_INTERVALO_SEGUNDOS, backoff_max=MARCAJES_BACKOFF_MAX_SEGUNDOS,
+                 token=TOKEN_SERVICIO_INTERNO):
+        self.sesion = sesion
+        self.backend_url = backend_url
+        self.timeout = timeout
+        self.lote = lote
+        self.intervalo = intervalo
+        self.backoff_max = backoff_max
+        self.cabeceras = {'X-Token-Servicio': token} if token else {}
+
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute('PRAGMA journal_mode=WAL')
+        self._conexion.execute('PRAGMA synchronous=FULL')
+        self._conexion.execute(
+            'CREATE TABLE IF NOT EXISTS marcajes ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' clave TEXT UNIQUE NOT NULL,'
+            ' datos TEXT NOT NULL,'
+            ' intentos INTEGER NOT NULL DEFAULT 0,'
+            ' proximo_intento REAL NOT NULL)'
+        )
+
+        self.enviados = 0
+        self.rechazados = 0
+        self.fallos = 0
+        self.ultimo_error = None
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def encolar(self, marcaje):
+        with self._lock:
+            self._conexion.execute(
+                'INSERT OR IGNORE INTO marcajes (clave, datos, proximo_intento) VALUES (?, ?, ?)',
+                (marcaje['claveIdempotencia'], json.dumps(marcaje), time.time())
+            )
+
+    def pendientes(self):
+        with self._lock:
+            return self._conexion.execute('SELECT COUNT(*) FROM marcajes').fetchone()[0]
+
+    def _tomar_lote(self):
+        with self._lock:
+            return self._conexion.execute(
+                'SELECT id, datos, intentos FROM marcajes WHERE proximo_intento <= ? ORDER BY id LIMIT ?',
+                (time.time(), self.lote)
+            ).fetchall()
+
+    def _reprogramar(self, filas):
+        ahora = time.time()
+        with self._lock:
+            self._conexion.executemany(
+                'UPDATE marcajes SET intentos = ?, proximo_intento = ? WHERE id = ?',
+                [
+                    (intentos + 1,
+                     ahora + min(self.backoff_max, self.intervalo * 2 ** intentos) * random.uniform(0.5, 1.0),
+                     id_fila)
+                    for id_fila, _, intentos in filas
+                ]
+            )
+
+    def _eliminar(self, ids):
+        with self._lock:
+            self._conexion.executemany('DELETE FROM marcajes WHERE id = ?', [(i,) for i in ids])
+
+    def vaciar_lote(self):
+        """
+        Envia un lote de pendientes. Retorna True si el lote se proceso
+        completo y conviene seguir con el siguiente.
+        """
+        filas = self._tomar_lote()
+        if not filas:
+            return False
+        marcajes = [json.loads(datos) for _, datos, _ in filas]
+        try:
+            respuesta = self.sesion.post(
+                f"{self.backend_url}/marcajes/reconocimiento/lote",
+                json={'marcajes': marcajes},
+                headers=self.cabeceras,
+                timeout=self.timeout
+            )
+            if respuesta.status_code != 200:
+                raise RuntimeError(f"Backend respondio {respuesta.status_code}")
+            resultados = {r.get('claveIdempotencia'): r for r in respuesta.json().get('resultados', [])}
+        except Exception as e:
+            self.fallos += 1
+            self.ultimo_error = str(e)
+            self._reprogramar(filas)
+            log.warning("No se pudieron enviar %d marcajes: %s", len(filas), e)
+            return False
+
+        terminados, reintentar = [], []
+        for fila, marcaje in zip(filas, marcajes):
+            resultado = resultados.get(marcaje['claveIdempotencia'])
+            if resultado is None or resultado.get('status', 500) >= 500:
+                reintentar.append(fila)
+                continue
+            terminados.append(fila[0])
+            if resultado.get('success'):
+                self.enviados += 1
+            else:
+                self.rechazados += 1
+                log.error("Marcaje rechazado por el backend: %s", resultado.get('message'), extra=campos(
+                    usuario_id=marcaje.get('usuarioId'), clave=marcaje['claveIdempotencia']
+                ))
+        self._eliminar(terminados)
+        if reintentar:
+            self._reprogramar(reintentar)
+        self.ultimo_error = None
+        return not reintentar
+
+    def iniciar(self):
+        if self._hilo is not None:
+            return
+
+        def ciclo():
+            while not self._detener.wait(self.intervalo):
+                try:
+                    while self.vaciar_lote():
+                        pass
+                except Exception as e:
+                    log.exception("Error vaciando cola de marcajes: %s", e)
+
+        self._hilo = threading.Thread(target=ciclo, name='cola-marcajes', daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def estado(self):
+        """Resumen de la cola para /health."""
+        return {
+            'pendientes': self.pendientes(),
+            'enviados': self.enviados,
+            'rechazados': self.rechazados,
+            'fallos_envio': self.fallos,
+            'ultimo_error': self.ultimo_error
+        }
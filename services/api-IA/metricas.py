@@ -0,0 +1,197 @@
+"""
+Metricas del servicio en el formato de texto de Prometheus
+Contadores, medidores e histogramas con etiquetas. Registrar un valor es un
+lock y una suma (el histograma ademas una busqueda binaria en sus limites),
+asi que la instrumentacion queda activa en produccion.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Content-Type de la respuesta de /metrics
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Limites por defecto para latencias (segundos)
+LIMITES_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(nombres, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _formatear_numero(valor):
+    if isinstance(valor, float):
+        if math.isinf(valor):
+            return '+Inf' if valor > 0 else '-Inf'
+        if math.isnan(valor):
+            return 'NaN'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Registro:
+    """Conjunto de metricas que se exponen juntas. Una metrica con el mismo nombre reemplaza a la anterior."""
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica):
+        with self._lock:
+            self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def exponer(self):
+        """Texto de todas las metricas en el formato de exposicion de Prometheus."""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            muestras = metrica.muestras()
+            if not muestras:
+                continue
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(muestras)
+        return '\n'.join(lineas) + '\n'
+
+
+REGISTRO = Registro()
+
+
+class _Metrica:
+    """
+    Base de las metricas. Los valores se guardan por tupla de valores de
+    etiquetas. Con `funcion` el valor se lee al exponer: puede retornar un
+    numero (sin etiquetas), un dict {tupla de etiquetas: numero} o None
+    para omitir la metrica.
+    """
+
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=(), funcion=None, registro=REGISTRO):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.funcion = funcion
+        self._valores = {}
+        self._lock = threading.Lock()
+        if registro is not None:
+            registro.registrar(self)
+
+    def _clave(self, etiquetas):
+        if len(etiquetas) != len(self.etiquetas):
+            raise ValueError(f"{self.nombre} espera las etiquetas {self.etiquetas}")
+        return tuple(str(etiquetas[n]) for n in self.etiquetas)
+
+    def valores(self):
+        if self.funcion is None:
+            with self._lock:
+                return dict(self._valores)
+        valor = self.funcion()
+        if valor is None:
+            return {}
+        return valor if isinstance(valor, dict) else {(): valor}
+
+    def muestras(self):
+        return [
+            f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_formatear_numero(valor)}"
+            for clave, valor in sorted(self.valores().items()) if valor is not None
+        ]
+
+
+class Contador(_Metrica):
+    """Valor que solo aumenta (peticiones, errores, rostros reconocidos...)."""
+
+    tipo = 'counter'
+
+    def inc(self, valor=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+
+class Medidor(_Metrica):
+    """Valor que sube y baja (tamaño de la galeria, profundidad de una cola...)."""
+
+    tipo = 'gauge'
+
+    def fijar(self, valor, **etiquetas):
+        with self._lock:
+            self._valores[self._clave(etiquetas)] = valor
+
+
+class Histograma(_Metrica):
+    """
+    Histograma con limites fijos. `resumen()` retorna los conteos
+    acumulados por limite ('+Inf' incluye todo), la suma y la cantidad
+    para /health; `cronometrar()` observa la duracion de un bloque.
+    """
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, limites=LIMITES_LATENCIA, etiquetas=(), registro=REGISTRO):
+        super().__init__(nombre, ayuda, etiquetas, registro=registro)
+        self.limites = tuple(sorted(limites))
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        indice = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._valores.get(clave)
+            if serie is None:
+                # [conteos por limite + el de +Inf, suma, cantidad]
+                serie = self._valores[clave] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def cronometrar(self, **etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def _copia(self):
+        with self._lock:
+            return {clave: (list(conteos), suma, cantidad) for clave, (conteos, suma, cantidad) in self._valores.items()}
+
+    def resumen(self, **etiquetas):
+        conteos, suma, cantidad = self._copia().get(
+            self._clave(etiquetas), ([0] * (len(self.limites) + 1), 0.0, 0)
+        )
+        acumulado = 0
+        cubetas = {}
+        for limite, conteo in zip(self.limites + ('+Inf',), conteos):
+            acumulado += conteo
+            cubetas[str(limite)] = acumulado
+        return {'cubetas': cubetas, 'suma': round(suma, 4), 'cantidad': cantidad}
+
+    def muestras(self):
+        lineas = []
+        for clave, (conteos, suma, cantidad) in sorted(self._copia().items()):
+            acumulado = 0
+            for limite, conteo in zip(self.limites + (math.inf,), conteos):
+                acumulado += conteo
+                le = f'le="{_formatear_numero(float(limite))}"'
+                lineas.append(f"{self.nombre}_bucket{_formatear_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+            etiquetas = _formatear_etiquetas(self.etiquetas, clave)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {_formatear_numero(float(suma))}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {cantidad}")
+        return lineas
+
+
+def exponer():
+    """Texto de las metricas del registro global."""
+    return REGISTRO.exponer()
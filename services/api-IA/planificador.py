@@ -0,0 +1,147 @@
+"""
+Planificador de micro-lotes para el reconocimiento
+Junta las peticiones que llegan dentro de una ventana corta y las procesa como
+un solo lote (una busqueda en la galeria para todos los rostros).
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from metricas import Histograma, Medidor
+from trabajadores import ColaLlena
+
+# Ventana para juntar peticiones en un lote (0 = sin planificador)
+PLANIFICADOR_VENTANA_MS = float(os.environ.get('PLANIFICADOR_VENTANA_MS', '0'))
+
+# Tamaño maximo de un lote y de la cola de espera
+PLANIFICADOR_MAX_LOTE = int(os.environ.get('PLANIFICADOR_MAX_LOTE', '8'))
+PLANIFICADOR_MAX_COLA = int(os.environ.get('PLANIFICADOR_MAX_COLA', '64'))
+
+# Segundos que una peticion espera su resultado (cola + lote) antes de abandonarlo
+PLANIFICADOR_ESPERA_SEGUNDOS = float(os.environ.get('PLANIFICADOR_ESPERA_SEGUNDOS', '30'))
+
+
+class PlanificadorLotes:
+    """
+    Un hilo toma la primera peticion de la cola y espera hasta `ventana_ms`
+    (o hasta completar `max_lote`) por mas peticiones; luego llama a
+    `procesar_lote(elementos)`, que retorna un resultado por elemento, y
+    entrega cada resultado a su peticion.
+
+    Un elemento que falla (por ejemplo, una imagen corrupta) viene como
+    una excepcion en su posicion y solo esa peticion la recibe; el resto
+    del lote no se vuelve a procesar. Si `procesar_lote` lanza, el error
+    es de todo el lote y llega a todas sus peticiones.
+
+    Una peticion espera su resultado a lo sumo `espera` segundos; si se
+    agota, abandona el elemento (se descarta si aun no entro a un lote)
+    y recibe ColaLlena.
+    """
+
+    def __init__(self, procesar_lote, ventana_ms=PLANIFICADOR_VENTANA_MS,
+                 max_lote=PLANIFICADOR_MAX_LOTE, max_cola=PLANIFICADOR_MAX_COLA,
+                 espera=PLANIFICADOR_ESPERA_SEGUNDOS):
+        self.procesar_lote = procesar_lote
+        self.ventana = ventana_ms / 1000.0
+        self.max_lote = max_lote
+        self.espera = espera
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._hilo = None
+        self._detener = threading.Event()
+
+        limites_lote = [n for n in (1, 2, 4, 8, 16, 32, 64) if n < max_lote] + [max_lote]
+        self.tamanos_lote = Histograma(
+            'planificador_tamano_lote', 'Peticiones procesadas por lote', limites_lote
+        )
+        self.profundidad_cola = Histograma(
+            'planificador_profundidad_cola', 'Peticiones en cola al tomar un lote', [0, 1, 2, 4, 8, 16, 32, 64]
+        )
+        self.espera_segundos = Histograma(
+            'planificador_espera_segundos', 'Espera en cola antes de entrar a un lote',
+            [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0]
+        )
+        Medidor('planificador_en_cola', 'Peticiones esperando en la cola del planificador',
+                funcion=self._cola.qsize)
+
+    def iniciar(self):
+        if self._hilo is not None:
+            return
+        self._hilo = threading.Thread(target=self._ciclo, name='planificador-lotes', daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def enviar(self, elemento, espera=None):
+        """
+        Encola un elemento y espera su resultado (o su excepcion) hasta
+        `espera` segundos (por defecto y como maximo el configurado).
+        """
+        espera = self.espera if espera is None else min(espera, self.espera)
+        futuro = Future()
+        try:
+            self._cola.put_nowait((elemento, futuro, time.perf_counter()))
+        except queue.Full:
+            raise ColaLlena(f"Cola del planificador llena ({self._cola.maxsize} pendientes)")
+        try:
+            return futuro.result(timeout=espera)
+        except TimeoutError:
+            # Si todavia no entro a un lote, el ciclo lo descarta al tomarlo
+            futuro.cancel()
+            raise ColaLlena(f"Sin resultado del planificador en {espera:.1f}s")
+
+    def _tomar_lote(self):
+        """Bloquea hasta la primera peticion y junta las que lleguen dentro de la ventana."""
+        try:
+            lote = [self._cola.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        self.profundidad_cola.observar(self._cola.qsize())
+        limite = time.perf_counter() + self.ventana
+        while len(lote) < self.max_lote:
+            restante = limite - time.perf_counter()
+            try:
+                lote.append(self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _ciclo(self):
+        while not self._detener.is_set():
+            lote = self._tomar_lote()
+            if not lote:
+                continue
+            # Descartar los que su peticion ya abandono por tiempo
+            lote = [item for item in lote if item[1].set_running_or_notify_cancel()]
+            if not lote:
+                continue
+            ahora = time.perf_counter()
+            self.tamanos_lote.observar(len(lote))
+            for _, _, encolado in lote:
+                self.espera_segundos.observar(ahora - encolado)
+
+            try:
+                resultados = self.procesar_lote([elemento for elemento, _, _ in lote])
+            except Exception as e:
+                for _, futuro, _ in lote:
+                    futuro.set_exception(e)
+                continue
+            for (_, futuro, _), resultado in zip(lote, resultados):
+                if isinstance(resultado, Exception):
+                    futuro.set_exception(resultado)
+                else:
+                    futuro.set_result(resultado)
+
+    def estado(self):
+        """Profundidad actual de la cola e histogramas para /health."""
+        return {
+            'ventana_ms': round(self.ventana * 1000, 2),
+            'max_lote': self.max_lote,
+            'en_cola': self._cola.qsize(),
+            'tamanos_lote': self.tamanos_lote.resumen(),
+            'profundidad_cola': self.profundidad_cola.resumen(),
+            'espera_segundos': self.espera_segundos.resumen()
+        }
@@ -3,15 +3,35 @@ API de Reconoc  imiento Facial - Sistema de Asistencia
 Servicio Flask que procesa imagenes, reconoce rostros y se comunica con el backend
 """
 
+import fcntl
+import functools
+import logging
 import os
 import pickle
-import base64
-import cv2
+import threading
+import time
 import numpy as np
-import face_recognition
-import requests
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
+# Los modulos del servicio importan face_recognition recien al detectar: aqui se
+# carga dlib al importar el servicio, antes del fork de los workers de gunicorn
+import face_recognition  # noqa: F401
+
+from admision import ADMISION_MAX_EN_CURSO, ControlAdmision, PeticionRechazada
+from almacen import AlmacenGaleria
+from bitacora import LOG_MUESTREO_FRAMES, campos, configurar_logging, iniciar_logging
+from caches import CacheHuellas, CacheTTL
+from cliente_backend import BACKEND_TIMEOUT_SEGUNDOS, crear_sesion
+from codificacion import codificar_encoding
+from detectores import detectores_en_uso, estadisticas_detectores
+from galeria import GaleriaRostros
+from imagenes import huella_imagen, obtener_imagenes_request
+from indices import crear_indice
+from marcajes import MARCAJES_ASINCRONOS, RUTA_COLA_MARCAJES, ColaMarcajes, enviar_marcaje, nuevo_marcaje
+from metricas import TIPO_CONTENIDO, Contador, Histograma, Medidor, exponer
+from planificador import PLANIFICADOR_VENTANA_MS, PlanificadorLotes
+from sincronizacion import SincronizadorEncodings
+from trabajadores import TRABAJADORES, ColaLlena, PoolTrabajadores, detectar_y_codificar, encoding_de_registro
 
 # ==========================================
 # CONFIGURACION
@@ -20,227 +40,682 @@ from flask_cors import CORS
 app = Flask(__name__)
 CORS(app)
 
+# Los registros se encolan desde ya; el hilo que los escribe arranca en main
+configurar_logging()
+log = logging.getLogger('reconocimiento')
+
 # URLs de servicios
 BACKEND_URL = os.environ.get('BACKEND_URL', 'http://api-backend:3000/api/v1')
 
-# Archivo para almacenar encodings
+# Sincronizacion periodica con el backend (0 = desactivada)
+SYNC_INTERVALO_SEGUNDOS = float(os.environ.get('SYNC_INTERVALO_SEGUNDOS', '60'))
+SYNC_JITTER_SEGUNDOS = float(os.environ.get('SYNC_JITTER_SEGUNDOS', '10'))
+
+# Detector de rostros por endpoint: hog, cnn, haar, auto (hog -> cnn) o auto-haar (haar -> cnn)
+DETECTOR_RECONOCIMIENTO = os.environ.get('DETECTOR_RECONOCIMIENTO', 'cnn')
+DETECTOR_ENTRENAMIENTO = os.environ.get('DETECTOR_ENTRENAMIENTO', 'hog')
+
+# Rostro mas pequeño a detectar, como fraccion del lado menor de la imagen.
+# Define la escala de deteccion segun la resolucion de entrada (ver detectores.py)
+FRACCION_ROSTRO_RECONOCIMIENTO = float(os.environ.get('FRACCION_ROSTRO_RECONOCIMIENTO', '0.15'))
+FRACCION_ROSTRO_ENTRENAMIENTO = float(os.environ.get('FRACCION_ROSTRO_ENTRENAMIENTO', '0.2'))
+
+# Ventana en que un usuario ya marcado no vuelve a marcar el mismo tipo (0 = desactivado)
+MARCAJE_CACHE_TTL_SEGUNDOS = float(os.environ.get('MARCAJE_CACHE_TTL_SEGUNDOS', '60'))
+MARCAJE_CACHE_CAPACIDAD = int(os.environ.get('MARCAJE_CACHE_CAPACIDAD', '4096'))
+
+# Cache de resultados por huella perceptual de la imagen (TTL 0 = desactivada,
+# por defecto). Solo la usa /recognize: una huella parecida no prueba que sea
+# la misma persona, asi que /recognize-and-mark siempre reconoce la imagen.
+# La tolerancia es en bits sobre una huella de 256 bits
+RESULTADOS_CACHE_TTL_SEGUNDOS = float(os.environ.get('RESULTADOS_CACHE_TTL_SEGUNDOS', '0'))
+RESULTADOS_CACHE_CAPACIDAD = int(os.environ.get('RESULTADOS_CACHE_CAPACIDAD', '512'))
+RESULTADOS_CACHE_TOLERANCIA = int(os.environ.get('RESULTADOS_CACHE_TOLERANCIA', '6'))
+
+# Imagenes maximas (sumando todos los usuarios) por peticion a /train-bulk
+REGISTRO_LOTE_MAX_IMAGENES = int(os.environ.get('REGISTRO_LOTE_MAX_IMAGENES', '500'))
+
+# Distancia maxima para considerar un rostro como reconocido
+UMBRAL_DISTANCIA = 0.6
+
+# Archivos para almacenar encodings (rostros_conocidos.gal + rostros_conocidos.wal)
+RUTA_GALERIA = "rostros_conocidos"
+
+# Formato antiguo (pickle), solo se lee para migrar
 DATOS_ROSTROS = "rostros_conocidos.dat"
 
+# Cada cuanto se revisa si otro proceso (otro worker, enrolamiento) cambio la galeria en disco
+GALERIA_REFRESCO_SEGUNDOS = float(os.environ.get('GALERIA_REFRESCO_SEGUNDOS', '2'))
+
 # Cargar rostros conocidos al iniciar
-nombres_conocidos = []
-encodings_conocidos = []
+galeria = GaleriaRostros(indice=crear_indice(cota=UMBRAL_DISTANCIA))
+almacen = AlmacenGaleria(RUTA_GALERIA, dimension=galeria.dimension)
+
+if almacen.existe():
+    almacen.cargar(galeria)
+    log.info("Se cargaron %d rostros conocidos", len(galeria))
+else:
+    try:
+        with open(DATOS_ROSTROS, "rb") as f:
+            datos_guardados = pickle.load(f)
+            galeria.cargar(datos_guardados['nombres'], datos_guardados['encodings'])
+        almacen.compactar(galeria)
+        log.info("Se migraron %d rostros conocidos desde %s", len(galeria), DATOS_ROSTROS)
+    except (FileNotFoundError, EOFError):
+        log.info("No se encontro archivo de datos. Empezando desde cero")
+
+# Pool de procesos para detectar y codificar (se crea en iniciar_servicio, antes de los hilos)
+pool_trabajadores = None
+
+# La galeria publicada nunca se modifica: quien escribe (/train, /train-bulk,
+# sincronizacion, refresco desde disco) toma este lock, deriva una version nueva
+# (comparte las filas, O(1)), la modifica y la publica. Los lectores solo leen
+# la referencia global `galeria`, sin locks
+lock_escritura_galeria = threading.Lock()
+
+
+def obtener_galeria():
+    return galeria
+
+
+def publicar_galeria(nueva):
+    """Publica una galeria nueva con un solo intercambio de referencia."""
+    global galeria
+    galeria = nueva
+    invalidar_resultados()
+
+
+# Resultados de imagenes casi identicas (kiosko sin movimiento, reintentos);
+# se invalida con cada cambio de la galeria
+cache_resultados = None
+if RESULTADOS_CACHE_TTL_SEGUNDOS > 0:
+    cache_resultados = CacheHuellas(
+        RESULTADOS_CACHE_CAPACIDAD, RESULTADOS_CACHE_TTL_SEGUNDOS, RESULTADOS_CACHE_TOLERANCIA
+    )
+
+
+def invalidar_resultados():
+    if cache_resultados is not None:
+        cache_resultados.invalidar()
+
+
+# Conexiones keep-alive compartidas por todas las llamadas al backend
+sesion_backend = crear_sesion()
+
+sincronizador = SincronizadorEncodings(
+    BACKEND_URL, almacen, obtener_galeria, publicar_galeria, lock_escritura_galeria,
+    sesion=sesion_backend
+)
+
+# Ultimo marcaje exitoso por (usuario_id, tipo): las repeticiones dentro de la
+# ventana retornan ese resultado sin volver a llamar al backend
+cache_marcajes = None
+if MARCAJE_CACHE_TTL_SEGUNDOS > 0:
+    cache_marcajes = CacheTTL(MARCAJE_CACHE_CAPACIDAD, MARCAJE_CACHE_TTL_SEGUNDOS)
+
+# Marcajes en cola durable (MARCAJES_ASINCRONOS=true); se crea en iniciar_servicio y
+# solo el proceso lider inicia el hilo de envio
+cola_marcajes = None
 
-print("Cargando rostros conocidos...")
-try:
-    with open(DATOS_ROSTROS, "rb") as f:
-        datos_guardados = pickle.load(f)
-        nombres_conocidos = datos_guardados['nombres']
-        encodings_conocidos = datos_guardados['encodings']
-    print(f"Se cargaron {len(nombres_conocidos)} rostros conocidos.")
-except (FileNotFoundError, EOFError):
-    print("No se encontro archivo de datos. Empezando desde cero.")
+# Peticiones de reconocimiento en curso y en espera (ADMISION_MAX_EN_CURSO > 0)
+control_admision = ControlAdmision() if ADMISION_MAX_EN_CURSO > 0 else None
+
+
+# ==========================================
+# METRICAS (expuestas en /metrics)
+# ==========================================
+
+metrica_etapas = Histograma(
+    'reconocimiento_etapa_segundos', 'Latencia de cada etapa (decodificar, detectar, codificar, emparejar, marcaje)',
+    etiquetas=('etapa',)
+)
+metrica_rostros_por_frame = Histograma(
+    'reconocimiento_rostros_por_frame', 'Rostros detectados por imagen', (0, 1, 2, 3, 4, 6, 8, 12, 16)
+)
+metrica_rostros = Contador(
+    'reconocimiento_rostros_total', 'Rostros por resultado (reconocido, desconocido)', etiquetas=('resultado',)
+)
+metrica_frames = Contador(
+    'reconocimiento_frames_total', 'Imagenes por resultado (procesada, cache, rechazada, error)',
+    etiquetas=('resultado',)
+)
+metrica_peticiones = Contador(
+    'http_peticiones_total', 'Peticiones HTTP por ruta y codigo', etiquetas=('ruta', 'metodo', 'codigo')
+)
+metrica_duracion_peticiones = Histograma(
+    'http_peticion_segundos', 'Duracion de las peticiones HTTP', etiquetas=('ruta', 'metodo')
+)
+
+# Con gunicorn cada worker tiene sus propias metricas y /metrics responde el
+# worker que atiende el scrape: esta serie indica cual fue (ver gunicorn.conf.py)
+Medidor(
+    'proceso_info', 'Worker que respondio el scrape', etiquetas=('pid', 'lider'),
+    funcion=lambda: {(str(os.getpid()), str(_archivo_lider is not None).lower()): 1}
+)
+Medidor('galeria_encodings', 'Encodings en la galeria', funcion=lambda: len(galeria))
+Medidor('galeria_usuarios', 'Usuarios en la galeria', funcion=lambda: galeria.total_usuarios())
+Medidor(
+    'sincronizacion_segundos_desde_ultima', 'Segundos desde la ultima sincronizacion exitosa',
+    funcion=lambda: sincronizador.segundos_desde_sync()
+)
+Medidor(
+    'sincronizacion_con_error', '1 si la ultima sincronizacion fallo',
+    funcion=lambda: int(sincronizador.con_error())
+)
+
+
+def _por_detector(leer):
+    return lambda: {(nombre,): leer(d.estadisticas) for nombre, d in detectores_en_uso().items()}
+
+
+Contador('detector_llamadas_total', 'Llamadas a cada detector', ('detector',),
+         funcion=_por_detector(lambda e: e.llamadas))
+Contador('detector_segundos_total', 'Segundos acumulados en cada detector', ('detector',),
+         funcion=_por_detector(lambda e: e.total_segundos))
+Contador('detector_rostros_total', 'Rostros encontrados por cada detector', ('detector',),
+         funcion=_por_detector(lambda e: e.rostros))
+
+
+def _por_cache(campo):
+    def leer():
+        caches = {'marcajes': cache_marcajes, 'resultados': cache_resultados}
+        return {(nombre,): cache.estadisticas()[campo] for nombre, cache in caches.items() if cache is not None}
+    return leer
+
+
+Contador('cache_aciertos_total', 'Aciertos de cada cache', ('cache',), funcion=_por_cache('aciertos'))
+Contador('cache_fallos_total', 'Fallos de cada cache', ('cache',), funcion=_por_cache('fallos'))
+Medidor('cache_entradas', 'Entradas vigentes en cada cache', ('cache',), funcion=_por_cache('entradas'))
+
+# El pool y la cola de marcajes se crean despues de importar: leerlos al exponer
+Medidor('trabajadores_pendientes', 'Imagenes en espera o en proceso en el pool',
+        funcion=lambda: pool_trabajadores.pendientes if pool_trabajadores is not None else None)
+Contador('trabajadores_rechazadas_total', 'Imagenes rechazadas por cola llena',
+         funcion=lambda: pool_trabajadores.rechazadas if pool_trabajadores is not None else None)
+
+Medidor('cola_marcajes_pendientes', 'Marcajes esperando envio al backend',
+        funcion=lambda: cola_marcajes.pendientes() if cola_marcajes is not None else None)
+Contador('cola_marcajes_enviados_total', 'Marcajes entregados al backend',
+         funcion=lambda: cola_marcajes.enviados if cola_marcajes is not None else None)
+Contador('cola_marcajes_fallos_total', 'Intentos de envio fallidos',
+         funcion=lambda: cola_marcajes.fallos if cola_marcajes is not None else None)
+
+
+@app.before_request
+def iniciar_cronometro():
+    g.inicio_peticion = time.perf_counter()
+
+
+@app.after_request
+def registrar_peticion(respuesta):
+    inicio = g.pop('inicio_peticion', None)
+    ruta = request.url_rule.rule if request.url_rule is not None else 'desconocida'
+    metrica_peticiones.inc(ruta=ruta, metodo=request.method, codigo=respuesta.status_code)
+    if inicio is not None:
+        metrica_duracion_peticiones.observar(time.perf_counter() - inicio, ruta=ruta, metodo=request.method)
+    return respuesta
 
 
 # ==========================================
 # FUNCIONES AUXILIARES
 # ==========================================
 
-def guardar_rostros():
-    """Guarda la lista de nombres y encodings en un archivo."""
-    if not nombres_conocidos:
-        print("No hay datos que guardar.")
-        return
-    
-    print(f"Guardando {len(nombres_conocidos)} rostros...")
-    try:
-        with open(DATOS_ROSTROS, "wb") as f:
-            pickle.dump({
-                'nombres': nombres_conocidos,
-                'encodings': encodings_conocidos
-            }, f)
-        print("Datos guardados exitosamente!")
-    except Exception as e:
-        print(f"Error al guardar los datos: {e}")
+def sincronizar_encodings(completa=False):
+    """
+    Sincroniza los encodings locales con los usuarios del backend.
+    Por defecto solo aplica los cambios desde la ultima sincronizacion;
+    con completa=True recarga todos los usuarios.
+    """
+    inicio = time.perf_counter()
+    resumen = sincronizador.sincronizar(completa=completa)
+    # Un solo registro por sincronizacion, con los conteos
+    log.info("Sincronizacion %s", resumen['modo'], extra=campos(
+        actualizados=resumen['actualizados'],
+        eliminados=resumen['eliminados'],
+        errores=resumen['errores'],
+        encodings=len(galeria),
+        usuarios=galeria.total_usuarios(),
+        segundos=round(time.perf_counter() - inicio, 3)
+    ))
+    return resumen
 
 
-def obtener_usuarios_backend():
-    """Obtiene la lista de usuarios activos desde el backend."""
+def registrar_marcaje_backend(usuario_id, confianza, tipo='entrada'):
+    """
+    Registra un marcaje en el backend. En modo asincrono solo lo deja en
+    la cola durable y retorna de inmediato con pendiente=True.
+    La etapa 'marcaje' mide lo que espera la peticion: el POST al backend,
+    o en modo asincrono solo la escritura en la cola.
+    """
+    marcaje = nuevo_marcaje(usuario_id, confianza, tipo)
+    if cola_marcajes is not None:
+        with metrica_etapas.cronometrar(etapa='marcaje'):
+            cola_marcajes.encolar(marcaje)
+        return {
+            "success": True,
+            "pendiente": True,
+            "data": {"claveIdempotencia": marcaje['claveIdempotencia'], "pendiente": True}
+        }
+    
     try:
-        url = f"{BACKEND_URL}/sync-encodings"
-        print(f"🌐 Obteniendo usuarios de: {url}", flush=True)
-        response = requests.get(url, timeout=5)
-        print(f"📡 Status: {response.status_code}", flush=True)
-        
-        if response.status_code == 200:
-            data = response.json()
-            print(f"📦 Data keys: {list(data.keys())}", flush=True)
-            usuarios = data.get('data', [])
-            print(f"👥 Usuarios en response: {len(usuarios)}", flush=True)
-            return usuarios
+        with metrica_etapas.cronometrar(etapa='marcaje'):
+            response = enviar_marcaje(sesion_backend, BACKEND_URL, marcaje, BACKEND_TIMEOUT_SEGUNDOS)
+        
+        if response.status_code in [200, 201]:
+            return response.json()
         else:
-            print(f"❌ Error al obtener usuarios: {response.status_code}", flush=True)
-            return []
+            log.error("Error al registrar marcaje", extra=campos(usuario_id=usuario_id, estado=response.status_code))
+            return {"success": False, "message": "Error en backend"}
     except Exception as e:
-        print(f"❌ Error conectando con backend: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
-        return []
+        log.error("Error registrando marcaje: %s", e, extra=campos(usuario_id=usuario_id))
+        return {"success": False, "message": str(e)}
 
 
-def sincronizar_encodings():
+def marcar_usuario(usuario_id, confianza, tipo='entrada'):
     """
-    Sincroniza los encodings locales con los usuarios del backend.
-    Obtiene usuarios que tienen encodingFacial y los carga en memoria.
+    Registra el marcaje salvo que el mismo usuario ya haya marcado el mismo
+    tipo dentro de MARCAJE_CACHE_TTL_SEGUNDOS; en ese caso retorna el
+    resultado anterior. Retorna (resultado, repetido).
     """
-    global nombres_conocidos, encodings_conocidos
+    if cache_marcajes is None:
+        return registrar_marcaje_backend(usuario_id, confianza, tipo), False
+    return cache_marcajes.obtener_o_calcular(
+        (usuario_id, tipo),
+        lambda: registrar_marcaje_backend(usuario_id, confianza, tipo),
+        guardar_si=lambda resultado: resultado.get('success')
+    )
+
+
+def detectar_rostros(imagenes, retornar_excepciones=False):
+    """
+    Detecta rostros en un lote de imagenes (base64 o bytes) y calcula sus
+    encodings. Retorna por imagen (ubicaciones en coordenadas de la imagen
+    original, encodings).
     
-    print("Sincronizando encodings con backend...", flush=True)
-    usuarios = obtener_usuarios_backend()
-    print(f"Usuarios obtenidos: {len(usuarios)}", flush=True)
+    Cada imagen se decodifica ya reducida a la escala de deteccion (ver
+    trabajadores.py). Con TRABAJADORES > 0 el lote se reparte entre los
+    procesos del pool; la comparacion con la galeria siempre ocurre en este
+    proceso. Con `retornar_excepciones` una imagen que falla deja su
+    excepcion en su posicion en vez de interrumpir el lote.
+    """
+    if pool_trabajadores is not None:
+        resultados = pool_trabajadores.detectar_lote(
+            imagenes, FRACCION_ROSTRO_RECONOCIMIENTO, retornar_excepciones=retornar_excepciones
+        )
+    else:
+        resultados = []
+        for imagen in imagenes:
+            try:
+                resultados.append(
+                    detectar_y_codificar(imagen, DETECTOR_RECONOCIMIENTO, FRACCION_ROSTRO_RECONOCIMIENTO)
+                )
+            except Exception as e:
+                if not retornar_excepciones:
+                    raise
+                resultados.append(e)
+    detecciones = []
+    for resultado in resultados:
+        if isinstance(resultado, Exception):
+            detecciones.append(resultado)
+            continue
+        ubicaciones, encodings, tiempos = resultado
+        for etapa, segundos in tiempos.items():
+            metrica_etapas.observar(segundos, etapa=etapa)
+        detecciones.append((ubicaciones, encodings))
+    return detecciones
+
+
+def codificar_imagenes_registro(imagenes, masivo=False):
+    """
+    Detecta y codifica las imagenes de un registro. Cada imagen debe tener
+    exactamente un rostro. Retorna por imagen (encoding, None) o
+    (None, motivo del error); un error en una imagen no afecta a las demas.
     
-    nombres_nuevos = []
-    encodings_nuevos = []
+    La deteccion se hace a la escala adaptativa y el encoding a resolucion
+    completa. Con TRABAJADORES > 0 las imagenes se procesan en paralelo en
+    el pool (las de `masivo`, dentro del cupo de altas masivas); si no, una
+    tras otra en este hilo.
     
-    for usuario in usuarios:
-        if usuario.get('encodingFacial'):
+    Una imagen sin lugar en la cola se reporta como error de esa imagen; si
+    ninguna consiguio lugar se lanza ColaLlena (503, reintentar).
+    """
+    if pool_trabajadores is not None:
+        resultados = pool_trabajadores.detectar_lote(
+            imagenes, FRACCION_ROSTRO_ENTRENAMIENTO, nombre_detector=DETECTOR_ENTRENAMIENTO,
+            resolucion_completa=True, retornar_excepciones=True, masivo=masivo
+        )
+    else:
+        resultados = []
+        for imagen in imagenes:
             try:
-                # Decodificar encoding desde string (base64 o pickle)
-                encoding_str = usuario['encodingFacial']
-                encoding_bytes = base64.b64decode(encoding_str)
-                encoding = pickle.loads(encoding_bytes)
-                
-                # Usar el ID del usuario como identificador unico
-                usuario_id = str(usuario['_id'])
-                nombres_nuevos.append(usuario_id)
-                encodings_nuevos.append(encoding)
-                print(f"✅ Encoding cargado: {usuario.get('nombre')}", flush=True)
+                resultados.append(detectar_y_codificar(
+                    imagen, DETECTOR_ENTRENAMIENTO, FRACCION_ROSTRO_ENTRENAMIENTO, resolucion_completa=True
+                ))
             except Exception as e:
-                print(f"❌ Error procesando encoding de {usuario.get('nombre')}: {e}", flush=True)
+                resultados.append(e)
+    
+    if resultados and all(isinstance(resultado, ColaLlena) for resultado in resultados):
+        raise resultados[0]
+    return [encoding_de_registro(resultado) for resultado in resultados]
+
+
+def emparejar_encodings(encodings, k=1):
+    """
+    Compara todos los encodings de consulta contra la galeria en una sola
+    operacion matricial. Retorna (ids, distancias) de tamaño M x k.
+    """
+    consultas = np.asarray(encodings, dtype=np.float32).reshape(-1, galeria.dimension)
+    with metrica_etapas.cronometrar(etapa='emparejar'):
+        return galeria.buscar(consultas, k=k)
+
+
+def construir_rostro(ubicacion, usuario_id, distancia):
+    """Arma el diccionario de respuesta para un rostro detectado."""
+    top, right, bottom, left = ubicacion
+    confianza = 0.0
+    nombre = "Desconocido"
     
-    nombres_conocidos = nombres_nuevos
-    encodings_conocidos = encodings_nuevos
+    # Umbral de confianza (0.6 = estricto, 0.7 = moderado)
+    if usuario_id is not None and distancia < UMBRAL_DISTANCIA:
+        confianza = 1.0 - float(distancia)
+        nombre = f"Usuario {usuario_id[:8]}"  # Mostrar primeros 8 chars del ID
+    else:
+        usuario_id = None
     
-    # Guardar en archivo local
-    guardar_rostros()
-    print(f"✅ Sincronizados {len(nombres_conocidos)} encodings", flush=True)
+    return {
+        'usuario_id': usuario_id,
+        'nombre': nombre,
+        'confianza': round(confianza, 3),
+        'reconocido': usuario_id is not None,
+        'bbox': {
+            'left': int(left),
+            'top': int(top),
+            'width': int(right - left),
+            'height': int(bottom - top)
+        }
+    }
 
 
-def registrar_marcaje_backend(usuario_id, confianza, tipo='entrada'):
-    """Registra un marcaje en el backend."""
+def procesar_frames_reconocimiento(imagenes, retornar_excepciones=False):
+    """
+    Procesa un lote de imagenes y reconoce todos sus rostros con una unica
+    busqueda en la galeria. Retorna una lista de rostros por cada imagen
+    (o, con `retornar_excepciones`, la excepcion de la imagen que fallo).
+    """
+    detecciones = detectar_rostros(imagenes, retornar_excepciones)
+    encodings = [
+        enc for deteccion in detecciones if not isinstance(deteccion, Exception) for enc in deteccion[1]
+    ]
+    ids, distancias = emparejar_encodings(encodings, k=1)
+    
+    resultados = []
+    fila = 0
+    for deteccion in detecciones:
+        if isinstance(deteccion, Exception):
+            resultados.append(deteccion)
+            continue
+        ubicaciones, _ = deteccion
+        rostros_detectados = []
+        for ubicacion in ubicaciones:
+            rostros_detectados.append(
+                construir_rostro(ubicacion, ids[fila, 0], distancias[fila, 0])
+            )
+            fila += 1
+        resultados.append(rostros_detectados)
+    
+    return resultados
+
+
+def procesar_frame_reconocimiento(imagen):
+    """
+    Procesa una imagen (base64 o bytes) y reconoce rostros.
+    Retorna lista de rostros detectados con sus datos.
+    """
+    return procesar_frames_reconocimiento([imagen])[0]
+
+
+def reconocer_imagen(imagen, usar_cache=True):
+    """
+    Reconoce los rostros de una imagen. Con la cache de resultados activa y
+    `usar_cache`, si una imagen casi identica se reconocio hace poco (misma
+    huella perceptual, misma galeria) retorna ese resultado sin detectar ni
+    codificar. Con el planificador activo la imagen se junta con las de
+    otras peticiones concurrentes en un lote.
+    """
+    usar_cache = usar_cache and cache_resultados is not None
     try:
-        response = requests.post(
-            f"{BACKEND_URL}/marcajes/reconocimiento",
-            json={
-                "usuarioId": usuario_id,
-                "confianza": float(confianza),
-                "tipo": tipo
-            },
-            timeout=10
-        )
+        if usar_cache:
+            huella = huella_imagen(imagen)
+            generacion = cache_resultados.generacion
+            rostros = cache_resultados.obtener(huella)
+            if rostros is not None:
+                metrica_frames.inc(resultado='cache')
+                return rostros
         
-        if response.status_code in [200, 201]:
-            return response.json()
+        if planificador is not None:
+            rostros = planificador.enviar(imagen)
         else:
-            print(f"Error al registrar marcaje: {response.status_code}")
-            return {"success": False, "message": "Error en backend"}
-    except Exception as e:
-        print(f"Error registrando marcaje: {e}")
-        return {"success": False, "message": str(e)}
+            rostros = procesar_frame_reconocimiento(imagen)
+    except ColaLlena:
+        metrica_frames.inc(resultado='rechazada')
+        raise
+    except Exception:
+        metrica_frames.inc(resultado='error')
+        raise
+    
+    metrica_frames.inc(resultado='procesada')
+    metrica_rostros_por_frame.observar(len(rostros))
+    reconocidos = sum(1 for rostro in rostros if rostro['reconocido'])
+    log.info("Imagen reconocida", extra=campos(
+        rostros=len(rostros), reconocidos=reconocidos, muestreo=LOG_MUESTREO_FRAMES
+    ))
+    if reconocidos:
+        metrica_rostros.inc(reconocidos, resultado='reconocido')
+    if len(rostros) > reconocidos:
+        metrica_rostros.inc(len(rostros) - reconocidos, resultado='desconocido')
+    
+    if usar_cache:
+        cache_resultados.guardar(huella, rostros, generacion)
+    return rostros
+
 
+# Micro-lotes de reconocimiento (PLANIFICADOR_VENTANA_MS > 0); el hilo se inicia en iniciar_servicio
+planificador = None
+if PLANIFICADOR_VENTANA_MS > 0:
+    # Cada imagen del lote recibe su propio resultado o error
+    planificador = PlanificadorLotes(functools.partial(procesar_frames_reconocimiento, retornar_excepciones=True))
 
-def imagen_base64_a_array(imagen_base64):
-    """Convierte una imagen base64 a array numpy para OpenCV."""
+
+# ==========================================
+# INICIO POR PROCESO (main o worker de gunicorn)
+# ==========================================
+
+# Lock de liderazgo tomado por este proceso (None si no es lider)
+_archivo_lider = None
+
+
+def refrescar_galeria():
+    """Publica una galeria nueva con los cambios que otros procesos escribieron en disco."""
+    with lock_escritura_galeria:
+        nueva = almacen.actualizar(galeria)
+        if nueva is not None:
+            publicar_galeria(nueva)
+    if nueva is not None:
+        log.info("Galeria actualizada desde disco", extra=campos(
+            encodings=len(nueva), generacion=almacen.generacion
+        ))
+    return nueva is not None
+
+
+def tomar_liderazgo():
+    """
+    Con varios workers solo uno sincroniza con el backend y envia la cola de
+    marcajes: el que obtiene el flock de <galeria>.lider. Si ese proceso
+    termina, el sistema libera el lock y otro worker lo toma.
+    """
+    global _archivo_lider
+    if _archivo_lider is not None:
+        return True
+    archivo = open(f"{RUTA_GALERIA}.lider", 'a')
     try:
-        # Eliminar prefijo data:image si existe
-        if ',' in imagen_base64:
-            imagen_base64 = imagen_base64.split(',')[1]
-        
-        # Decodificar base64
-        img_bytes = base64.b64decode(imagen_base64)
-        img_array = np.frombuffer(img_bytes, dtype=np.uint8)
-        
-        # Decodificar imagen
-        frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-        
-        if frame is None:
-            raise ValueError("No se pudo decodificar la imagen")
-        
-        return frame
+        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        archivo.close()
+        return False
+    _archivo_lider = archivo
+    return True
+
+
+def _iniciar_tareas_lider():
+    log.info("Proceso lider: sincronizacion y envio de marcajes", extra=campos(pid=os.getpid()))
+    try:
+        sincronizar_encodings()
     except Exception as e:
-        raise ValueError(f"Error decodificando imagen: {e}")
+        log.error("No se pudo sincronizar al inicio: %s", e)
+    sincronizador.iniciar_periodico(SYNC_INTERVALO_SEGUNDOS, SYNC_JITTER_SEGUNDOS)
+    if cola_marcajes is not None:
+        cola_marcajes.iniciar()
+
 
+def _vigilar_galeria():
+    while True:
+        try:
+            if _archivo_lider is None and tomar_liderazgo():
+                _iniciar_tareas_lider()
+            refrescar_galeria()
+        except Exception as e:
+            log.exception("Error revisando la galeria en disco: %s", e)
+        time.sleep(GALERIA_REFRESCO_SEGUNDOS)
 
-def procesar_frame_reconocimiento(frame):
+
+def iniciar_servicio(segundo_plano=True):
     """
-    Procesa un frame y reconoce rostros.
-    Retorna lista de rostros detectados con sus datos.
+    Prepara este proceso para atender peticiones. El pool de trabajadores
+    y la conexion SQLite de la cola de marcajes no sobreviven a un fork:
+    con gunicorn se crean aqui, en cada worker (post_fork), mientras que
+    la galeria y los modelos ya se cargaron en el maestro al importar.
+
+    Con `segundo_plano` inicia el hilo que aplica los cambios de otros
+    procesos a la galeria y que, si este proceso toma el liderazgo,
+    sincroniza con el backend y envia los marcajes en cola.
     """
-    # Redimensionar para acelerar procesamiento
-    rgb_small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-    rgb_small_frame = cv2.cvtColor(rgb_small_frame, cv2.COLOR_BGR2RGB)
-    
-    # Detectar rostros
-    face_locations = face_recognition.face_locations(rgb_small_frame, model="cnn")
-    face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-    
-    rostros_detectados = []
-    
-    for i, face_encoding in enumerate(face_encodings):
-        # Coordenadas del rostro (escaladas de vuelta)
-        top, right, bottom, left = face_locations[i]
-        top *= 4
-        right *= 4
-        bottom *= 4
-        left *= 4
-        
-        # Intentar reconocer
-        usuario_id = None
-        confianza = 0.0
-        nombre = "Desconocido"
-        
-        if len(encodings_conocidos) > 0:
-            # Comparar con rostros conocidos
-            distancias = face_recognition.face_distance(encodings_conocidos, face_encoding)
-            mejor_indice = np.argmin(distancias)
-            mejor_distancia = distancias[mejor_indice]
-            
-            # Umbral de confianza (0.6 = estricto, 0.7 = moderado)
-            if mejor_distancia < 0.6:
-                usuario_id = nombres_conocidos[mejor_indice]
-                confianza = 1.0 - mejor_distancia
-                nombre = f"Usuario {usuario_id[:8]}"  # Mostrar primeros 8 chars del ID
-        
-        rostros_detectados.append({
-            'usuario_id': usuario_id,
-            'nombre': nombre,
-            'confianza': round(confianza, 3),
-            'reconocido': usuario_id is not None,
-            'bbox': {
-                'left': int(left),
-                'top': int(top),
-                'width': int(right - left),
-                'height': int(bottom - top)
-            }
-        })
-    
-    return rostros_detectados
+    global pool_trabajadores, cola_marcajes
+    # Los procesos del pool se crean con fork: antes de iniciar cualquier hilo
+    if TRABAJADORES > 0 and pool_trabajadores is None:
+        pool_trabajadores = PoolTrabajadores(TRABAJADORES, DETECTOR_RECONOCIMIENTO)
+        pool_trabajadores.iniciar()
+    iniciar_logging()
+
+    # Un worker recreado parte de la galeria que el maestro cargo al iniciar
+    refrescar_galeria()
+    if MARCAJES_ASINCRONOS and cola_marcajes is None:
+        cola_marcajes = ColaMarcajes(RUTA_COLA_MARCAJES, sesion_backend, BACKEND_URL, BACKEND_TIMEOUT_SEGUNDOS)
+    if planificador is not None:
+        planificador.iniciar()
+    if segundo_plano:
+        threading.Thread(target=_vigilar_galeria, name='vigilante-galeria', daemon=True).start()
+
+    log.info("API de Reconocimiento Facial iniciada", extra=campos(
+        pid=os.getpid(),
+        backend_url=BACKEND_URL,
+        rostros_cargados=len(galeria),
+        trabajadores=TRABAJADORES,
+        detector=DETECTOR_RECONOCIMIENTO
+    ))
+
+
+def detener_servicio():
+    """Detiene los hilos y el pool de este proceso (worker_exit de gunicorn)."""
+    sincronizador.detener()
+    if planificador is not None:
+        planificador.detener()
+    if cola_marcajes is not None:
+        cola_marcajes.detener()
+    if pool_trabajadores is not None:
+        pool_trabajadores.cerrar()
+
+
+# ==========================================
+# CONTROL DE ADMISION
+# ==========================================
+
+def terminal_de_peticion():
+    """
+    Terminal que envia la peticion: el header X-Terminal-Id o, si no viene,
+    la IP del cliente (la primera de X-Forwarded-For detras del proxy).
+    """
+    terminal = request.headers.get('X-Terminal-Id')
+    if terminal:
+        return terminal
+    reenviada = request.headers.get('X-Forwarded-For')
+    if reenviada:
+        return reenviada.split(',')[0].strip()
+    return request.remote_addr or 'desconocida'
+
+
+def plazo_de_peticion():
+    """Plazo pedido por el cliente en X-Plazo-Ms (None = el configurado)."""
+    try:
+        plazo = float(request.headers['X-Plazo-Ms']) / 1000.0
+    except (KeyError, ValueError):
+        return None
+    return plazo if plazo > 0 else None
+
+
+def con_admision(vista):
+    """Rechaza con 503 + Retry-After las peticiones que no pueden empezar dentro de su plazo."""
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        if control_admision is None:
+            return vista(*args, **kwargs)
+        terminal = terminal_de_peticion()
+        try:
+            with control_admision.admitir(terminal, plazo_de_peticion()):
+                return vista(*args, **kwargs)
+        except PeticionRechazada as e:
+            log.warning("Peticion rechazada por admision", extra=campos(
+                motivo=e.motivo, terminal=terminal, muestreo=LOG_MUESTREO_FRAMES
+            ))
+            return jsonify({
+                'success': False,
+                'message': str(e),
+                'motivo': e.motivo
+            }), 503, {'Retry-After': str(e.reintentar_en)}
+    return envoltura
 
 
 # ==========================================
 # RUTAS DE LA API
 # ==========================================
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Metricas en el formato de texto de Prometheus (latencias por etapa, resultados, galeria, colas)."""
+    return Response(exponer(), content_type=TIPO_CONTENIDO)
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint."""
     return jsonify({
         'status': 'ok',
         'service': 'api-ia-reconocimiento',
-        'rostros_cargados': len(nombres_conocidos)
+        'proceso': {'pid': os.getpid(), 'lider': _archivo_lider is not None},
+        'rostros_cargados': len(galeria),
+        'indice': galeria.estadisticas_indice(),
+        'sincronizacion': sincronizador.estado(),
+        'detectores': estadisticas_detectores(),
+        'trabajadores': pool_trabajadores.estado() if pool_trabajadores is not None else None,
+        'planificador': planificador.estado() if planificador is not None else None,
+        'admision': control_admision.estado() if control_admision is not None else None,
+        'cola_marcajes': cola_marcajes.estado() if cola_marcajes is not None else None,
+        'cache_marcajes': cache_marcajes.estadisticas() if cache_marcajes is not None else None,
+        'cache_resultados': cache_resultados.estadisticas() if cache_resultados is not None else None
     }), 200
 
 
 @app.route('/recognize', methods=['POST'])
+@con_admision
 def recognize():
     """
     Procesa una imagen y reconoce rostros.
@@ -250,6 +725,9 @@ def recognize():
         "image": "data:image/jpeg;base64,..." o base64 directo
     }
     
+    Tambien acepta multipart/form-data (archivo "image") o el JPEG crudo
+    con Content-Type: image/jpeg.
+    
     Respuesta:
     {
         "success": true,
@@ -265,19 +743,16 @@ def recognize():
     }
     """
     try:
-        data = request.get_json()
+        imagenes, _ = obtener_imagenes_request()
         
-        if not data or 'image' not in data:
+        if not imagenes:
             return jsonify({
                 'success': False,
                 'message': 'No se proporciono imagen'
             }), 400
         
-        # Convertir imagen base64 a array
-        frame = imagen_base64_a_array(data['image'])
-        
-        # Procesar reconocimiento
-        rostros = procesar_frame_reconocimiento(frame)
+        # Decodificar (base64 o binaria) y procesar reconocimiento
+        rostros = reconocer_imagen(imagenes[0])
         
         return jsonify({
             'success': True,
@@ -285,13 +760,18 @@ def recognize():
             'total_detectados': len(rostros)
         }), 200
         
+    except ColaLlena as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 503
     except ValueError as e:
         return jsonify({
             'success': False,
             'message': str(e)
         }), 400
     except Exception as e:
-        print(f"Error en /recognize: {e}")
+        log.exception("Error en /recognize: %s", e)
         return jsonify({
             'success': False,
             'message': 'Error procesando imagen'
@@ -299,6 +779,7 @@ def recognize():
 
 
 @app.route('/recognize-and-mark', methods=['POST'])
+@con_admision
 def recognize_and_mark():
     """
     Reconoce rostro y registra marcaje automaticamente en el backend.
@@ -308,19 +789,22 @@ def recognize_and_mark():
         "image": "data:image/jpeg;base64,...",
         "tipo": "entrada" | "salida"  (opcional, default: "entrada")
     }
+    
+    Tambien acepta multipart/form-data (archivo "image" + campo "tipo") o el
+    JPEG crudo con Content-Type: image/jpeg y ?tipo= en la URL.
     """
     try:
-        data = request.get_json()
+        imagenes, data = obtener_imagenes_request()
         
-        if not data or 'image' not in data:
+        if not imagenes:
             return jsonify({
                 'success': False,
                 'message': 'No se proporciono imagen'
             }), 400
         
         tipo_marcaje = data.get('tipo', 'entrada')
-        frame = imagen_base64_a_array(data['image'])
-        rostros = procesar_frame_reconocimiento(frame)
+        # Un marcaje nunca sale de la cache de resultados
+        rostros = reconocer_imagen(imagenes[0], usar_cache=False)
         
         if not rostros:
             return jsonify({
@@ -337,19 +821,21 @@ def recognize_and_mark():
                 'rostro': rostro_principal
             }), 404
         
-        resultado_marcaje = registrar_marcaje_backend(
+        resultado_marcaje, repetido = marcar_usuario(
             rostro_principal['usuario_id'],
             rostro_principal['confianza'],
             tipo_marcaje
         )
         
         if resultado_marcaje.get('success'):
+            # 202: el marcaje quedo en la cola y se enviara al backend en segundo plano
             return jsonify({
                 'success': True,
                 'reconocido': True,
                 'rostro': rostro_principal,
-                'marcaje': resultado_marcaje.get('data', {})
-            }), 200
+                'marcaje': resultado_marcaje.get('data', {}),
+                'marcaje_repetido': repetido
+            }), 202 if resultado_marcaje.get('pendiente') else 200
         else:
             return jsonify({
                 'success': False,
@@ -357,16 +843,20 @@ def recognize_and_mark():
                 'rostro': rostro_principal
             }), 500
         
+    except ColaLlena as e:
+        log.warning("Cola llena en /recognize-and-mark: %s", e, extra=campos(muestreo=LOG_MUESTREO_FRAMES))
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 503
     except ValueError as e:
-        print(f"ValueError en /recognize-and-mark: {e}", flush=True)
+        log.warning("Imagen invalida en /recognize-and-mark: %s", e, extra=campos(muestreo=LOG_MUESTREO_FRAMES))
         return jsonify({
             'success': False,
             'message': str(e)
         }), 400
     except Exception as e:
-        print(f"❌ Error en /recognize-and-mark: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
+        log.exception("Error en /recognize-and-mark: %s", e)
         return jsonify({
             'success': False,
             'message': 'Error procesando solicitud',
@@ -391,14 +881,14 @@ def train():
         "usuario_id": "507f1f77bcf86cd799439011",
         "image": "data:image/jpeg;base64,..."
     }
+    
+    Tambien acepta multipart/form-data con archivos "imagenes" (o "image") y
+    campos usuario_id / nombre, o un JPEG crudo con ?usuario_id= en la URL.
     """
     try:
-        data = request.get_json()
-        print(f"=== TRAIN REQUEST ===")
-        print(f"Data keys: {data.keys() if data else 'None'}")
-        
+        imagenes, data = obtener_imagenes_request()
         if not data or 'usuario_id' not in data:
-            print(f"ERROR: Missing usuario_id. Data: {data}")
+            log.warning("/train sin usuario_id", extra=campos(claves=list(data.keys()) if data else None))
             return jsonify({
                 'success': False,
                 'message': 'Se requiere usuario_id'
@@ -408,63 +898,22 @@ def train():
         nombre = data.get('nombre', usuario_id)
         
         # Soportar formato antiguo (single image) y nuevo (multiple imagenes)
-        imagenes = []
-        if 'imagenes' in data and isinstance(data['imagenes'], list):
-            imagenes = data['imagenes']
-        elif 'image' in data:
-            imagenes = [data['image']]
-        else:
+        if not imagenes:
             return jsonify({
                 'success': False,
                 'message': 'Se requiere al menos una imagen (image o imagenes[])'
             }), 400
         
-        # Procesar todas las imágenes
+        # Procesar todas las imágenes (en paralelo si hay pool de trabajadores)
         nuevos_encodings = []
-        rostros_procesados = 0
         errores = []
         
-        for idx, imagen_b64 in enumerate(imagenes):
-            try:
-                frame = imagen_base64_a_array(imagen_b64)
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Asegurar tamaño mínimo para detección CNN
-                h, w = rgb_frame.shape[:2]
-                print(f"Imagen {idx + 1}: {w}x{h}", flush=True)
-                
-                # Si la imagen es pequeña, aumentar su tamaño
-                if w < 800 or h < 600:
-                    scale_factor = max(800/w, 600/h)
-                    new_w = int(w * scale_factor)
-                    new_h = int(h * scale_factor)
-                    rgb_frame = cv2.resize(rgb_frame, (new_w, new_h))
-                    print(f"Imagen redimensionada a: {new_w}x{new_h}", flush=True)
-                
-                # Usar modelo HOG (más rápido y funciona mejor con imágenes pequeñas)
-                face_locations = face_recognition.face_locations(rgb_frame, model="hog")
-                print(f"Face locations encontradas: {len(face_locations)}", flush=True)
-                
-                if not face_locations:
-                    errores.append(f"Imagen {idx + 1}: No se detectó ningún rostro")
-                    print(f"Imagen {idx + 1}: No se detectó rostro", flush=True)
-                    continue
-                
-                if len(face_locations) > 1:
-                    errores.append(f"Imagen {idx + 1}: Se detectaron múltiples rostros")
-                    print(f"Imagen {idx + 1}: Múltiples rostros detectados: {len(face_locations)}", flush=True)
-                    continue
-                
-                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-                if face_encodings:
-                    nuevos_encodings.append(face_encodings[0])
-                    rostros_procesados += 1
-                    print(f"Imagen {idx + 1}: Encoding generado exitosamente", flush=True)
-                    
-            except Exception as e:
-                print(f"Imagen {idx + 1}: EXCEPCIÓN - {str(e)}", flush=True)
-                errores.append(f"Imagen {idx + 1}: Error - {str(e)}")
+        for idx, (encoding, error) in enumerate(codificar_imagenes_registro(imagenes)):
+            if error is not None:
+                errores.append(f"Imagen {idx + 1}: {error}")
                 continue
+            nuevos_encodings.append(encoding)
+        rostros_procesados = len(nuevos_encodings)
         
         if not nuevos_encodings:
             return jsonify({
@@ -476,32 +925,27 @@ def train():
         # Actualizar o agregar encodings
         # Si ya existe el usuario, reemplazamos todos sus encodings con los nuevos
         # Si es nuevo, agregamos todos
-        if usuario_id in nombres_conocidos:
-            # Eliminar encodings antiguos
-            indices_a_eliminar = [i for i, nombre in enumerate(nombres_conocidos) if nombre == usuario_id]
-            for indice in reversed(indices_a_eliminar):
-                del nombres_conocidos[indice]
-                del encodings_conocidos[indice]
-            print(f"Encodings antiguos eliminados para usuario {usuario_id}")
+        with lock_escritura_galeria:
+            reemplazado = usuario_id in galeria
+            # Solo se anexan los encodings nuevos al WAL; los lectores siguen
+            # con la galeria publicada hasta el intercambio
+            nueva = galeria.derivar()
+            almacen.reemplazar_usuario(nueva, usuario_id, nuevos_encodings)
+            publicar_galeria(nueva)
         
-        # Agregar nuevos encodings
-        for encoding in nuevos_encodings:
-            nombres_conocidos.append(usuario_id)
-            encodings_conocidos.append(encoding)
-        
-        print(f"{len(nuevos_encodings)} encodings agregados para usuario {usuario_id} ({nombre})")
-        
-        guardar_rostros()
+        log.info("Usuario registrado", extra=campos(
+            usuario_id=usuario_id, nombre=nombre, imagenes=len(imagenes),
+            encodings=len(nuevos_encodings), reemplazado=reemplazado, errores=errores or None
+        ))
         
         # Serializar el primer encoding para enviarlo al backend
         encoding_base64 = None
         if nuevos_encodings:
             try:
                 # Tomar el primer encoding (el más representativo)
-                encoding_bytes = pickle.dumps(nuevos_encodings[0])
-                encoding_base64 = base64.b64encode(encoding_bytes).decode('utf-8')
+                encoding_base64 = codificar_encoding(nuevos_encodings[0])
             except Exception as e:
-                print(f"Error serializando encoding: {e}", flush=True)
+                log.error("Error serializando encoding: %s", e, extra=campos(usuario_id=usuario_id))
         
         return jsonify({
             'success': True,
@@ -509,19 +953,22 @@ def train():
             'rostros_procesados': rostros_procesados,
             'encodings_guardados': len(nuevos_encodings),
             'encoding_base64': encoding_base64,
-            'total_rostros_sistema': len(set(nombres_conocidos)),
+            'total_rostros_sistema': galeria.total_usuarios(),
             'errores': errores if errores else None
         }), 200
         
+    except ColaLlena as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 503
     except ValueError as e:
         return jsonify({
             'success': False,
             'message': str(e)
         }), 400
     except Exception as e:
-        print(f"Error en /train: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error en /train: %s", e)
         return jsonify({
             'success': False,
             'message': 'Error procesando entrenamiento',
@@ -529,20 +976,152 @@ def train():
         }), 500
 
 
+@app.route('/train-bulk', methods=['POST'])
+def train_bulk():
+    """
+    Registra los rostros de varios usuarios en una sola peticion (altas
+    masivas). Las imagenes de todos los usuarios se procesan juntas en el
+    pool de trabajadores y la galeria se actualiza y persiste una sola vez.
+    En el pool ocupan a lo sumo MAX_PENDIENTES_MASIVOS lugares, para no
+    demorar el reconocimiento en vivo; sin pool (TRABAJADORES=0) se
+    procesan una tras otra en el hilo de la peticion.
+    
+    Body (JSON):
+    {
+        "usuarios": [
+            {"usuario_id": "507f...", "nombre": "Juan Pérez", "imagenes": ["data:image/jpeg;base64,...", ...]},
+            ...
+        ]
+    }
+    
+    Un usuario sin ninguna imagen valida no se modifica; los errores se
+    reportan por usuario e imagen.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        usuarios = data.get('usuarios')
+        if not isinstance(usuarios, list) or not usuarios:
+            return jsonify({
+                'success': False,
+                'message': 'Se requiere usuarios[] con usuario_id e imagenes[]'
+            }), 400
+        
+        # Aplanar las imagenes de todos los usuarios en un solo lote
+        imagenes = []
+        duenos = []
+        for posicion, usuario in enumerate(usuarios):
+            if not isinstance(usuario, dict) or not usuario.get('usuario_id') or not usuario.get('imagenes'):
+                return jsonify({
+                    'success': False,
+                    'message': f'usuarios[{posicion}]: se requiere usuario_id e imagenes[]'
+                }), 400
+            for imagen in usuario['imagenes']:
+                imagenes.append(imagen)
+                duenos.append(posicion)
+        
+        if len(imagenes) > REGISTRO_LOTE_MAX_IMAGENES:
+            return jsonify({
+                'success': False,
+                'message': f'Maximo {REGISTRO_LOTE_MAX_IMAGENES} imagenes por peticion (recibidas {len(imagenes)})'
+            }), 413
+        
+        inicio = time.perf_counter()
+        
+        encodings_usuario = [[] for _ in usuarios]
+        errores_usuario = [[] for _ in usuarios]
+        numero_imagen = [0] * len(usuarios)
+        for posicion, (encoding, error) in zip(duenos, codificar_imagenes_registro(imagenes, masivo=True)):
+            numero_imagen[posicion] += 1
+            if error is not None:
+                errores_usuario[posicion].append(f"Imagen {numero_imagen[posicion]}: {error}")
+            else:
+                encodings_usuario[posicion].append(encoding)
+        
+        # Una sola escritura en la galeria y en el WAL para todo el lote
+        reemplazos = {}
+        for usuario, encodings in zip(usuarios, encodings_usuario):
+            if encodings:
+                reemplazos[usuario['usuario_id']] = encodings
+        if reemplazos:
+            with lock_escritura_galeria:
+                nueva = galeria.derivar()
+                almacen.aplicar_cambios(nueva, reemplazos)
+                publicar_galeria(nueva)
+        
+        resultados = []
+        for usuario, encodings, errores in zip(usuarios, encodings_usuario, errores_usuario):
+            encoding_base64 = None
+            if encodings:
+                try:
+                    encoding_base64 = codificar_encoding(encodings[0])
+                except Exception as e:
+                    log.error("Error serializando encoding: %s", e, extra=campos(usuario_id=usuario['usuario_id']))
+            resultados.append({
+                'usuario_id': usuario['usuario_id'],
+                'nombre': usuario.get('nombre', usuario['usuario_id']),
+                'success': bool(encodings),
+                'encodings_guardados': len(encodings),
+                'encoding_base64': encoding_base64,
+                'errores': errores if errores else None
+            })
+        
+        log.info("Registro masivo", extra=campos(
+            usuarios=len(usuarios), registrados=len(reemplazos), imagenes=len(imagenes),
+            imagenes_fallidas=sum(len(errores) for errores in errores_usuario),
+            segundos=round(time.perf_counter() - inicio, 3)
+        ))
+        
+        return jsonify({
+            'success': bool(reemplazos),
+            'usuarios_registrados': len(reemplazos),
+            'usuarios_fallidos': len(usuarios) - len(reemplazos),
+            'resultados': resultados,
+            'total_rostros_sistema': galeria.total_usuarios()
+        }), 200
+        
+    except ColaLlena as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 503
+    except Exception as e:
+        log.exception("Error en /train-bulk: %s", e)
+        return jsonify({
+            'success': False,
+            'message': 'Error procesando registro masivo',
+            'error': str(e)
+        }), 500
+
+
 @app.route('/sync', methods=['POST'])
 def sync():
-    """Sincroniza encodings desde el backend."""
+    """
+    Sincroniza encodings desde el backend.
+    
+    Query / Body (JSON) opcional:
+    {
+        "completa": true   (fuerza recarga completa en vez de incremental)
+    }
+    """
     try:
-        sincronizar_encodings()
+        data = request.get_json(silent=True) or {}
+        completa = (
+            bool(data.get('completa')) or
+            request.args.get('completa', 'false').lower() == 'true'
+        )
+        resumen = sincronizar_encodings(completa=completa)
         
         return jsonify({
             'success': True,
             'message': 'Encodings sincronizados exitosamente',
-            'total_rostros': len(nombres_conocidos)
+            'modo': resumen['modo'],
+            'actualizados': resumen['actualizados'],
+            'eliminados': resumen['eliminados'],
+            'total_rostros': len(galeria)
         }), 200
         
     except Exception as e:
-        print(f"Error en /sync: {e}")
+        log.exception("Error en /sync: %s", e)
         return jsonify({
             'success': False,
             'message': 'Error sincronizando encodings'
@@ -553,18 +1132,9 @@ def sync():
 # INICIAR SERVIDOR
 # ==========================================
 
+# Servidor de desarrollo; en produccion: gunicorn -c gunicorn.conf.py reconocimiento:app
 if __name__ == '__main__':
-    print("\n" + "="*50)
-    print("API de Reconocimiento Facial")
-    print("="*50)
-    print(f"Backend URL: {BACKEND_URL}")
-    print(f"Rostros cargados: {len(nombres_conocidos)}")
-    print("="*50 + "\n")
-    
-    try:
-        sincronizar_encodings()
-    except Exception as e:
-        print(f"No se pudo sincronizar al inicio: {e}")
+    iniciar_servicio()
     
     app.run(
         host='0.0.0.0',
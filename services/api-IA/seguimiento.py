@@ -0,0 +1,158 @@
+"""
+Seguimiento de rostros entre frames de un mismo stream
+Solo cada K frames (o cuando se pierde un rostro) se corre la deteccion completa
++ encoding; entre medio cada caja se mueve con flujo optico (Lucas-Kanade
+piramidal sobre puntos del rostro) y la identidad se conserva.
+"""
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# Deteccion completa + encoding cada K frames (los rostros nuevos aparecen a lo sumo K frames despues)
+SEGUIMIENTO_CADA_K = int(os.environ.get('SEGUIMIENTO_CADA_K', '5'))
+
+# Puntos que se siguen por rostro y minimo que debe sobrevivir para no perder la pista
+SEGUIMIENTO_MAX_PUNTOS = int(os.environ.get('SEGUIMIENTO_MAX_PUNTOS', '40'))
+SEGUIMIENTO_MIN_PUNTOS = int(os.environ.get('SEGUIMIENTO_MIN_PUNTOS', '8'))
+
+# Error maximo (pixeles) entre un punto y su ida y vuelta por el flujo optico
+SEGUIMIENTO_ERROR_IDA_VUELTA = float(os.environ.get('SEGUIMIENTO_ERROR_IDA_VUELTA', '1.0'))
+
+_PARAMETROS_FLUJO = dict(
+    winSize=(15, 15), maxLevel=2,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+)
+
+
+def puntos_en_caja(gris, caja, max_puntos):
+    """Esquinas buenas para seguir dentro de la caja (top, right, bottom, left). Retorna K x 1 x 2 float32."""
+    top, right, bottom, left = caja
+    mascara = np.zeros(gris.shape, dtype=np.uint8)
+    mascara[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)] = 255
+    puntos = cv2.goodFeaturesToTrack(gris, max_puntos, qualityLevel=0.01, minDistance=3, mask=mascara)
+    return puntos if puntos is not None else np.empty((0, 1, 2), dtype=np.float32)
+
+
+def mover_caja(caja, antes, despues):
+    """
+    Desplaza y escala la caja segun el movimiento de sus puntos: mediana del
+    desplazamiento y mediana de la razon de distancias al centro de los puntos.
+    """
+    antes, despues = antes.reshape(-1, 2), despues.reshape(-1, 2)
+    dx, dy = np.median(despues - antes, axis=0)
+    radio_antes = np.linalg.norm(antes - antes.mean(axis=0), axis=1)
+    radio_despues = np.linalg.norm(despues - despues.mean(axis=0), axis=1)
+    validos = radio_antes > 1e-3
+    escala = float(np.median(radio_despues[validos] / radio_antes[validos])) if validos.any() else 1.0
+
+    top, right, bottom, left = caja
+    centro_x, centro_y = (left + right) / 2.0 + dx, (top + bottom) / 2.0 + dy
+    medio_ancho, medio_alto = (right - left) * escala / 2.0, (bottom - top) * escala / 2.0
+    return (int(round(centro_y - medio_alto)), int(round(centro_x + medio_ancho)),
+            int(round(centro_y + medio_alto)), int(round(centro_x - medio_ancho)))
+
+
+class Pista:
+    """Un rostro seguido: caja actual, identidad y puntos que se siguen."""
+
+    def __init__(self, caja, nombre, puntos):
+        self.caja = caja
+        self.nombre = nombre
+        self.puntos = puntos
+
+
+class SeguidorRostros:
+    """
+    Mantiene las pistas de un stream (una camara o una sesion del navegador).
+
+    En un frame completo se detecta con `detector_completo` y
+    `identificar(rgb, ubicaciones)` retorna un nombre por ubicacion (ahi
+    ocurre el encoding y la comparacion). En los demas frames cada caja se
+    mueve con flujo optico desde el frame anterior: solo los puntos que
+    vuelven a su origen (control de ida y vuelta) cuentan. Si a una pista le
+    quedan menos de `min_puntos`, se pierde y el frame se procesa completo.
+
+    El flujo optico no descubre rostros nuevos: aparecen en el siguiente
+    frame completo, a lo sumo `cada_k` frames despues.
+    """
+
+    def __init__(self, detector_completo, identificar, cada_k=SEGUIMIENTO_CADA_K,
+                 max_puntos=SEGUIMIENTO_MAX_PUNTOS, min_puntos=SEGUIMIENTO_MIN_PUNTOS,
+                 error_ida_vuelta=SEGUIMIENTO_ERROR_IDA_VUELTA):
+        self.detector_completo = detector_completo
+        self.identificar = identificar
+        self.cada_k = max(1, cada_k)
+        self.max_puntos = max_puntos
+        self.min_puntos = min_puntos
+        self.error_ida_vuelta = error_ida_vuelta
+
+        self.pistas = []
+        self._gris_anterior = None
+        self._frames_desde_completo = 0
+        self._lock = threading.Lock()
+        self.frames_completos = 0
+        self.frames_seguidos = 0
+
+    def _completo(self, rgb, gris):
+        ubicaciones = self.detector_completo.detectar(rgb)
+        nombres = self.identificar(rgb, ubicaciones) if ubicaciones else []
+        self.pistas = [
+            Pista(caja, nombre, puntos_en_caja(gris, caja, self.max_puntos))
+            for caja, nombre in zip(ubicaciones, nombres)
+        ]
+        self._frames_desde_completo = 0
+        self.frames_completos += 1
+
+    def _seguir(self, gris):
+        """Mueve las pistas con flujo optico. Retorna False si alguna se perdio."""
+        if not self.pistas:
+            return True
+        antes = np.concatenate([pista.puntos for pista in self.pistas])
+        if antes.shape[0] == 0:
+            return False
+        despues, estado, _ = cv2.calcOpticalFlowPyrLK(self._gris_anterior, gris, antes, None, **_PARAMETROS_FLUJO)
+        vuelta, estado_vuelta, _ = cv2.calcOpticalFlowPyrLK(gris, self._gris_anterior, despues, None,
+                                                           **_PARAMETROS_FLUJO)
+        error = np.linalg.norm((antes - vuelta).reshape(-1, 2), axis=1)
+        buenos = (estado.ravel() == 1) & (estado_vuelta.ravel() == 1) & (error <= self.error_ida_vuelta)
+
+        inicio = 0
+        for pista in self.pistas:
+            fin = inicio + pista.puntos.shape[0]
+            propios = buenos[inicio:fin]
+            if propios.sum() < self.min_puntos:
+                return False
+            pista.caja = mover_caja(pista.caja, antes[inicio:fin][propios], despues[inicio:fin][propios])
+            pista.puntos = despues[inicio:fin][propios]
+            inicio = fin
+        self._frames_desde_completo += 1
+        self.frames_seguidos += 1
+        return True
+
+    def procesar(self, rgb):
+        """
+        Procesa un frame RGB (ya a la escala de deteccion).
+        Retorna [(ubicacion, nombre)] en coordenadas de ese frame.
+        """
+        gris = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        with self._lock:
+            necesita_completo = (
+                self._gris_anterior is None
+                or self._gris_anterior.shape != gris.shape
+                or self._frames_desde_completo + 1 >= self.cada_k
+            )
+            if necesita_completo or not self._seguir(gris):
+                self._completo(rgb, gris)
+            self._gris_anterior = gris
+            return [(pista.caja, pista.nombre) for pista in self.pistas]
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'pistas': len(self.pistas),
+                'frames_completos': self.frames_completos,
+                'frames_seguidos': self.frames_seguidos
+            }
@@ -0,0 +1,282 @@
+"""
+Sincronizacion de encodings con el backend
+Sincronizacion incremental por marca (updatedAt) con respaldo de recarga completa
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+import numpy as np
+import requests
+
+from bitacora import campos
+from codificacion import decodificar_encodings
+
+log = logging.getLogger(__name__)
+
+# Diferencia maxima por componente para considerar dos encodings iguales
+TOLERANCIA_ENCODING = 2e-3
+
+
+def encoding_ya_presente(galeria, usuario_id, encoding):
+    """
+    True si el encoding ya esta entre los del usuario. /train guarda varios
+    encodings localmente pero el backend solo conserva uno, asi que no se
+    deben reemplazar por ese unico encoding.
+    """
+    actuales = galeria.encodings_de(usuario_id)
+    if actuales is None:
+        return False
+    encoding = np.asarray(encoding, dtype=np.float32).reshape(1, -1)
+    # Tolerancia para los formatos con perdida (f16 / i8, ver codificacion.py)
+    return bool((np.abs(actuales - encoding).max(axis=1) <= TOLERANCIA_ENCODING).any())
+
+
+def obtener_usuarios_backend(backend_url, desde=None, timeout=5, sesion=None):
+    """
+    Obtiene usuarios con encoding desde el backend.
+    Si se indica `desde`, solo pide los cambios posteriores a esa marca.
+    Retorna el JSON de la respuesta o None si hubo un error.
+    """
+    try:
+        url = f"{backend_url}/sync-encodings"
+        params = {'since': desde} if desde else None
+        response = (sesion or requests).get(url, params=params, timeout=timeout)
+
+        if response.status_code == 200:
+            data = response.json()
+            log.debug("Usuarios obtenidos del backend", extra=campos(
+                url=url, desde=desde, usuarios=len(data.get('data', []))
+            ))
+            return data
+        else:
+            log.error("Error al obtener usuarios", extra=campos(url=url, estado=response.status_code))
+            return None
+    except Exception as e:
+        log.error("Error conectando con backend: %s", e, extra=campos(url=f"{backend_url}/sync-encodings"))
+        return None
+
+
+class SincronizadorEncodings:
+    """
+    Mantiene la galeria al dia con el backend.
+
+    Guarda una marca (el mayor updatedAt recibido) y en cada sincronizacion
+    pide solo los usuarios modificados desde esa marca, junto con los IDs
+    que ya no tienen encoding activo (eliminados). Si no hay marca, si el
+    backend no soporta el modo incremental o si el total del backend no
+    cuadra con los IDs que vinieron de el, se hace una recarga completa.
+
+    Ambos modos combinan los datos del backend con la galeria actual: la
+    galeria tambien tiene usuarios registrados solo localmente (/train-bulk,
+    enrolamiento.py) y varios encodings por usuario que el backend no
+    conoce. Solo se eliminan usuarios que el backend marca como eliminados
+    o que vinieron del backend y ya no estan en una recarga completa; por
+    eso se guardan los IDs de origen backend junto a la marca.
+
+    La consulta al backend se hace fuera del lock. Los cambios se aplican,
+    con `lock_escritura` tomado, sobre una version derivada de la vigente (y
+    de lo que otros procesos hayan escrito en el WAL) y se publican con un
+    solo intercambio de referencia (`publicar_galeria`), de modo que los
+    hilos que atienden peticiones nunca ven un estado a medias ni esperan
+    por la red. `lock_escritura` serializa a todos los que modifican la
+    galeria (sincronizacion y /train).
+
+    Con varios workers solo el lider sincroniza, pero todos reportan el
+    mismo estado: el resultado de cada sincronizacion se guarda junto a la
+    galeria (`guardar_estado_sincronizacion`) y `estado()` lo lee de ahi.
+    """
+
+    def __init__(self, backend_url, almacen, obtener_galeria, publicar_galeria,
+                 lock_escritura=None, timeout=5, sesion=None):
+        self.backend_url = backend_url
+        self.almacen = almacen
+        self.obtener_galeria = obtener_galeria
+        self.publicar_galeria = publicar_galeria
+        self.lock_escritura = lock_escritura or threading.Lock()
+        self.timeout = timeout
+        self.sesion = sesion
+        self.marca = None
+        self.ids_backend = None
+        self._version_marca = None
+        self._leer_marca()
+
+        # Estado para /health (el compartido entre procesos esta en el almacen)
+        self.ultimos_errores = 0
+        self.intervalo = None
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _decodificar_usuarios(self, usuarios):
+        """
+        Retorna dict usuario_id -> encoding, omitiendo los que fallen.
+        Todo el lote se decodifica de una vez (ver codificacion.py); los
+        errores se reportan en un solo registro.
+        """
+        usuarios = [u for u in usuarios if u.get('encodingFacial')]
+        matriz, errores = decodificar_encodings([u['encodingFacial'] for u in usuarios])
+        self.ultimos_errores = len(errores)
+        if errores:
+            log.warning("%d encodings del backend no se pudieron decodificar", len(errores), extra=campos(
+                ejemplos={str(usuarios[i].get('_id')): mensaje for i, mensaje in list(errores.items())[:5]}
+            ))
+        return {
+            str(usuario['_id']): matriz[i]
+            for i, usuario in enumerate(usuarios) if i not in errores
+        }
+
+    def _leer_marca(self):
+        """Relee la marca si otro proceso (el worker lider) la guardo despues."""
+        version = self.almacen.version_marca()
+        if version != self._version_marca:
+            self.marca, self.ids_backend = self.almacen.leer_marca()
+            self._version_marca = version
+
+    def sincronizar(self, completa=False):
+        """
+        Sincroniza y publica la galeria resultante.
+        Retorna un resumen con el modo usado y la cantidad de cambios.
+        """
+        try:
+            resumen = None
+            self._leer_marca()
+            # Sin los IDs de origen (marca del formato anterior) no se puede validar el total
+            if not completa and self.marca and self.ids_backend is not None:
+                respuesta = obtener_usuarios_backend(self.backend_url, self.marca, self.timeout, self.sesion)
+                if respuesta is None:
+                    raise RuntimeError("No se pudo obtener cambios desde el backend")
+                if respuesta.get('incremental'):
+                    resumen = self._aplicar_incremental(respuesta)
+            if resumen is None:
+                resumen = self._sincronizar_completa()
+        except Exception as e:
+            estado = self.almacen.leer_estado_sincronizacion()
+            estado.update(ultimo_error=str(e), pid=os.getpid())
+            self.almacen.guardar_estado_sincronizacion(estado)
+            raise
+
+        self.almacen.guardar_estado_sincronizacion({
+            'ultima_sincronizacion': time.time(),
+            'ultimo_modo': resumen['modo'],
+            'ultimo_error': None,
+            'pid': os.getpid()
+        })
+        return resumen
+
+    def _combinar(self, encodings, eliminados):
+        """
+        Aplica al WAL y publica los encodings del backend que la galeria aun
+        no tiene y las eliminaciones. Retorna (actualizados, eliminados).
+        """
+        with self.lock_escritura:
+            galeria = self.obtener_galeria()
+            reemplazos = {
+                usuario_id: encoding for usuario_id, encoding in encodings.items()
+                if not encoding_ya_presente(galeria, usuario_id, encoding)
+            }
+            eliminados = [usuario_id for usuario_id in eliminados if usuario_id in galeria]
+            if reemplazos or eliminados:
+                galeria = galeria.derivar()
+                self.almacen.aplicar_cambios(galeria, reemplazos, eliminados)
+                self.publicar_galeria(galeria)
+        return len(reemplazos), len(eliminados)
+
+    def _aplicar_incremental(self, respuesta):
+        datos = respuesta.get('data', [])
+        eliminados = {str(u) for u in respuesta.get('eliminados', [])}
+        actualizados, eliminados_locales = self._combinar(self._decodificar_usuarios(datos), eliminados)
+        ids_backend = (self.ids_backend | {str(u['_id']) for u in datos}) - eliminados
+
+        # Los borrados definitivos no generan eliminados: detectarlos por el
+        # total, comparando solo con los usuarios que vinieron del backend
+        total = respuesta.get('total')
+        if total is not None and total != len(ids_backend):
+            log.warning("Total de usuarios del backend distinto al esperado, recarga completa", extra=campos(
+                total_esperado=len(ids_backend), total_backend=total
+            ))
+            return None
+
+        self._actualizar_marca(respuesta, ids_backend)
+        return {
+            'modo': 'incremental',
+            'actualizados': actualizados,
+            'eliminados': eliminados_locales,
+            'errores': self.ultimos_errores
+        }
+
+    def _sincronizar_completa(self):
+        respuesta = obtener_usuarios_backend(self.backend_url, timeout=self.timeout, sesion=self.sesion)
+        if respuesta is None:
+            raise RuntimeError("No se pudo obtener usuarios desde el backend")
+
+        datos = respuesta.get('data', [])
+        ids_backend = {str(u['_id']) for u in datos}
+        # Los registrados solo localmente nunca estuvieron en ids_backend y se conservan
+        desaparecidos = (self.ids_backend or set()) - ids_backend
+        actualizados, eliminados = self._combinar(self._decodificar_usuarios(datos), desaparecidos)
+
+        self._actualizar_marca(respuesta, ids_backend)
+        return {
+            'modo': 'completa',
+            'actualizados': actualizados,
+            'eliminados': eliminados,
+            'errores': self.ultimos_errores
+        }
+
+    def _actualizar_marca(self, respuesta, ids_backend):
+        marca = respuesta.get('watermark') or self.marca
+        if marca == self.marca and ids_backend == self.ids_backend:
+            return
+        self.marca, self.ids_backend = marca, ids_backend
+        self.almacen.guardar_marca(marca, ids_backend)
+        self._version_marca = self.almacen.version_marca()
+
+    # ------------------------------------------
+    # Sincronizacion periodica en segundo plano
+    # ------------------------------------------
+
+    def iniciar_periodico(self, intervalo, jitter=0.0):
+        """Inicia un hilo que sincroniza cada `intervalo` segundos (+ jitter aleatorio)."""
+        if intervalo <= 0 or self._hilo is not None:
+            return
+        self.intervalo = intervalo
+
+        def ciclo():
+            while not self._detener.wait(intervalo + random.uniform(0, jitter)):
+                try:
+                    self.sincronizar()
+                except Exception as e:
+                    log.error("Error en sincronizacion periodica: %s", e)
+
+        self._hilo = threading.Thread(target=ciclo, name='sincronizador-encodings', daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def segundos_desde_sync(self):
+        """Segundos desde la ultima sincronizacion exitosa de cualquier proceso (None si nunca)."""
+        ultima = self.almacen.leer_estado_sincronizacion().get('ultima_sincronizacion')
+        return None if ultima is None else time.time() - ultima
+
+    def con_error(self):
+        """True si la ultima sincronizacion (de cualquier proceso) fallo."""
+        return self.almacen.leer_estado_sincronizacion().get('ultimo_error') is not None
+
+    def estado(self):
+        """Resumen del estado de sincronizacion para /health (el mismo en todos los workers)."""
+        self._leer_marca()
+        compartido = self.almacen.leer_estado_sincronizacion()
+        retraso = None
+        if compartido.get('ultima_sincronizacion') is not None:
+            retraso = round(time.time() - compartido['ultima_sincronizacion'], 1)
+        return {
+            'marca': self.marca,
+            'ultimo_modo': compartido.get('ultimo_modo'),
+            'segundos_desde_sync': retraso,
+            'ultimo_error': compartido.get('ultimo_error'),
+            'pid_sincronizacion': compartido.get('pid'),
+            'intervalo_segundos': self.intervalo
+        }
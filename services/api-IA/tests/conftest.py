@@ -0,0 +1,10 @@
+"""
+Pruebas unitarias del servicio de reconocimiento
+Los modulos del servicio estan en la raiz de services/api-IA (no es un paquete):
+    cd services/api-IA && python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from admision import ControlAdmision, PeticionRechazada
+
+
+def _esperar(condicion, limite=2.0):
+    fin = time.monotonic() + limite
+    while not condicion():
+        assert time.monotonic() < fin, "condicion no alcanzada"
+        time.sleep(0.001)
+
+
+def _ocupar(control, liberar):
+    """Toma el unico lugar hasta que se active `liberar`."""
+    listo = threading.Event()
+
+    def ocupante():
+        with control.admitir('ocupante'):
+            listo.set()
+            liberar.wait()
+
+    hilo = threading.Thread(target=ocupante)
+    hilo.start()
+    listo.wait()
+    return hilo
+
+
+def test_turnos_por_terminal():
+    control = ControlAdmision(max_en_curso=1, plazo=5, max_cola=100, max_por_terminal=0)
+    liberar = threading.Event()
+    ocupante = _ocupar(control, liberar)
+
+    orden = []
+
+    def peticion(terminal, etiqueta):
+        with control.admitir(terminal):
+            orden.append(etiqueta)
+
+    # Rafaga de la terminal A y despues una sola peticion de B
+    hilos = []
+    for etiqueta, terminal in [('a1', 'A'), ('a2', 'A'), ('a3', 'A'), ('b1', 'B')]:
+        hilo = threading.Thread(target=peticion, args=(terminal, etiqueta))
+        hilo.start()
+        hilos.append(hilo)
+        _esperar(lambda: control.en_cola == len(hilos))
+
+    liberar.set()
+    for hilo in [ocupante] + hilos:
+        hilo.join()
+
+    # B no espera detras de toda la rafaga de A
+    assert orden == ['a1', 'b1', 'a2', 'a3']
+    assert control.en_curso == 0 and control.en_cola == 0
+
+
+def test_plazo_vencido():
+    control = ControlAdmision(max_en_curso=1, plazo=5, max_cola=100, max_por_terminal=0)
+    liberar = threading.Event()
+    ocupante = _ocupar(control, liberar)
+    try:
+        inicio = time.monotonic()
+        with pytest.raises(PeticionRechazada) as error:
+            with control.admitir('A', plazo=0.05):
+                pass
+        assert error.value.motivo == 'plazo'
+        assert error.value.reintentar_en >= 1
+        assert time.monotonic() - inicio < 1
+        assert control.en_cola == 0
+    finally:
+        liberar.set()
+        ocupante.join()
+
+
+def test_cola_llena_y_limite_por_terminal():
+    control = ControlAdmision(max_en_curso=1, plazo=5, max_cola=2, max_por_terminal=1)
+    liberar = threading.Event()
+    ocupante = _ocupar(control, liberar)
+
+    def esperar_turno(terminal):
+        with control.admitir(terminal):
+            pass
+
+    def rechazo(terminal):
+        with pytest.raises(PeticionRechazada) as error:
+            esperar_turno(terminal)
+        return error.value.motivo
+
+    hilos = []
+    try:
+        for terminal in ('A', 'B'):
+            hilos.append(threading.Thread(target=esperar_turno, args=(terminal,)))
+            hilos[-1].start()
+            _esperar(lambda: control.en_cola == len(hilos))
+            if terminal == 'A':
+                # A ya tiene su unica peticion en espera
+                assert rechazo('A') == 'cola_llena'
+        # La cola total (2) esta llena
+        assert rechazo('C') == 'cola_llena'
+    finally:
+        liberar.set()
+        for hilo in [ocupante] + hilos:
+            hilo.join()
+    assert control.en_curso == 0 and control.en_cola == 0
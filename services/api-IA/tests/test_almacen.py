@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+
+from almacen import CABECERA_WAL, AlmacenGaleria
+from galeria import GaleriaRostros
+from indices import IndiceExacto
+
+
+def _galeria():
+    return GaleriaRostros(indice=IndiceExacto())
+
+
+def _encodings(n, semilla):
+    return np.random.default_rng(semilla).normal(size=(n, 128)).astype(np.float32)
+
+
+def _contenido(galeria):
+    return {u: galeria.encodings_de(u) for u in set(galeria.nombres())}
+
+
+def _recargar(ruta_base):
+    almacen = AlmacenGaleria(ruta_base)
+    galeria = _galeria()
+    almacen.cargar(galeria)
+    return almacen, galeria
+
+
+def test_wal_ida_y_vuelta(tmp_path):
+    ruta = str(tmp_path / 'galeria')
+    almacen = AlmacenGaleria(ruta)
+    galeria = _galeria()
+    almacen.aplicar_cambios(galeria, {'a': _encodings(2, 1), 'b': _encodings(1, 2), 'c': _encodings(3, 3)})
+    almacen.reemplazar_usuario(galeria, 'a', _encodings(1, 4))
+    almacen.eliminar_usuario(galeria, 'b')
+    almacen.cerrar()
+
+    _, recargada = _recargar(ruta)
+    esperado = _contenido(galeria)
+    obtenido = _contenido(recargada)
+    assert set(obtenido) == {'a', 'c'}
+    for usuario, encodings in esperado.items():
+        np.testing.assert_array_equal(obtenido[usuario], encodings)
+
+
+def test_wal_despues_de_compactar(tmp_path):
+    ruta = str(tmp_path / 'galeria')
+    almacen = AlmacenGaleria(ruta)
+    galeria = _galeria()
+    almacen.aplicar_cambios(galeria, {'a': _encodings(2, 1), 'b': _encodings(1, 2)})
+    almacen.compactar(galeria)
+    almacen.aplicar_cambios(galeria, {'c': _encodings(1, 3)}, eliminados=['a'])
+    almacen.cerrar()
+
+    almacen, recargada = _recargar(ruta)
+    assert almacen.generacion == 1
+    assert sorted(set(recargada.nombres())) == ['b', 'c']
+    np.testing.assert_array_equal(recargada.encodings_de('c'), galeria.encodings_de('c'))
+
+
+def test_cola_incompleta_se_descarta(tmp_path):
+    ruta = str(tmp_path / 'galeria')
+    almacen = AlmacenGaleria(ruta)
+    galeria = _galeria()
+    almacen.aplicar_cambios(galeria, {'a': _encodings(1, 1)})
+    completo = os.path.getsize(almacen.ruta_wal)
+    almacen.aplicar_cambios(galeria, {'b': _encodings(1, 2)})
+    almacen.cerrar()
+
+    # Escritura interrumpida: el ultimo registro queda a medias
+    with open(almacen.ruta_wal, 'r+b') as f:
+        f.truncate(os.path.getsize(almacen.ruta_wal) - 100)
+
+    almacen, recargada = _recargar(ruta)
+    assert sorted(set(recargada.nombres())) == ['a']
+    assert os.path.getsize(almacen.ruta_wal) == completo
+
+    # Lo que se anexe despues sigue siendo legible
+    almacen.aplicar_cambios(recargada, {'c': _encodings(1, 3)})
+    almacen.cerrar()
+    _, otra = _recargar(ruta)
+    assert sorted(set(otra.nombres())) == ['a', 'c']
+
+
+def test_registro_corrupto_detiene_la_lectura(tmp_path):
+    ruta = str(tmp_path / 'galeria')
+    almacen = AlmacenGaleria(ruta)
+    galeria = _galeria()
+    almacen.aplicar_cambios(galeria, {'a': _encodings(1, 1)})
+    almacen.aplicar_cambios(galeria, {'b': _encodings(1, 2)})
+    almacen.cerrar()
+
+    with open(almacen.ruta_wal, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        ultimo = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([ultimo[0] ^ 0xFF]))
+
+    _, recargada = _recargar(ruta)
+    assert sorted(set(recargada.nombres())) == ['a']
+
+
+def test_wal_de_otra_generacion_se_ignora(tmp_path):
+    ruta = str(tmp_path / 'galeria')
+    almacen = AlmacenGaleria(ruta)
+    galeria = _galeria()
+    almacen.aplicar_cambios(galeria, {'a': _encodings(1, 1)})
+    almacen.compactar(galeria)
+    almacen.cerrar()
+
+    # Caida entre la instantanea nueva y el reinicio del WAL: el WAL apunta a la generacion anterior
+    with open(almacen.ruta_wal, 'r+b') as f:
+        magia, generacion = CABECERA_WAL.unpack(f.read(CABECERA_WAL.size))
+        f.seek(0)
+        f.write(CABECERA_WAL.pack(magia, generacion - 1))
+
+    _, recargada = _recargar(ruta)
+    assert sorted(set(recargada.nombres())) == ['a']
+
+
+def test_instantanea_se_lee_con_memmap_sin_copiar(tmp_path):
+    ruta = str(tmp_path / 'galeria')
+    almacen = AlmacenGaleria(ruta)
+    galeria = _galeria()
+    almacen.aplicar_cambios(galeria, {'a': _encodings(2, 1), 'b': _encodings(1, 2)})
+    almacen.compactar(galeria)
+    almacen.cerrar()
+
+    almacen, recargada = _recargar(ruta)
+    nueva = recargada.derivar()
+    almacen.aplicar_cambios(nueva, {'c': _encodings(1, 3)})
+
+    # Las filas de la instantanea siguen en el archivo; solo las nuevas van a memoria propia
+    assert isinstance(nueva._filas.base_matriz, np.memmap)
+    assert sorted(set(nueva.nombres())) == ['a', 'b', 'c']
+    assert sorted(set(recargada.nombres())) == ['a', 'b']
@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+import cv2
+import numpy as np
+
+from caches import CacheHuellas, CacheTTL
+from imagenes import huella_imagen
+
+
+def test_calcula_una_sola_vez_con_peticiones_concurrentes():
+    cache = CacheTTL(capacidad=16, ttl=60)
+    llamadas = []
+    empezo, continuar = threading.Event(), threading.Event()
+
+    def calcular():
+        llamadas.append(1)
+        empezo.set()
+        continuar.wait()
+        return 'valor'
+
+    resultados = []
+
+    def peticion():
+        resultados.append(cache.obtener_o_calcular('clave', calcular))
+
+    primero = threading.Thread(target=peticion)
+    primero.start()
+    empezo.wait()
+    demas = [threading.Thread(target=peticion) for _ in range(8)]
+    for hilo in demas:
+        hilo.start()
+    time.sleep(0.05)
+    continuar.set()
+    for hilo in [primero] + demas:
+        hilo.join()
+
+    assert len(llamadas) == 1
+    assert sorted(resultados) == [('valor', False)] + [('valor', True)] * 8
+    assert cache.obtener_o_calcular('clave', calcular) == ('valor', True)
+
+
+def test_error_llega_a_los_que_esperan_y_no_se_guarda():
+    cache = CacheTTL(capacidad=16, ttl=60)
+    empezo, continuar = threading.Event(), threading.Event()
+
+    def fallar():
+        empezo.set()
+        continuar.wait()
+        raise RuntimeError("backend caido")
+
+    errores = []
+
+    def peticion():
+        try:
+            cache.obtener_o_calcular('clave', fallar)
+        except RuntimeError as e:
+            errores.append(str(e))
+
+    primero = threading.Thread(target=peticion)
+    primero.start()
+    empezo.wait()
+    segundo = threading.Thread(target=peticion)
+    segundo.start()
+    time.sleep(0.05)
+    continuar.set()
+    primero.join()
+    segundo.join()
+
+    assert errores == ["backend caido"] * 2
+    assert cache.obtener_o_calcular('clave', lambda: 'nuevo') == ('nuevo', False)
+
+
+def test_guardar_si_y_expiracion():
+    cache = CacheTTL(capacidad=16, ttl=0.05)
+    assert cache.obtener_o_calcular('a', lambda: {'success': False}, guardar_si=lambda r: r['success']) == \
+        ({'success': False}, False)
+    assert cache.obtener('a') is None
+
+    cache.obtener_o_calcular('a', lambda: 1)
+    assert cache.obtener('a') == 1
+    time.sleep(0.06)
+    assert cache.obtener('a') is None
+
+
+@pytest.mark.parametrize('capacidad', [1, 3])
+def test_descarta_la_menos_usada(capacidad):
+    cache = CacheTTL(capacidad=capacidad, ttl=60)
+    for i in range(capacidad + 1):
+        cache.guardar(i, i)
+    assert cache.obtener(0) is None
+    assert cache.obtener(capacidad) == capacidad
+
+
+def _jpeg(frame):
+    return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def test_huella_tolera_ruido_pero_no_otra_escena():
+    rng = np.random.default_rng(0)
+    escena = cv2.GaussianBlur(rng.integers(0, 255, (240, 320, 3), dtype=np.uint8), (31, 31), 0)
+    ruido = np.clip(escena.astype(int) + rng.integers(-3, 4, escena.shape), 0, 255).astype(np.uint8)
+    otra = cv2.GaussianBlur(rng.integers(0, 255, (240, 320, 3), dtype=np.uint8), (31, 31), 0)
+
+    cache = CacheHuellas(capacidad=8, ttl=60, tolerancia=16)
+    cache.guardar(huella_imagen(_jpeg(escena)), 'resultado')
+
+    assert len(huella_imagen(_jpeg(escena))) == 32
+    assert cache.obtener(huella_imagen(_jpeg(ruido))) == 'resultado'
+    assert cache.obtener(huella_imagen(_jpeg(otra))) is None
+
+
+def test_tolerancia_en_bits():
+    cache = CacheHuellas(capacidad=8, ttl=60, tolerancia=2)
+    base = bytes(32)
+    cache.guardar(base, 'a')
+
+    assert cache.obtener(b'\x03' + bytes(31)) == 'a'
+    assert cache.obtener(b'\x07' + bytes(31)) is None
+
+
+def test_invalidar_descarta_resultados_de_la_galeria_anterior():
+    cache = CacheHuellas(capacidad=8, ttl=60, tolerancia=0)
+    generacion = cache.generacion
+
+    cache.invalidar()
+    cache.guardar(bytes(32), 'calculado antes', generacion)
+
+    assert cache.obtener(bytes(32)) is None
+    cache.guardar(bytes(32), 'nuevo', cache.generacion)
+    assert cache.obtener(bytes(32)) == 'nuevo'
@@ -0,0 +1,73 @@
+import base64
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from codificacion import codificar_encoding, decodificar_encoding, decodificar_encodings
+
+
+def _encoding(semilla=0):
+    return np.random.default_rng(semilla).normal(scale=0.1, size=128).astype(np.float32)
+
+
+def test_f32_exacto():
+    encoding = _encoding()
+    np.testing.assert_array_equal(decodificar_encoding(codificar_encoding(encoding, 'f32')), encoding)
+
+
+@pytest.mark.parametrize('formato, tolerancia', [('f16', 1e-3), ('i8', None)])
+def test_formatos_con_perdida(formato, tolerancia):
+    encoding = _encoding()
+    if tolerancia is None:
+        # Cuantizacion simetrica: error maximo de media escala
+        tolerancia = np.abs(encoding).max() / 127.0 / 2 + 1e-6
+    decodificado = decodificar_encoding(codificar_encoding(encoding, formato))
+    assert decodificado.dtype == np.float32
+    assert np.abs(decodificado - encoding).max() <= tolerancia
+
+
+def test_lote_mixto_con_errores():
+    encodings = [_encoding(i) for i in range(4)]
+    textos = [
+        codificar_encoding(encodings[0], 'f32'),
+        codificar_encoding(encodings[1], 'i8'),
+        'no es base64!',
+        base64.b64encode(pickle.dumps(encodings[3])).decode('ascii'),
+    ]
+    matriz, errores = decodificar_encodings(textos)
+    assert set(errores) == {2}
+    np.testing.assert_array_equal(matriz[0], encodings[0])
+    np.testing.assert_allclose(matriz[1], encodings[1], atol=np.abs(encodings[1]).max() / 127.0)
+    np.testing.assert_array_equal(matriz[2], 0)
+    np.testing.assert_array_equal(matriz[3], encodings[3])
+
+
+def test_formato_desconocido():
+    with pytest.raises(ValueError):
+        codificar_encoding(_encoding(), 'f64')
+
+
+# Si el unpickler permitiera clases arbitrarias, cargar el encoding llamaria a esta funcion
+EJECUTADOS = []
+
+
+def _ejecutar(comando):
+    EJECUTADOS.append(comando)
+
+
+class _Malicioso:
+    def __reduce__(self):
+        return (_ejecutar, ('rm -rf /',))
+
+
+@pytest.mark.parametrize('carga', [_Malicioso(), (os.system, 'echo')])
+def test_pickle_malicioso_se_rechaza(carga):
+    texto = base64.b64encode(pickle.dumps(carga)).decode('ascii')
+    matriz, errores = decodificar_encodings([texto])
+    assert 'no permitida' in errores[0]
+    np.testing.assert_array_equal(matriz[0], 0)
+    assert not EJECUTADOS
+    with pytest.raises(ValueError):
+        decodificar_encoding(texto)
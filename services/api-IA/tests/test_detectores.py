@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+import pytest
+
+from detectores import (DetectorAuto, DetectorHaar, DetectorHOG, Detector, escala_deteccion,
+                        escalar_ubicaciones, estadisticas_detectores, obtener_detector, reducir_a_rgb)
+
+
+class DetectorFijo(Detector):
+    """Detector de prueba que siempre retorna las mismas ubicaciones."""
+
+    def __init__(self, nombre, ubicaciones, rostro_minimo=40):
+        super().__init__()
+        self.nombre = nombre
+        self.ubicaciones = ubicaciones
+        self.rostro_minimo = rostro_minimo
+        self.llamadas = 0
+
+    def _detectar(self, rgb):
+        self.llamadas += 1
+        return list(self.ubicaciones)
+
+
+def test_registro_comparte_instancias():
+    assert obtener_detector('hog') is obtener_detector('hog')
+    assert isinstance(obtener_detector('hog'), DetectorHOG)
+    assert isinstance(obtener_detector('haar'), DetectorHaar)
+    auto = obtener_detector('auto-haar')
+    assert auto.rapido is obtener_detector('haar')
+    assert auto.respaldo is obtener_detector('cnn')
+    assert auto.nombre == 'auto-haar'
+
+
+def test_detector_desconocido():
+    with pytest.raises(ValueError):
+        obtener_detector('yolo')
+
+
+def test_auto_solo_usa_el_respaldo_sin_rostros():
+    rostro = [(10, 50, 50, 10)]
+    rapido = DetectorFijo('rapido', [])
+    respaldo = DetectorFijo('respaldo', rostro, rostro_minimo=80)
+    auto = DetectorAuto(rapido, respaldo)
+    imagen = np.zeros((100, 100, 3), dtype=np.uint8)
+
+    assert auto.detectar(imagen) == rostro
+    assert auto.respaldos_usados == 1
+
+    rapido.ubicaciones = rostro
+    assert auto.detectar(imagen) == rostro
+    assert (rapido.llamadas, respaldo.llamadas, auto.respaldos_usados) == (2, 1, 1)
+    assert auto.estadisticas.resumen()['llamadas'] == 2
+    assert rapido.estadisticas.resumen()['rostros'] == 1
+    # La escala debe servir al detector mas exigente
+    assert auto.rostro_minimo == 80
+
+
+@pytest.mark.skipif(not hasattr(cv2, 'CascadeClassifier'), reason='OpenCV sin cascadas Haar')
+def test_haar_sin_rostros_y_estadisticas():
+    haar = obtener_detector('haar')
+    antes = haar.estadisticas.resumen().get('llamadas', 0)
+
+    assert haar.detectar(np.zeros((120, 160, 3), dtype=np.uint8)) == []
+
+    resumen = estadisticas_detectores()['haar']
+    assert resumen['llamadas'] == antes + 1
+    assert resumen['p95_ms'] >= resumen['p50_ms'] >= 0
+
+
+def test_escala_lleva_el_rostro_minimo_al_detector():
+    # 1080p buscando rostros de 15% del lado menor: 162 px -> 40 px
+    assert escala_deteccion(1080, 1920, 40, 0.15) == pytest.approx(40 / 162)
+    # Frames pequeños se agrandan hasta el limite
+    assert escala_deteccion(120, 160, 40, 0.1, escala_maxima=2.0) == 2.0
+    assert escala_deteccion(4000, 6000, 40, 0.5, escala_minima=0.1) == 0.1
+    assert escala_deteccion(480, 640, 40, 0) == 1.0
+
+
+def test_escala_segun_el_detector():
+    hog = obtener_detector('hog')
+    assert hog.escala_para(480, 640, 0.25) == escala_deteccion(480, 640, hog.rostro_minimo, 0.25)
+
+
+def test_reducir_y_volver_a_la_original():
+    frame = np.zeros((481, 641, 3), dtype=np.uint8)
+    frame[..., 0] = 255
+
+    rgb = reducir_a_rgb(frame, 0.25)
+
+    assert rgb.shape == (120, 160, 3)
+    assert rgb[..., 2].min() == 255
+    ubicaciones = escalar_ubicaciones([(10, 150, 119, 5)], rgb.shape, frame.shape)
+    top, right, bottom, left = ubicaciones[0]
+    assert (top, left) == (40, 20)
+    # Se recorta al borde del frame original
+    assert right <= 641 and bottom <= 481
+    assert bottom == 477
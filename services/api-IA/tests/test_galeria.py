@@ -0,0 +1,130 @@
+import numpy as np
+
+from galeria import GaleriaRostros
+from indices import IndiceExacto
+
+
+def _encodings(n, semilla):
+    return np.random.default_rng(semilla).normal(size=(n, 128)).astype(np.float32)
+
+
+def _galeria(**kwargs):
+    return GaleriaRostros(indice=IndiceExacto(), **kwargs)
+
+
+def test_distancias_iguales_a_fuerza_bruta():
+    galeria = _galeria(capacidad=4)
+    encodings = _encodings(10, 1)
+    for i, encoding in enumerate(encodings):
+        galeria.agregar(f"u{i % 3}", encoding)
+    consultas = _encodings(5, 2)
+
+    esperado = np.linalg.norm(encodings[None, :, :] - consultas[:, None, :], axis=2)
+    np.testing.assert_allclose(galeria.distancias(consultas), esperado, rtol=1e-4)
+
+    ids, distancias = galeria.buscar(consultas, k=2)
+    orden = np.argsort(esperado, axis=1)[:, :2]
+    assert ids.tolist() == [[f"u{j % 3}" for j in fila] for fila in orden]
+    np.testing.assert_allclose(distancias, np.take_along_axis(esperado, orden, axis=1), rtol=1e-4)
+
+
+def test_k_mayor_que_la_galeria():
+    galeria = _galeria()
+    galeria.agregar('a', _encodings(1, 1))
+
+    ids, distancias = galeria.buscar(_encodings(2, 2), k=3)
+
+    assert ids.shape == (2, 3)
+    assert list(ids[:, 0]) == ['a', 'a']
+    assert (ids[:, 1:] == None).all()  # noqa: E711
+    assert np.isinf(distancias[:, 1:]).all()
+
+
+def test_reemplazar_y_eliminar_usuarios():
+    galeria = _galeria()
+    galeria.agregar('a', _encodings(3, 1))
+    galeria.agregar('b', _encodings(2, 2))
+    nuevo = _encodings(1, 3)
+
+    galeria.reemplazar_usuario('a', nuevo)
+    galeria.eliminar_usuario('b')
+    galeria.eliminar_usuario('desconocido')
+
+    assert len(galeria) == 1
+    assert galeria.total_usuarios() == 1
+    assert 'b' not in galeria
+    assert galeria.nombres() == ['a']
+    np.testing.assert_array_equal(galeria.encodings_de('a'), nuevo)
+    assert galeria.encodings_de('b') is None
+    ids, _ = galeria.buscar(_encodings(1, 4))
+    assert ids[0, 0] == 'a'
+
+
+def test_galeria_vacia():
+    galeria = _galeria()
+
+    ids, distancias = galeria.buscar(_encodings(2, 1))
+
+    assert galeria.distancias(_encodings(2, 1)).shape == (2, 0)
+    assert (ids == None).all()  # noqa: E711
+    assert np.isinf(distancias).all()
+
+
+def test_cargar_reemplaza_el_contenido():
+    galeria = _galeria()
+    galeria.agregar('viejo', _encodings(1, 1))
+    encodings = _encodings(4, 2)
+
+    galeria.cargar(['a', 'a', 'b', 'c'], encodings)
+
+    assert galeria.total_usuarios() == 3
+    np.testing.assert_array_equal(galeria.encodings(), encodings)
+    np.testing.assert_array_equal(galeria.encodings_de('a'), encodings[:2])
+
+
+def test_derivar_no_cambia_la_version_publicada():
+    publicada = _galeria()
+    publicada.agregar('a', _encodings(2, 1))
+    publicada.agregar('b', _encodings(1, 2))
+    consulta = publicada.encodings_de('b')
+
+    nueva = publicada.derivar()
+    nueva.eliminar_usuario('b')
+    nueva.agregar('c', _encodings(1, 3))
+
+    assert publicada._filas is nueva._filas
+    assert sorted(set(publicada.nombres())) == ['a', 'b']
+    assert sorted(set(nueva.nombres())) == ['a', 'c']
+    assert publicada.buscar(consulta)[0][0, 0] == 'b'
+    assert nueva.buscar(consulta)[0][0, 0] != 'b'
+    assert len(publicada) == 3 and publicada.total_usuarios() == 2
+
+
+def test_version_desactualizada_se_separa_al_modificar():
+    publicada = _galeria()
+    publicada.agregar('a', _encodings(1, 1))
+    primera = publicada.derivar()
+    segunda = publicada.derivar()
+
+    primera.agregar('b', _encodings(1, 2))
+    segunda.agregar('c', _encodings(1, 3))
+
+    # segunda ya no es la punta: copia sus filas vivas en vez de pisar las de primera
+    assert segunda._filas is not primera._filas
+    assert sorted(set(primera.nombres())) == ['a', 'b']
+    assert sorted(set(segunda.nombres())) == ['a', 'c']
+    assert publicada.nombres() == ['a']
+    np.testing.assert_array_equal(primera.encodings_de('b'), _encodings(1, 2))
+    np.testing.assert_array_equal(segunda.encodings_de('c'), _encodings(1, 3))
+
+
+def test_crecer_compacta_las_filas_muertas():
+    galeria = _galeria(capacidad=4)
+    for i in range(20):
+        galeria = galeria.derivar()
+        galeria.reemplazar_usuario('a', _encodings(2, i))
+
+    # Al llenar la capacidad inicial con mas muertas que vivas se copiaron solo las vivas
+    assert len(galeria) == 2
+    assert galeria._n < 2 * 20
+    np.testing.assert_array_equal(galeria.encodings_de('a'), _encodings(2, 19))
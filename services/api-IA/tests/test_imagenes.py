@@ -0,0 +1,115 @@
+import base64
+import io
+
+import cv2
+import numpy as np
+import pytest
+from flask import Flask
+
+from imagenes import decodificar_imagen, decodificar_imagen_rgb, dimensiones_imagen, obtener_imagenes_request
+
+
+def _jpeg(alto=120, ancho=160):
+    rng = np.random.default_rng(0)
+    frame = cv2.GaussianBlur(rng.integers(0, 255, (alto, ancho, 3), dtype=np.uint8), (9, 9), 0)
+    return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def test_json_base64_con_prefijo(app):
+    jpeg = _jpeg()
+    texto = 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode()
+    with app.test_request_context('/', method='POST', json={'image': texto, 'tipo': 'entrada'}):
+        imagenes, datos = obtener_imagenes_request()
+
+    assert imagenes == [texto]
+    assert datos['tipo'] == 'entrada'
+    assert decodificar_imagen(imagenes[0]).shape == (120, 160, 3)
+
+
+def test_multipart_varios_archivos(app):
+    jpeg = _jpeg()
+    formulario = {
+        'imagenes': [(io.BytesIO(jpeg), 'a.jpg'), (io.BytesIO(jpeg), 'b.jpg')],
+        'usuario_id': 'u1'
+    }
+    with app.test_request_context('/?detector=hog', method='POST', data=formulario,
+                                  content_type='multipart/form-data'):
+        imagenes, datos = obtener_imagenes_request()
+        assert len(imagenes) == 2
+        assert bytes(imagenes[0]) == jpeg
+
+    assert datos == {'detector': 'hog', 'usuario_id': 'u1'}
+
+
+def test_cuerpo_crudo_con_parametros_en_la_query(app):
+    jpeg = _jpeg()
+    with app.test_request_context('/?tipo=salida', method='POST', data=jpeg, content_type='image/jpeg'):
+        imagenes, datos = obtener_imagenes_request()
+
+    assert [bytes(i) for i in imagenes] == [jpeg]
+    assert datos == {'tipo': 'salida'}
+    assert decodificar_imagen(imagenes[0]).shape == (120, 160, 3)
+
+
+def test_imagen_invalida(app):
+    with pytest.raises(ValueError):
+        decodificar_imagen(b'no es una imagen')
+    with pytest.raises(ValueError):
+        decodificar_imagen('%%%')
+
+
+def test_dimensiones_desde_la_cabecera():
+    png = cv2.imencode('.png', np.zeros((30, 40, 3), dtype=np.uint8))[1].tobytes()
+    progresivo = cv2.imencode('.jpg', np.zeros((50, 70, 3), dtype=np.uint8),
+                              [cv2.IMWRITE_JPEG_PROGRESSIVE, 1])[1].tobytes()
+
+    assert dimensiones_imagen(_jpeg(120, 160)) == (120, 160)
+    assert dimensiones_imagen(progresivo) == (50, 70)
+    assert dimensiones_imagen(png) == (30, 40)
+    assert dimensiones_imagen(b'GIF89a') is None
+
+
+@pytest.mark.parametrize('escala', [1.0, 0.5, 0.3, 0.125])
+def test_decodificacion_reducida_igual_a_completa_y_resize(escala):
+    jpeg = _jpeg(480, 640)
+    completa = cv2.cvtColor(cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+    destino = (int(round(640 * escala)), int(round(480 * escala)))
+    esperada = cv2.resize(completa, destino, interpolation=cv2.INTER_AREA) if escala != 1.0 else completa
+
+    rgb, forma = decodificar_imagen_rgb(jpeg, escala_de=lambda alto, ancho: escala)
+
+    assert forma == (480, 640)
+    assert rgb.shape == esperada.shape
+    # El escalado DCT del decodificador no es identico a INTER_AREA, pero muy cercano
+    assert np.abs(rgb.astype(int) - esperada.astype(int)).mean() < 3
+
+
+def test_decodificacion_reducida_en_rgb():
+    frame = np.zeros((200, 200, 3), dtype=np.uint8)
+    frame[:, :, 2] = 255
+    jpeg = cv2.imencode('.jpg', frame)[1].tobytes()
+
+    rgb, _ = decodificar_imagen_rgb(base64.b64encode(jpeg).decode(), escala_de=lambda alto, ancho: 0.25)
+
+    assert rgb.shape == (50, 50, 3)
+    assert rgb[..., 0].mean() > 240 and rgb[..., 2].mean() < 15
+
+
+def test_formato_sin_cabecera_conocida_se_escala_despues():
+    bmp = cv2.imencode('.bmp', np.zeros((60, 80, 3), dtype=np.uint8))[1].tobytes()
+    vistas = []
+
+    def escala_de(alto, ancho):
+        vistas.append((alto, ancho))
+        return 0.5
+
+    rgb, forma = decodificar_imagen_rgb(bmp, escala_de=escala_de)
+
+    assert vistas == [(60, 80)]
+    assert forma == (60, 80)
+    assert rgb.shape == (30, 40, 3)
@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+
+from benchmarks.sintetico import consultas_desconocidas, consultas_sinteticas, galeria_sintetica
+from galeria import GaleriaRostros
+from indices import IndiceCentroides, IndiceExacto, IndiceIVF, crear_indice
+
+COTA = 0.6
+
+
+def _par(ids, encodings, indice):
+    exacta = GaleriaRostros(indice=IndiceExacto())
+    exacta.cargar(ids, encodings)
+    otra = GaleriaRostros(indice=indice)
+    otra.cargar(ids, encodings)
+    return exacta, otra
+
+
+def _mismo_top1(exacta, otra, consultas):
+    ids_e, d_e = exacta.buscar(consultas, k=1)
+    ids_o, d_o = otra.buscar(consultas, k=1)
+    # Bajo la cota el prefiltro es exacto; sobre ella solo se garantiza un usuario revisado
+    bajo_cota = d_e[:, 0] < COTA
+    assert bajo_cota.any()
+    assert list(ids_o[bajo_cota, 0]) == list(ids_e[bajo_cota, 0])
+    np.testing.assert_allclose(d_o[bajo_cota, 0], d_e[bajo_cota, 0], rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize('por_usuario', [1, 4])
+def test_centroides_mismo_top1_que_exacto(por_usuario):
+    ids, encodings, centros = galeria_sintetica(500, por_usuario, semilla=0)
+    consultas, _ = consultas_sinteticas(centros, 200, semilla=1)
+    exacta, centroides = _par(ids, encodings, IndiceCentroides(cota=COTA))
+    _mismo_top1(exacta, centroides, consultas)
+    assert centroides.estadisticas_indice()['filas_revisadas'] > 0
+
+
+def test_centroides_despues_de_modificar():
+    ids, encodings, centros = galeria_sintetica(300, 3, semilla=2)
+    consultas, _ = consultas_sinteticas(centros, 100, semilla=3)
+    exacta, centroides = _par(ids, encodings, IndiceCentroides(cota=COTA))
+    rng = np.random.default_rng(4)
+    for galeria in (exacta, centroides):
+        galeria.eliminar_usuario(ids[0])
+        galeria.reemplazar_usuario(ids[10], centros[10] + rng.normal(scale=0.01, size=(2, 128)))
+        galeria.agregar('nuevo', centros[20] + 0.05)
+    _mismo_top1(exacta, centroides, consultas)
+
+
+def test_centroides_k_mayor_que_uno():
+    ids, encodings, centros = galeria_sintetica(200, 3, semilla=13)
+    consultas, _ = consultas_sinteticas(centros, 50, semilla=14)
+    exacta, centroides = _par(ids, encodings, IndiceCentroides())
+
+    # Sin cota el re-ranking revisa todo usuario que pueda entrar en el top-k
+    ids_e, d_e = exacta.buscar(consultas, k=3)
+    ids_c, d_c = centroides.buscar(consultas, k=3)
+    assert ids_c.tolist() == ids_e.tolist()
+    np.testing.assert_allclose(d_c, d_e, rtol=1e-5, atol=1e-5)
+
+
+def test_desconocidos_no_revisan_mas_que_la_pasada_exacta():
+    ids, encodings, _ = galeria_sintetica(500, 4, semilla=15)
+    desconocidas = consultas_desconocidas(100, semilla=16)
+    exacta, centroides = _par(ids, encodings, IndiceCentroides(cota=COTA))
+
+    ids_e, d_e = exacta.buscar(desconocidas, k=1)
+    ids_c, d_c = centroides.buscar(desconocidas, k=1)
+
+    bajo_cota = d_e[:, 0] < COTA
+    assert list(ids_c[bajo_cota, 0]) == list(ids_e[bajo_cota, 0])
+    estadisticas = centroides.estadisticas_indice()
+    assert estadisticas['filas_revisadas'] <= len(desconocidas) * len(exacta)
+    assert estadisticas['busquedas_exactas'] > 0
+
+
+def test_pasada_exacta_da_el_mismo_resultado():
+    ids, encodings, centros = galeria_sintetica(300, 2, semilla=17)
+    consultas, _ = consultas_sinteticas(centros, 30, semilla=18)
+    consultas = np.vstack([consultas, consultas_desconocidas(30, semilla=19)])
+    exacta, centroides = _par(ids, encodings, IndiceCentroides(cota=COTA, fraccion_exacta=0.0))
+    centroides.eliminar_usuario(ids[0])
+    exacta.eliminar_usuario(ids[0])
+
+    ids_e, d_e = exacta.buscar(consultas, k=2)
+    ids_c, d_c = centroides.buscar(consultas, k=2)
+
+    assert centroides.estadisticas_indice()['busquedas_exactas'] == len(consultas)
+    assert ids_c.tolist() == ids_e.tolist()
+    np.testing.assert_allclose(d_c, d_e, rtol=1e-5, atol=1e-5)
+
+
+def test_auto_usa_fuerza_bruta_en_galerias_chicas():
+    ids, encodings, centros = galeria_sintetica(50, 2, semilla=5)
+    consultas, _ = consultas_sinteticas(centros, 20, semilla=6)
+    exacta, auto = _par(ids, encodings, crear_indice('auto', cota=COTA))
+    _mismo_top1(exacta, auto, consultas)
+    assert auto.estadisticas_indice()['filas_revisadas'] == 0
+
+
+def test_ivf_sin_entrenar_es_exacto():
+    ids, encodings, centros = galeria_sintetica(100, 2, semilla=7)
+    consultas, _ = consultas_sinteticas(centros, 50, semilla=8)
+    exacta, ivf = _par(ids, encodings, IndiceIVF(min_entrenamiento=1000))
+
+    assert not ivf.estadisticas_indice()['entrenado']
+    ids_e, d_e = exacta.buscar(consultas, k=3)
+    ids_i, d_i = ivf.buscar(consultas, k=3)
+    assert ids_i.tolist() == ids_e.tolist()
+    np.testing.assert_allclose(d_i, d_e, rtol=1e-5, atol=1e-5)
+
+
+def test_ivf_entrenado_encuentra_al_usuario():
+    ids, encodings, centros = galeria_sintetica(400, 2, semilla=9)
+    consultas, elegidos = consultas_sinteticas(centros, 200, semilla=10)
+    _, ivf = _par(ids, encodings, IndiceIVF(listas=16, sondeos=4, min_entrenamiento=100))
+
+    assert ivf.estadisticas_indice()['entrenado']
+    encontrados, _ = ivf.buscar(consultas, k=1)
+    aciertos = np.mean([encontrados[i, 0] == f"{u:024x}" for i, u in enumerate(elegidos)])
+    assert aciertos >= 0.95
+
+
+def test_ivf_despues_de_modificar():
+    ids, encodings, centros = galeria_sintetica(300, 2, semilla=11)
+    _, ivf = _par(ids, encodings, IndiceIVF(listas=8, sondeos=8, min_entrenamiento=100))
+    rng = np.random.default_rng(12)
+
+    ivf.eliminar_usuario(ids[0])
+    ivf.reemplazar_usuario(ids[10], centros[5] + rng.normal(scale=0.01, size=(2, 128)))
+    ivf.agregar('nuevo', centros[20] + 0.01)
+
+    # Con todos los sondeos el IVF revisa todas las listas: debe coincidir con la busqueda exacta
+    exacta = GaleriaRostros(indice=IndiceExacto())
+    exacta.cargar(ivf.nombres(), ivf.encodings())
+    consultas = np.vstack([centros[[0, 5, 10, 20]], centros[20] + 0.01])
+    ids_e, d_e = exacta.buscar(consultas, k=2)
+    ids_i, d_i = ivf.buscar(consultas, k=2)
+    assert ids_i.tolist() == ids_e.tolist()
+    # Distancias casi nulas: el redondeo de float32 depende del orden de las filas
+    np.testing.assert_allclose(d_i, d_e, rtol=1e-5, atol=1e-3)
+    assert ids[0] not in set(ids_i.ravel())
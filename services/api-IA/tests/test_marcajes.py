@@ -0,0 +1,138 @@
+import pytest
+
+from marcajes import ColaMarcajes, enviar_marcaje, nuevo_marcaje
+
+
+class Respuesta:
+    def __init__(self, status_code, cuerpo=None):
+        self.status_code = status_code
+        self._cuerpo = cuerpo or {}
+
+    def json(self):
+        return self._cuerpo
+
+
+class SesionStub:
+    """
+    Sesion de requests de prueba. `responder(marcajes)` arma la respuesta
+    de cada POST; si es una excepcion, el POST la lanza (respuesta perdida).
+    """
+
+    def __init__(self, responder):
+        self.responder = responder
+        self.posts = []
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.posts.append({'url': url, 'json': json, 'headers': headers or {}})
+        respuesta = self.responder(json)
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        return respuesta
+
+
+def _todo_ok(cuerpo):
+    return Respuesta(200, {'resultados': [
+        {'claveIdempotencia': m['claveIdempotencia'], 'status': 201, 'success': True}
+        for m in cuerpo['marcajes']
+    ]})
+
+
+def _cola(tmp_path, sesion, **kwargs):
+    kwargs.setdefault('token', '')
+    return ColaMarcajes(str(tmp_path / 'cola.db'), sesion, 'http://backend', 5, **kwargs)
+
+
+def test_la_cola_sobrevive_a_un_reinicio(tmp_path):
+    sesion = SesionStub(_todo_ok)
+    cola = _cola(tmp_path, sesion)
+    cola.encolar(nuevo_marcaje('u1', 0.9))
+    cola.encolar(nuevo_marcaje('u2', 0.8, 'salida'))
+
+    reiniciada = _cola(tmp_path, sesion)
+
+    assert reiniciada.pendientes() == 2
+    reiniciada.vaciar_lote()
+    assert reiniciada.pendientes() == 0
+    assert [m['usuarioId'] for m in sesion.posts[0]['json']['marcajes']] == ['u1', 'u2']
+    assert sesion.posts[0]['url'] == 'http://backend/marcajes/reconocimiento/lote'
+
+
+def test_el_mismo_marcaje_se_encola_una_vez(tmp_path):
+    cola = _cola(tmp_path, SesionStub(_todo_ok))
+    marcaje = nuevo_marcaje('u1', 0.9)
+
+    cola.encolar(marcaje)
+    cola.encolar(dict(marcaje))
+
+    assert cola.pendientes() == 1
+    assert nuevo_marcaje('u1', 0.9)['claveIdempotencia'] != marcaje['claveIdempotencia']
+
+
+def test_respuesta_perdida_reenvia_las_mismas_claves(tmp_path):
+    respuestas = [ConnectionError("conexion cortada"), None]
+
+    def responder(cuerpo):
+        respuesta = respuestas.pop(0)
+        return respuesta if respuesta is not None else _todo_ok(cuerpo)
+
+    sesion = SesionStub(responder)
+    cola = _cola(tmp_path, sesion, intervalo=0)
+    cola.encolar(nuevo_marcaje('u1', 0.9))
+
+    assert cola.vaciar_lote() is False
+    assert cola.estado()['fallos_envio'] == 1
+    assert cola.pendientes() == 1
+    # Con intervalo 0 el backoff es nulo y el reintento sale enseguida
+    assert cola.vaciar_lote() is True
+
+    claves = [[m['claveIdempotencia'] for m in p['json']['marcajes']] for p in sesion.posts]
+    assert len(claves) == 2 and claves[0] == claves[1]
+    assert cola.estado()['enviados'] == 1
+    assert cola.pendientes() == 0
+
+
+def test_rechazados_se_descartan_y_errores_del_backend_se_reintentan(tmp_path):
+    def responder(cuerpo):
+        marcajes = cuerpo['marcajes']
+        return Respuesta(200, {'resultados': [
+            {'claveIdempotencia': marcajes[0]['claveIdempotencia'], 'status': 201, 'success': True},
+            {'claveIdempotencia': marcajes[1]['claveIdempotencia'], 'status': 400, 'success': False,
+             'message': 'Usuario inactivo'},
+            {'claveIdempotencia': marcajes[2]['claveIdempotencia'], 'status': 503, 'success': False}
+        ]})
+
+    cola = _cola(tmp_path, SesionStub(responder), intervalo=60)
+    for usuario in ('u1', 'u2', 'u3'):
+        cola.encolar(nuevo_marcaje(usuario, 0.9))
+
+    assert cola.vaciar_lote() is False
+
+    estado = cola.estado()
+    assert (estado['enviados'], estado['rechazados'], estado['pendientes']) == (1, 1, 1)
+    # El que fallo espera su backoff: no vuelve en el siguiente lote
+    assert cola.vaciar_lote() is False
+    assert len(cola.sesion.posts) == 1
+
+
+def test_token_de_servicio_en_el_lote(tmp_path):
+    sesion = SesionStub(_todo_ok)
+    cola = _cola(tmp_path, sesion, token='secreto')
+    cola.encolar(nuevo_marcaje('u1', 0.9))
+
+    cola.vaciar_lote()
+
+    assert sesion.posts[0]['headers'] == {'X-Token-Servicio': 'secreto'}
+
+
+@pytest.mark.parametrize('tipo', ['entrada', 'salida'])
+def test_envio_directo_con_clave_de_idempotencia(tipo):
+    sesion = SesionStub(lambda cuerpo: Respuesta(201))
+    marcaje = nuevo_marcaje('u1', 0.91, tipo)
+
+    respuesta = enviar_marcaje(sesion, 'http://backend', marcaje, timeout=3)
+
+    assert respuesta.status_code == 201
+    post = sesion.posts[0]
+    assert post['url'] == 'http://backend/marcajes/reconocimiento'
+    assert post['json']['tipo'] == tipo
+    assert post['headers'] == {'Idempotency-Key': marcaje['claveIdempotencia']}
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from planificador import PlanificadorLotes
+from trabajadores import ColaLlena
+
+
+class Procesador:
+    """procesar_lote de prueba: duplica cada elemento y anota los lotes."""
+
+    def __init__(self, demora=0.0):
+        self.lotes = []
+        self.demora = demora
+
+    def __call__(self, elementos):
+        self.lotes.append(list(elementos))
+        time.sleep(self.demora)
+        return [ValueError(f"malo {e}") if e < 0 else e * 2 for e in elementos]
+
+
+def _enviar_a_la_vez(planificador, elementos):
+    resultados = [None] * len(elementos)
+    barrera = threading.Barrier(len(elementos))
+
+    def enviar(i):
+        barrera.wait()
+        try:
+            resultados[i] = planificador.enviar(elementos[i])
+        except Exception as e:
+            resultados[i] = e
+
+    hilos = [threading.Thread(target=enviar, args=(i,)) for i in range(len(elementos))]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados
+
+
+@pytest.fixture
+def crear():
+    creados = []
+
+    def crear(procesador, **kwargs):
+        planificador = PlanificadorLotes(procesador, **kwargs)
+        planificador.iniciar()
+        creados.append(planificador)
+        return planificador
+
+    yield crear
+    for planificador in creados:
+        planificador.detener()
+
+
+def test_junta_las_peticiones_de_la_ventana(crear):
+    procesador = Procesador()
+    planificador = crear(procesador, ventana_ms=300, max_lote=8)
+
+    assert _enviar_a_la_vez(planificador, [1, 2, 3, 4]) == [2, 4, 6, 8]
+
+    assert [sorted(lote) for lote in procesador.lotes] == [[1, 2, 3, 4]]
+    estado = planificador.estado()
+    assert estado['tamanos_lote']['cantidad'] == 1
+    assert estado['tamanos_lote']['cubetas']['4'] == 1
+    assert estado['espera_segundos']['cantidad'] == 4
+
+
+def test_respeta_el_tamano_maximo(crear):
+    procesador = Procesador(demora=0.05)
+    planificador = crear(procesador, ventana_ms=300, max_lote=2)
+
+    assert _enviar_a_la_vez(planificador, list(range(5))) == [0, 2, 4, 6, 8]
+
+    assert max(len(lote) for lote in procesador.lotes) <= 2
+    assert sum(len(lote) for lote in procesador.lotes) == 5
+
+
+def test_error_de_un_elemento_solo_llega_a_su_peticion(crear):
+    procesador = Procesador()
+    planificador = crear(procesador, ventana_ms=300, max_lote=8)
+
+    resultados = _enviar_a_la_vez(planificador, [1, -1, 3])
+
+    assert resultados[0] == 2 and resultados[2] == 6
+    assert isinstance(resultados[1], ValueError)
+    assert len(procesador.lotes) == 1
+
+
+def test_error_del_lote_llega_a_todas(crear):
+    def fallar(elementos):
+        raise RuntimeError("galeria no disponible")
+
+    planificador = crear(fallar, ventana_ms=300, max_lote=8)
+
+    resultados = _enviar_a_la_vez(planificador, [1, 2])
+
+    assert all(isinstance(r, RuntimeError) for r in resultados)
+
+
+def test_cola_llena_y_peticion_abandonada():
+    procesador = Procesador()
+    planificador = PlanificadorLotes(procesador, ventana_ms=0, max_cola=1)
+    errores = []
+
+    def esperar():
+        try:
+            planificador.enviar(1, espera=0.3)
+        except ColaLlena as e:
+            errores.append(e)
+
+    hilo = threading.Thread(target=esperar)
+    hilo.start()
+    time.sleep(0.05)
+    # Sin el hilo del planificador la primera peticion ocupa la unica plaza
+    with pytest.raises(ColaLlena):
+        planificador.enviar(2)
+    hilo.join()
+    assert len(errores) == 1
+
+    # La peticion abandonada se descarta al tomarla: nunca se procesa
+    planificador.iniciar()
+    assert planificador.enviar(3) == 6
+    planificador.detener()
+    assert procesador.lotes == [[3]]
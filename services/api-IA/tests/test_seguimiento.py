@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+
+from seguimiento import SeguidorRostros, mover_caja
+
+LADO = 60
+
+
+def _parche():
+    rng = np.random.default_rng(0)
+    ruido = rng.integers(0, 255, (LADO, LADO, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(ruido, (5, 5), 0)
+
+
+def _frame(top, left, parche=None):
+    frame = np.full((240, 320, 3), 90, dtype=np.uint8)
+    if parche is not None:
+        frame[top:top + LADO, left:left + LADO] = parche
+    return frame
+
+
+class DetectorEnPosicion:
+    """Detector de prueba que retorna la caja donde se dibujo el parche."""
+
+    def __init__(self):
+        self.caja = None
+        self.llamadas = 0
+
+    def detectar(self, rgb):
+        self.llamadas += 1
+        return [self.caja] if self.caja else []
+
+
+def test_mover_caja_traslada_y_escala():
+    antes = np.array([[10, 10], [20, 10], [10, 20], [20, 20]], dtype=np.float32)
+    despues = (antes - 15) * 2 + 15 + np.array([5, -3], dtype=np.float32)
+
+    assert mover_caja((10, 20, 20, 10), antes, despues) == (2, 30, 22, 10)
+
+
+def test_sigue_el_rostro_entre_frames_completos():
+    parche = _parche()
+    detector = DetectorEnPosicion()
+    identificados = []
+
+    def identificar(rgb, ubicaciones):
+        identificados.append(len(ubicaciones))
+        return ['ana'] * len(ubicaciones)
+
+    seguidor = SeguidorRostros(detector, identificar, cada_k=5)
+    for i in range(6):
+        top, left = 50 + 2 * i, 60 + 3 * i
+        detector.caja = (top, left + LADO, top + LADO, left)
+        resultado = seguidor.procesar(_frame(top, left, parche))
+
+        (caja, nombre), = resultado
+        assert nombre == 'ana'
+        assert np.abs(np.array(caja) - np.array(detector.caja)).max() <= 2
+
+    # Frames 0 y 5 completos; 1..4 solo con flujo optico
+    assert identificados == [1, 1]
+    assert seguidor.estadisticas() == {'pistas': 1, 'frames_completos': 2, 'frames_seguidos': 4}
+
+
+def test_pista_perdida_vuelve_a_detectar():
+    parche = _parche()
+    detector = DetectorEnPosicion()
+    detector.caja = (50, 60 + LADO, 50 + LADO, 60)
+    seguidor = SeguidorRostros(detector, lambda rgb, ubicaciones: ['ana'] * len(ubicaciones), cada_k=10)
+
+    seguidor.procesar(_frame(50, 60, parche))
+    detector.caja = None
+    # El rostro desaparece: sin puntos que sigan, el frame se procesa completo
+    assert seguidor.procesar(_frame(0, 0)) == []
+
+    assert detector.llamadas == 2
+    assert seguidor.estadisticas()['frames_seguidos'] == 0
+
+
+def test_cambio_de_resolucion_fuerza_frame_completo():
+    detector = DetectorEnPosicion()
+    seguidor = SeguidorRostros(detector, lambda rgb, ubicaciones: [], cada_k=10)
+
+    seguidor.procesar(_frame(0, 0))
+    seguidor.procesar(np.full((120, 160, 3), 90, dtype=np.uint8))
+
+    assert detector.llamadas == 2
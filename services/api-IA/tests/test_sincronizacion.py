@@ -0,0 +1,206 @@
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+
+from almacen import AlmacenGaleria
+from codificacion import codificar_encoding
+from galeria import GaleriaRostros
+from indices import IndiceExacto
+from sincronizacion import SincronizadorEncodings
+
+
+def _encoding(semilla):
+    return np.random.default_rng(semilla).normal(size=128).astype(np.float32)
+
+
+class BackendStub:
+    """
+    /sync-encodings en memoria con la misma semantica que el backend:
+    since filtra por updatedAt >= since, los usuarios sin encoding se
+    reportan en eliminados y total cuenta los usuarios con encoding.
+    """
+
+    def __init__(self):
+        self.usuarios = {}
+        self.consultas = []
+        self._reloj = datetime(2026, 3, 2, tzinfo=timezone.utc)
+
+    def _tocar(self, usuario_id, encoding):
+        self._reloj += timedelta(seconds=1)
+        self.usuarios[usuario_id] = (encoding, self._reloj)
+
+    def guardar(self, usuario_id, encoding):
+        self._tocar(usuario_id, codificar_encoding(encoding))
+
+    def desactivar(self, usuario_id):
+        self._tocar(usuario_id, None)
+
+    def borrar(self, usuario_id):
+        """Borrado definitivo: no deja rastro en eliminados."""
+        del self.usuarios[usuario_id]
+
+    def responder(self, since):
+        self.consultas.append(since)
+        desde = datetime.fromisoformat(since) if since else None
+        cambiados = {
+            u: (encoding, fecha) for u, (encoding, fecha) in self.usuarios.items()
+            if desde is None or fecha >= desde
+        }
+        if desde is None:
+            cambiados = {u: v for u, v in cambiados.items() if v[0]}
+        fechas = [fecha for _, fecha in cambiados.values()]
+        return {
+            'success': True,
+            'incremental': desde is not None,
+            'data': [
+                {'_id': u, 'nombre': u, 'encodingFacial': encoding}
+                for u, (encoding, _) in cambiados.items() if encoding
+            ],
+            'eliminados': [u for u, (encoding, _) in cambiados.items() if not encoding],
+            'watermark': max(fechas).isoformat() if fechas else since,
+            'total': sum(1 for encoding, _ in self.usuarios.values() if encoding)
+        }
+
+
+@pytest.fixture
+def backend():
+    stub = BackendStub()
+
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/sync-encodings':
+                self.send_error(404)
+                return
+            since = parse_qs(url.query).get('since', [None])[0]
+            cuerpo = json.dumps(stub.responder(since)).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    stub.url = f"http://127.0.0.1:{servidor.server_port}"
+    yield stub
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def sincronizador(tmp_path, backend):
+    almacen = AlmacenGaleria(str(tmp_path / 'galeria'))
+    estado = {'galeria': GaleriaRostros(indice=IndiceExacto())}
+
+    def publicar(galeria):
+        estado['galeria'] = galeria
+
+    sinc = SincronizadorEncodings(backend.url, almacen, lambda: estado['galeria'], publicar)
+    sinc.galeria = lambda: estado['galeria']
+    yield sinc
+    almacen.cerrar()
+
+
+def test_primera_sincronizacion_es_completa(backend, sincronizador):
+    backend.guardar('a', _encoding(1))
+    backend.guardar('b', _encoding(2))
+
+    resumen = sincronizador.sincronizar()
+
+    assert resumen['modo'] == 'completa'
+    assert resumen['actualizados'] == 2
+    assert sorted(set(sincronizador.galeria().nombres())) == ['a', 'b']
+    assert sincronizador.marca is not None
+
+
+def test_incremental_aplica_cambios_y_eliminados(backend, sincronizador):
+    backend.guardar('a', _encoding(1))
+    backend.guardar('b', _encoding(2))
+    sincronizador.sincronizar()
+    marca = sincronizador.marca
+
+    backend.guardar('a', _encoding(3))
+    backend.desactivar('b')
+    backend.guardar('c', _encoding(4))
+    resumen = sincronizador.sincronizar()
+
+    assert backend.consultas[-1] == marca
+    assert resumen == {'modo': 'incremental', 'actualizados': 2, 'eliminados': 1, 'errores': 0}
+    galeria = sincronizador.galeria()
+    assert sorted(set(galeria.nombres())) == ['a', 'c']
+    np.testing.assert_allclose(galeria.encodings_de('a')[0], _encoding(3), atol=2e-3)
+    assert sincronizador.ids_backend == {'a', 'c'}
+
+
+def test_incremental_sin_cambios_no_recarga(backend, sincronizador):
+    backend.guardar('a', _encoding(1))
+    backend.desactivar('b')
+    sincronizador.sincronizar()
+    galeria = sincronizador.galeria()
+
+    resumen = sincronizador.sincronizar()
+
+    # El total del backend solo cuenta usuarios con encoding y cuadra con la galeria
+    assert resumen['modo'] == 'incremental'
+    assert sincronizador.galeria() is galeria
+
+
+def test_borrado_definitivo_fuerza_recarga_completa(backend, sincronizador):
+    backend.guardar('a', _encoding(1))
+    backend.guardar('b', _encoding(2))
+    sincronizador.sincronizar()
+
+    backend.borrar('b')
+    resumen = sincronizador.sincronizar()
+
+    assert resumen['modo'] == 'completa'
+    assert resumen['eliminados'] == 1
+    assert sorted(set(sincronizador.galeria().nombres())) == ['a']
+    assert backend.consultas[-1] is None
+
+
+def test_conserva_usuarios_registrados_localmente(backend, sincronizador):
+    backend.guardar('a', _encoding(1))
+    sincronizador.sincronizar()
+    with sincronizador.lock_escritura:
+        galeria = sincronizador.galeria().derivar()
+        sincronizador.almacen.aplicar_cambios(galeria, {'local': _encoding(9).reshape(1, -1)})
+        sincronizador.publicar_galeria(galeria)
+
+    backend.desactivar('a')
+    sincronizador.sincronizar()
+    assert sincronizador.sincronizar(completa=True)['modo'] == 'completa'
+
+    assert sorted(set(sincronizador.galeria().nombres())) == ['local']
+
+
+def test_backend_caido_registra_error(backend, sincronizador):
+    sincronizador.backend_url = 'http://127.0.0.1:9'
+
+    with pytest.raises(RuntimeError):
+        sincronizador.sincronizar()
+
+    assert sincronizador.con_error()
+
+
+def test_sin_marca_vuelve_a_traer_todo(backend, sincronizador):
+    backend.guardar('a', _encoding(1))
+    sincronizador.sincronizar()
+
+    # enrolamiento.py sin --combinar reescribe la galeria y descarta la marca
+    sincronizador.almacen.descartar_marca()
+    sincronizador.almacen.descartar_marca()
+    resumen = sincronizador.sincronizar()
+
+    assert resumen['modo'] == 'completa'
+    assert backend.consultas[-1] is None
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import trabajadores
+from trabajadores import ColaLlena, PoolTrabajadores, encoding_de_registro
+
+
+def detectar_lento(imagen, nombre_detector, fraccion_rostro, resolucion_completa=False):
+    """Reemplazo de detectar_y_codificar: un rostro por imagen tras `imagen` segundos."""
+    time.sleep(float(imagen))
+    return [(0, 10, 10, 0)], np.zeros((1, 128), dtype=np.float32), {'detectar': float(imagen)}
+
+
+@pytest.fixture
+def crear_pool(monkeypatch):
+    # Los procesos se crean con fork: heredan estos reemplazos y no cargan dlib
+    monkeypatch.setattr(trabajadores, '_iniciar_trabajador', lambda nombre_detector: None)
+    monkeypatch.setattr(trabajadores, 'detectar_y_codificar', detectar_lento)
+    creados = []
+
+    def crear(**kwargs):
+        pool = PoolTrabajadores(nombre_detector='hog', **kwargs)
+        pool.iniciar()
+        creados.append(pool)
+        return pool
+
+    yield crear
+    for pool in creados:
+        pool.cerrar()
+
+
+def test_altas_masivas_no_ocupan_mas_que_su_cupo(crear_pool):
+    pool = crear_pool(trabajadores=2, max_pendientes=8, max_masivos=1)
+    maximo = []
+    resultados = []
+
+    lote = threading.Thread(target=lambda: resultados.extend(
+        pool.detectar_lote(['0.1'] * 5, 0.2, masivo=True, retornar_excepciones=True)
+    ))
+    lote.start()
+    while lote.is_alive():
+        maximo.append(pool.estado()['pendientes_masivos'])
+        time.sleep(0.01)
+
+    assert max(maximo) == 1
+    assert len(resultados) == 5 and not any(isinstance(r, Exception) for r in resultados)
+    assert pool.estado()['pendientes'] == 0
+
+
+def test_peticion_en_vivo_no_espera_al_lote_masivo(crear_pool):
+    pool = crear_pool(trabajadores=2, max_pendientes=8, max_masivos=1)
+    lote = threading.Thread(target=pool.detectar_lote, args=(['0.3'] * 4, 0.2), kwargs={'masivo': True})
+    lote.start()
+    time.sleep(0.05)
+
+    inicio = time.perf_counter()
+    pool.detectar('0', 0.2)
+    espera = time.perf_counter() - inicio
+    lote.join()
+
+    # El lote completo tarda ~1.2 s en un trabajador; la peticion en vivo usa el otro
+    assert espera < 0.3
+
+
+def test_cola_llena_se_reporta_por_imagen(crear_pool):
+    pool = crear_pool(trabajadores=1, max_pendientes=1, espera=0.05)
+    ocupada = threading.Thread(target=pool.detectar, args=('0.5', 0.2))
+    ocupada.start()
+    time.sleep(0.1)
+
+    resultados = pool.detectar_lote(['0', '0'], 0.2, retornar_excepciones=True)
+    with pytest.raises(ColaLlena):
+        pool.detectar_lote(['0'], 0.2)
+    ocupada.join()
+
+    assert all(isinstance(r, ColaLlena) for r in resultados)
+    encoding, error = encoding_de_registro(resultados[0])
+    assert encoding is None and 'reintentar' in error
+    assert pool.estado()['rechazadas'] == 3
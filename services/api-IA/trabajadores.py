@@ -0,0 +1,312 @@
+"""
+Ejecucion de la deteccion y el encoding en un pool de procesos
+dlib retiene el GIL durante la deteccion y el encoding: con hilos las peticiones
+concurrentes se serializan en un nucleo. Cada proceso carga el modelo una vez.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+from bitacora import campos
+from detectores import escalar_ubicaciones, obtener_detector
+from imagenes import decodificar_imagen_rgb
+
+log = logging.getLogger(__name__)
+
+# Procesos del pool. Con 0 (por defecto, para desarrollo y pruebas) no hay
+# pool: cada imagen se detecta en el hilo de su peticion y /train y
+# /train-bulk procesan sus imagenes una tras otra. En produccion conviene
+# GUNICORN_WORKERS x TRABAJADORES ~ nucleos (docker-compose usa 2).
+TRABAJADORES = int(os.environ.get('TRABAJADORES', '0'))
+
+# Imagenes en espera + en proceso antes de rechazar; por defecto 4 por trabajador
+MAX_PENDIENTES = int(os.environ.get('MAX_PENDIENTES', str(max(1, TRABAJADORES) * 4)))
+
+# Cuantas de esas imagenes pueden ser de altas masivas (/train-bulk); el resto
+# queda para las peticiones en vivo. Por defecto una por trabajador.
+MAX_PENDIENTES_MASIVOS = int(os.environ.get('MAX_PENDIENTES_MASIVOS', str(max(1, TRABAJADORES))))
+
+# Segundos que una peticion espera un lugar en la cola antes de rechazarse
+ESPERA_COLA_SEGUNDOS = float(os.environ.get('ESPERA_COLA_SEGUNDOS', '5'))
+
+
+class ColaLlena(Exception):
+    """No hay lugar en la cola del pool dentro del tiempo de espera."""
+
+
+def detectar_y_codificar(imagen, nombre_detector, fraccion_rostro, resolucion_completa=False):
+    """
+    Decodifica la imagen a la escala de deteccion, detecta rostros y calcula
+    sus encodings. Es la unidad de trabajo del pool (y del modo sin pool).
+
+    Con `resolucion_completa` (registro de rostros) la imagen se decodifica
+    completa, se detecta sobre una copia a la escala de deteccion y el
+    encoding se calcula sobre la original para no perder detalle.
+
+    Retorna (ubicaciones en coordenadas de la imagen original,
+             encodings M x 128 float32,
+             segundos por etapa {'decodificar', 'detectar', 'codificar'}).
+    Los tiempos viajan con el resultado porque en el pool se miden en otro
+    proceso.
+    """
+    import face_recognition
+    detector = obtener_detector(nombre_detector)
+    inicio = time.perf_counter()
+    if resolucion_completa:
+        rgb, forma_original = decodificar_imagen_rgb(imagen)
+        escala = detector.escala_para(rgb.shape[0], rgb.shape[1], fraccion_rostro)
+        rgb_deteccion = rgb
+        if escala != 1.0:
+            interpolacion = cv2.INTER_AREA if escala < 1.0 else cv2.INTER_LINEAR
+            rgb_deteccion = cv2.resize(rgb, (0, 0), fx=escala, fy=escala, interpolation=interpolacion)
+    else:
+        rgb, forma_original = decodificar_imagen_rgb(
+            imagen,
+            lambda alto, ancho: detector.escala_para(alto, ancho, fraccion_rostro)
+        )
+        rgb_deteccion = rgb
+
+    decodificado = time.perf_counter()
+    ubicaciones = detector.detectar(rgb_deteccion)
+    detectado = time.perf_counter()
+
+    # Ubicaciones en las coordenadas de la imagen sobre la que se codifica
+    ubicaciones = escalar_ubicaciones(ubicaciones, rgb_deteccion.shape, rgb.shape)
+    encodings = face_recognition.face_encodings(rgb, ubicaciones) if ubicaciones else []
+    encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+    tiempos = {
+        'decodificar': decodificado - inicio,
+        'detectar': detectado - decodificado,
+        'codificar': time.perf_counter() - detectado
+    }
+    return escalar_ubicaciones(ubicaciones, rgb.shape, forma_original), encodings, tiempos
+
+
+def encoding_de_registro(resultado):
+    """
+    Valida el resultado de detectar_y_codificar (o la excepcion que lanzo)
+    para un registro, donde cada imagen debe tener exactamente un rostro.
+    Retorna (encoding, None) o (None, motivo del error).
+    """
+    if isinstance(resultado, ColaLlena):
+        return None, f"Sin capacidad para procesarla, reintentar ({resultado})"
+    if isinstance(resultado, Exception):
+        return None, f"Error - {resultado}"
+    ubicaciones, encodings, _ = resultado
+    if not ubicaciones:
+        return None, "No se detectó ningún rostro"
+    if len(ubicaciones) > 1:
+        return None, "Se detectaron múltiples rostros"
+    return encodings[0], None
+
+
+def _iniciar_trabajador(nombre_detector):
+    """Carga los modelos de dlib una sola vez por proceso."""
+    import face_recognition
+    vacia = np.zeros((64, 64, 3), dtype=np.uint8)
+    obtener_detector(nombre_detector).detectar(vacia)
+    face_recognition.face_encodings(vacia, [(0, 64, 64, 0)])
+
+
+def _listo(_):
+    return os.getpid()
+
+
+class PoolTrabajadores:
+    """
+    Pool de procesos para detectar y codificar rostros.
+
+    Los trabajadores solo reciben los bytes de la imagen y retornan
+    ubicaciones + encodings (unos cientos de bytes). La comparacion sigue
+    en el proceso principal, asi que la galeria existe una sola vez sin
+    importar cuantos trabajadores haya.
+
+    Los procesos se crean con fork en `iniciar`, antes de que arranquen
+    los hilos del servidor y de la sincronizacion: comparten por
+    copia-en-escritura la memoria ya cargada y no vuelven a importar el
+    modulo principal (lo que con spawn/forkserver cargaria la galeria de
+    nuevo en cada uno).
+
+    Un semaforo acota las imagenes en vuelo: si no hay lugar dentro de
+    `espera`, `detectar` lanza ColaLlena en vez de acumular trabajo.
+
+    Las altas masivas (`masivo=True`) comparten el pool con el reconocimiento
+    en vivo pero no mas de `max_masivos` imagenes a la vez: esperan un cupo
+    propio antes de pedir uno del total, asi un lote de cientos de imagenes
+    nunca llena la cola y una peticion en vivo espera a lo sumo a que
+    terminen esas pocas imagenes.
+
+    Si un trabajador muere (OOM, segfault de dlib) el ejecutor queda roto
+    y rechaza todo con BrokenProcessPool. El primer hilo que lo nota lo
+    reemplaza por uno nuevo bajo `_lock_ejecutor` y cada imagen afectada
+    se reenvia una sola vez; si vuelve a fallar, el error llega a la
+    peticion. A diferencia de los de `iniciar`, los procesos nuevos se
+    crean con fork desde un proceso que ya tiene hilos.
+    """
+
+    def __init__(self, trabajadores, nombre_detector, max_pendientes=MAX_PENDIENTES,
+                 espera=ESPERA_COLA_SEGUNDOS, max_masivos=MAX_PENDIENTES_MASIVOS):
+        self.trabajadores = trabajadores
+        self.nombre_detector = nombre_detector
+        self.max_pendientes = max_pendientes
+        # Con mas de un cupo, al menos uno queda siempre para las peticiones en vivo
+        self.max_masivos = max(1, min(max_masivos, max_pendientes - 1))
+        self.espera = espera
+        self._ejecutor = self._crear_ejecutor()
+        self._lock_ejecutor = threading.Lock()
+        self._cupos = threading.BoundedSemaphore(max_pendientes)
+        self._cupos_masivos = threading.BoundedSemaphore(self.max_masivos)
+        self._lock = threading.Lock()
+        self.pendientes = 0
+        self.pendientes_masivos = 0
+        self.rechazadas = 0
+        self.reconstrucciones = 0
+
+    def _crear_ejecutor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.trabajadores,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_iniciar_trabajador,
+            initargs=(self.nombre_detector,)
+        )
+
+    def _reconstruir(self, roto):
+        """Reemplaza el ejecutor `roto` salvo que otro hilo ya lo haya hecho."""
+        with self._lock_ejecutor:
+            if self._ejecutor is not roto:
+                return
+            roto.shutdown(wait=False, cancel_futures=True)
+            self._ejecutor = self._crear_ejecutor()
+            self.reconstrucciones += 1
+        log.warning("Pool de trabajadores roto, recreado", extra=campos(
+            trabajadores=self.trabajadores, reconstrucciones=self.reconstrucciones
+        ))
+
+    def iniciar(self):
+        """Crea los procesos y espera a que carguen el modelo. Llamar antes de iniciar hilos."""
+        # Con fork el primer envio lanza todos los procesos de una vez
+        list(self._ejecutor.map(_listo, range(self.trabajadores)))
+        return self.trabajadores
+
+    def _enviar(self, imagen, fraccion_rostro, nombre_detector=None, resolucion_completa=False,
+                masivo=False):
+        """
+        Reserva un cupo (y el de altas masivas si corresponde) y envia la
+        imagen al pool. Los cupos se liberan al terminar. Retorna (futuro,
+        ejecutor al que se envio).
+        """
+        if masivo:
+            # Solo compite con otras altas masivas: sus cupos se liberan al terminar cada imagen
+            self._cupos_masivos.acquire()
+        if not self._cupos.acquire(timeout=self.espera):
+            if masivo:
+                self._cupos_masivos.release()
+            with self._lock:
+                self.rechazadas += 1
+            raise ColaLlena(f"Cola de deteccion llena ({self.max_pendientes} pendientes)")
+        with self._lock:
+            self.pendientes += 1
+            self.pendientes_masivos += int(masivo)
+        # Los memoryview de multipart no se pueden serializar
+        if not isinstance(imagen, (str, bytes)):
+            imagen = bytes(imagen)
+        argumentos = (imagen, nombre_detector or self.nombre_detector, fraccion_rostro, resolucion_completa)
+        try:
+            ejecutor = self._ejecutor
+            try:
+                futuro = ejecutor.submit(detectar_y_codificar, *argumentos)
+            except BrokenProcessPool:
+                self._reconstruir(ejecutor)
+                ejecutor = self._ejecutor
+                futuro = ejecutor.submit(detectar_y_codificar, *argumentos)
+        except Exception:
+            self._liberar(None, masivo)
+            raise
+        futuro.add_done_callback(lambda terminado: self._liberar(terminado, masivo))
+        return futuro, ejecutor
+
+    def _liberar(self, _futuro, masivo=False):
+        with self._lock:
+            self.pendientes -= 1
+            self.pendientes_masivos -= int(masivo)
+        self._cupos.release()
+        if masivo:
+            self._cupos_masivos.release()
+
+    def _resultado(self, envio, imagen, fraccion_rostro, nombre_detector=None, resolucion_completa=False,
+                   masivo=False):
+        futuro, ejecutor = envio
+        try:
+            ubicaciones, encodings, tiempos = futuro.result()
+        except BrokenProcessPool:
+            # Un trabajador murio con esta imagen en vuelo: un solo reintento en un pool nuevo
+            self._reconstruir(ejecutor)
+            futuro, _ = self._enviar(imagen, fraccion_rostro, nombre_detector, resolucion_completa, masivo)
+            ubicaciones, encodings, tiempos = futuro.result()
+        # Reflejar la latencia del trabajador en las estadisticas de este proceso
+        obtener_detector(nombre_detector or self.nombre_detector).estadisticas.registrar(
+            tiempos['detectar'], len(ubicaciones)
+        )
+        return ubicaciones, encodings, tiempos
+
+    def detectar(self, imagen, fraccion_rostro):
+        """Igual que detectar_y_codificar, pero en un proceso del pool."""
+        return self._resultado(self._enviar(imagen, fraccion_rostro), imagen, fraccion_rostro)
+
+    def detectar_lote(self, imagenes, fraccion_rostro, nombre_detector=None,
+                      resolucion_completa=False, retornar_excepciones=False, masivo=False):
+        """
+        Envia todas las imagenes al pool y retorna sus resultados en orden.
+
+        Con `retornar_excepciones` una imagen que falla (tambien por
+        ColaLlena al enviarla) deja su excepcion en su posicion en vez de
+        interrumpir el lote (util para el registro, donde cada imagen
+        reporta su propio error). Si el lote supera `max_pendientes` (o
+        `max_masivos` con `masivo`), el envio espera a que se liberen cupos.
+        """
+        envios = []
+        for imagen in imagenes:
+            try:
+                envios.append(self._enviar(imagen, fraccion_rostro, nombre_detector, resolucion_completa,
+                                           masivo))
+            except ColaLlena as e:
+                if not retornar_excepciones:
+                    raise
+                envios.append(e)
+        resultados = []
+        for envio, imagen in zip(envios, imagenes):
+            if isinstance(envio, Exception):
+                resultados.append(envio)
+                continue
+            try:
+                resultados.append(self._resultado(envio, imagen, fraccion_rostro, nombre_detector,
+                                                  resolucion_completa, masivo))
+            except Exception as e:
+                if not retornar_excepciones:
+                    raise
+                resultados.append(e)
+        return resultados
+
+    def estado(self):
+        with self._lock:
+            return {
+                'trabajadores': self.trabajadores,
+                'pendientes': self.pendientes,
+                'max_pendientes': self.max_pendientes,
+                'pendientes_masivos': self.pendientes_masivos,
+                'max_masivos': self.max_masivos,
+                'rechazadas': self.rechazadas,
+                'reconstrucciones': self.reconstrucciones
+            }
+
+    def cerrar(self):
+        with self._lock_ejecutor:
+            self._ejecutor.shutdown(wait=True, cancel_futures=True)
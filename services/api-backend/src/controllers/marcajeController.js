@@ -32,49 +32,91 @@ const calcularAtraso = (horaEntrada, horaMarcaje, toleranciaMinutos) => {
   }
 };
 
-// Registrar marcaje desde reconocimiento facial (DESDE API-IA)
-exports.registrarMarcajeReconocimiento = async (req, res) => {
-  try {
-    const { usuarioId, confianza, tipo } = req.body;
+// Antiguedad maxima de la hora de reconocimiento que trae un marcaje en cola
+const MARCAJE_MAX_ANTIGUEDAD_MINUTOS = Number(process.env.MARCAJE_MAX_ANTIGUEDAD_MINUTOS || 15);
 
-    // Validar datos
-    if (!usuarioId) {
-      return res.status(400).json({
-        success: false,
-        message: 'usuarioId es requerido'
-      });
-    }
+// Diferencia de reloj tolerada entre API-IA y el backend
+const TOLERANCIA_RELOJ_MS = 30 * 1000;
 
-    // Buscar usuario y su horario
-    const usuario = await Usuario.findById(usuarioId).populate('horarioId');
-    
-    if (!usuario || !usuario.activo) {
-      return res.status(404).json({
-        success: false,
-        message: 'Usuario no encontrado o inactivo'
-      });
-    }
+// Valida la hora de reconocimiento de un marcaje en cola. Retorna { fecha } o
+// { error }; sin fecha se usa la hora del servidor.
+const validarFechaMarcajeEnCola = (fecha, ahora = new Date()) => {
+  if (fecha === undefined || fecha === null) {
+    return { fecha: ahora };
+  }
+  const fechaRecibida = new Date(fecha);
+  if (isNaN(fechaRecibida)) {
+    return { error: 'fecha invalida' };
+  }
+  if (fechaRecibida - ahora > TOLERANCIA_RELOJ_MS) {
+    return { error: 'fecha en el futuro' };
+  }
+  if (ahora - fechaRecibida > MARCAJE_MAX_ANTIGUEDAD_MINUTOS * 60 * 1000) {
+    return { error: `fecha con mas de ${MARCAJE_MAX_ANTIGUEDAD_MINUTOS} minutos de antiguedad` };
+  }
+  return { fecha: fechaRecibida };
+};
 
-    // Obtener hora actual
-    const ahora = new Date();
-    const hora = ahora.toTimeString().split(' ')[0]; // "HH:mm:ss"
-    
-    // Calcular si hay atraso (solo para entradas)
-    let estado = 'puntual';
-    let minutosAtraso = 0;
+// Crea un marcaje de reconocimiento facial. Retorna { status, body } para
+// poder usarlo tanto en el endpoint individual como en el de lotes.
+// Con claveIdempotencia, reintentar el mismo marcaje retorna el existente.
+// `fecha` solo la entrega el endpoint de lotes para API-IA, ya validada; si no, hora del servidor.
+const crearMarcajeReconocimiento = async ({ usuarioId, confianza, tipo, fecha, claveIdempotencia }) => {
+  // Validar datos
+  if (!usuarioId) {
+    return {
+      status: 400,
+      body: { success: false, message: 'usuarioId es requerido' }
+    };
+  }
 
-    if (tipo === 'entrada') {
-      const resultado = calcularAtraso(
-        usuario.horarioId.horaEntrada,
-        hora,
-        usuario.horarioId.toleranciaMinutos
-      );
-      estado = resultado.estado;
-      minutosAtraso = resultado.minutosAtraso;
+  if (claveIdempotencia) {
+    const existente = await Marcaje.findOne({ claveIdempotencia });
+    if (existente) {
+      return {
+        status: 200,
+        body: {
+          success: true,
+          duplicado: true,
+          message: 'Marcaje ya registrado',
+          data: { marcaje: existente, estado: existente.estado, minutosAtraso: existente.minutosAtraso }
+        }
+      };
     }
+  }
 
-    // Crear marcaje
-    const marcaje = await Marcaje.create({
+  // Buscar usuario y su horario
+  const usuario = await Usuario.findById(usuarioId).populate('horarioId');
+
+  if (!usuario || !usuario.activo) {
+    return {
+      status: 404,
+      body: { success: false, message: 'Usuario no encontrado o inactivo' }
+    };
+  }
+
+  // Hora del reconocimiento (los marcajes en cola llegan despues) o la actual
+  const ahora = fecha || new Date();
+  const hora = ahora.toTimeString().split(' ')[0]; // "HH:mm:ss"
+
+  // Calcular si hay atraso (solo para entradas)
+  let estado = 'puntual';
+  let minutosAtraso = 0;
+
+  if (tipo === 'entrada') {
+    const resultado = calcularAtraso(
+      usuario.horarioId.horaEntrada,
+      hora,
+      usuario.horarioId.toleranciaMinutos
+    );
+    estado = resultado.estado;
+    minutosAtraso = resultado.minutosAtraso;
+  }
+
+  // Crear marcaje
+  let marcaje;
+  try {
+    marcaje = await Marcaje.create({
       usuarioId: usuario._id,
       tipo: tipo || 'entrada',
       fecha: ahora,
@@ -82,73 +124,92 @@ exports.registrarMarcajeReconocimiento = async (req, res) => {
       estado,
       minutosAtraso,
       ubicacion: 'Terminal Reconocimiento Facial',
-      confianzaIA: confianza
+      confianzaIA: confianza,
+      ...(claveIdempotencia && { claveIdempotencia })
     });
-
-    // Si hay atraso, enviar notificacion
-    if (estado === 'atraso') {
-      try {
-        await axios.post(`${process.env.NOTIFICATION_SERVICE_URL}/notify`, {
-          destinatario: usuario.email,
-          asunto: `Registro de atraso - ${usuario.nombre} ${usuario.apellido}`,
-          tipo: 'atraso',
-          data: {
-            nombre: usuario.nombre,
-            apellido: usuario.apellido,
-            fecha: ahora.toLocaleDateString('es-CL'),
-            hora,
-            minutosAtraso,
-            horaEsperada: usuario.horarioId.horaEntrada
-          }
-        });
-        
-        marcaje.notificacionEnviada = true;
-        await marcaje.save();
-      } catch (emailError) {
-        console.error('Error al enviar notificacion:', emailError.message);
-      }
+  } catch (error) {
+    // Dos reintentos concurrentes con la misma clave: el indice unico deja pasar solo uno
+    if (error.code === 11000 && claveIdempotencia) {
+      const existente = await Marcaje.findOne({ claveIdempotencia });
+      return {
+        status: 200,
+        body: {
+          success: true,
+          duplicado: true,
+          message: 'Marcaje ya registrado',
+          data: { marcaje: existente, estado: existente.estado, minutosAtraso: existente.minutosAtraso }
+        }
+      };
     }
+    throw error;
+  }
 
-    // Notificar a través de WebSocket
-    const marcajeCompleto = await Marcaje.findById(marcaje._id)
-      .populate({
-        path: 'usuarioId',
-        select: 'nombre apellido cargo rut email',
-        populate: {
-          path: 'horarioId',
-          select: 'nombre horaEntrada horaSalida toleranciaMinutos'
+  // Si hay atraso, enviar notificacion
+  if (estado === 'atraso') {
+    try {
+      await axios.post(`${process.env.NOTIFICATION_SERVICE_URL}/notify`, {
+        destinatario: usuario.email,
+        asunto: `Registro de atraso - ${usuario.nombre} ${usuario.apellido}`,
+        tipo: 'atraso',
+        data: {
+          nombre: usuario.nombre,
+          apellido: usuario.apellido,
+          fecha: ahora.toLocaleDateString('es-CL'),
+          hora,
+          minutosAtraso,
+          horaEsperada: usuario.horarioId.horaEntrada
         }
       });
+      
+      marcaje.notificacionEnviada = true;
+      await marcaje.save();
+    } catch (emailError) {
+      console.error('Error al enviar notificacion:', emailError.message);
+    }
+  }
 
-    notificarNuevoMarcaje({
-      marcaje: marcajeCompleto,
+  // Notificar a través de WebSocket
+  const marcajeCompleto = await Marcaje.findById(marcaje._id)
+    .populate({
+      path: 'usuarioId',
+      select: 'nombre apellido cargo rut email',
+      populate: {
+        path: 'horarioId',
+        select: 'nombre horaEntrada horaSalida toleranciaMinutos'
+      }
+    });
+
+  notificarNuevoMarcaje({
+    marcaje: marcajeCompleto,
+    usuario: {
+      nombre: usuario.nombre,
+      apellido: usuario.apellido,
+      cargo: usuario.cargo,
+      rut: usuario.rut
+    },
+    tipo: tipo || 'entrada',
+    estado,
+    minutosAtraso,
+    confianza
+  }).catch(err => console.error('Error notificando WebSocket:', err));
+
+  if (estado === 'atraso') {
+    notificarAtraso({
       usuario: {
         nombre: usuario.nombre,
         apellido: usuario.apellido,
-        cargo: usuario.cargo,
         rut: usuario.rut
       },
-      tipo: tipo || 'entrada',
-      estado,
       minutosAtraso,
-      confianza
-    }).catch(err => console.error('Error notificando WebSocket:', err));
-
-    if (estado === 'atraso') {
-      notificarAtraso({
-        usuario: {
-          nombre: usuario.nombre,
-          apellido: usuario.apellido,
-          rut: usuario.rut
-        },
-        minutosAtraso,
-        hora,
-        fecha: ahora
-      }).catch(err => console.error('Error notificando atraso:', err));
-    }
+      hora,
+      fecha: ahora
+    }).catch(err => console.error('Error notificando atraso:', err));
+  }
 
-    // Devolver respuesta con datos del usuario
-    res.status(201).json({
+  // Devolver respuesta con datos del usuario
+  return {
+    status: 201,
+    body: {
       success: true,
       message: `Marcaje de ${tipo || 'entrada'} registrado exitosamente`,
       data: {
@@ -162,7 +223,21 @@ exports.registrarMarcajeReconocimiento = async (req, res) => {
         estado,
         minutosAtraso
       }
+    }
+  };
+};
+
+// Registrar marcaje desde reconocimiento facial (DESDE API-IA)
+exports.registrarMarcajeReconocimiento = async (req, res) => {
+  try {
+    // Endpoint publico: la hora del marcaje es siempre la del servidor
+    const { usuarioId, confianza, tipo } = req.body;
+    const claveIdempotencia = req.body.claveIdempotencia || req.get('Idempotency-Key');
+
+    const { status, body } = await crearMarcajeReconocimiento({
+      usuarioId, confianza, tipo, claveIdempotencia
     });
+    res.status(status).json(body);
 
   } catch (error) {
     console.error('Error en registrarMarcajeReconocimiento:', error);
@@ -174,6 +249,77 @@ exports.registrarMarcajeReconocimiento = async (req, res) => {
   }
 };
 
+// Registrar un lote de marcajes desde la cola de API-IA
+// Cada marcaje trae su claveIdempotencia, asi que reenviar un lote es seguro
+exports.registrarMarcajesReconocimientoLote = async (req, res) => {
+  try {
+    const { marcajes } = req.body;
+
+    if (!Array.isArray(marcajes) || marcajes.length === 0) {
+      return res.status(400).json({
+        success: false,
+        message: 'marcajes debe ser un arreglo no vacio'
+      });
+    }
+
+    const resultados = [];
+    for (const datos of marcajes) {
+      // Solo API-IA (con el token de servicio) puede traer la hora de reconocimiento
+      // de un marcaje en cola, y solo si es reciente y no futura. Al resto se le
+      // asigna la hora del servidor, igual que en /reconocimiento.
+      const { fecha, error } = req.servicioInterno
+        ? validarFechaMarcajeEnCola(datos.fecha)
+        : { fecha: new Date() };
+      if (error) {
+        resultados.push({
+          claveIdempotencia: datos.claveIdempotencia,
+          status: 400,
+          success: false,
+          message: error
+        });
+        continue;
+      }
+      try {
+        const { status, body } = await crearMarcajeReconocimiento({
+          usuarioId: datos.usuarioId,
+          confianza: datos.confianza,
+          tipo: datos.tipo,
+          fecha,
+          claveIdempotencia: datos.claveIdempotencia
+        });
+        resultados.push({
+          claveIdempotencia: datos.claveIdempotencia,
+          status,
+          success: body.success,
+          duplicado: body.duplicado || false,
+          message: body.message
+        });
+      } catch (error) {
+        console.error('Error en marcaje del lote:', error);
+        resultados.push({
+          claveIdempotencia: datos.claveIdempotencia,
+          status: 500,
+          success: false,
+          message: error.message
+        });
+      }
+    }
+
+    res.status(200).json({
+      success: true,
+      resultados
+    });
+
+  } catch (error) {
+    console.error('Error en registrarMarcajesReconocimientoLote:', error);
+    res.status(500).json({
+      success: false,
+      message: 'Error al registrar marcajes',
+      error: error.message
+    });
+  }
+};
+
 // Registrar marcaje (DESDE EL TERMINAL) - CON RECONOCIMIENTO FACIAL
 exports.registrarMarcaje = async (req, res) => {
   try {
@@ -202,7 +348,9 @@ exports.registrarMarcaje = async (req, res) => {
       aiResponse = await axios.post(`${aiServiceUrl}/recognize`, {
         image: imagenFacial
       }, {
-        timeout: 10000 // Timeout de 10 segundos
+        timeout: 10000, // Timeout de 10 segundos
+        // API-IA reparte su capacidad por terminal: reenviar la del kiosko, no la del backend
+        headers: { 'X-Terminal-Id': req.get('X-Terminal-Id') || req.ip }
       });
     } catch (aiError) {
       console.error('Error al llamar servicio de IA:', aiError.message);
@@ -697,4 +845,5 @@ exports.getEstadisticas = async (req, res) => {
       error: error.message
     });
   }
-};
\ No newline at end of file
+};
+exports.validarFechaMarcajeEnCola = validarFechaMarcajeEnCola;
@@ -347,25 +347,62 @@ exports.getEstadoReconocimiento = async (req, res) => {
 };
 
 // Sincronizar encodings con servicio AI (endpoint interno)
+// GET /sync-encodings            -> todos los usuarios con encoding activo
+// GET /sync-encodings?since=ISO  -> solo usuarios modificados desde esa fecha,
+//                                   mas los IDs que ya no tienen encoding activo
 exports.getSyncEncodings = async (req, res) => {
   try {
-    // Obtener usuarios con reconocimiento facial activo que tengan encoding
-    const usuarios = await Usuario.find({
+    const filtroActivos = {
       reconocimientoFacialActivo: true,
-      encodingFacial: { $exists: true, $ne: null, $ne: '' }
-    }).select('_id nombre apellido encodingFacial').lean();
+      encodingFacial: { $nin: [null, ''] }
+    };
+    const campos = '_id nombre apellido encodingFacial reconocimientoFacialActivo updatedAt';
+
+    let desde = null;
+    if (req.query.since) {
+      desde = new Date(req.query.since);
+      if (isNaN(desde.getTime())) {
+        return res.status(400).json({
+          success: false,
+          message: 'Parametro since invalido'
+        });
+      }
+    }
+
+    // Modo incremental: $gte para no perder cambios con el mismo timestamp
+    const usuarios = desde
+      ? await Usuario.find({ updatedAt: { $gte: desde } }).select(campos).lean()
+      : await Usuario.find(filtroActivos).select(campos).lean();
+
+    const tieneEncoding = u => u.reconocimientoFacialActivo && !!u.encodingFacial;
 
     // Formatear respuesta
-    const data = usuarios.map(u => ({
+    const data = usuarios.filter(tieneEncoding).map(u => ({
       _id: u._id.toString(),
       nombre: `${u.nombre} ${u.apellido}`,
       encodingFacial: u.encodingFacial
     }));
+    const eliminados = usuarios.filter(u => !tieneEncoding(u)).map(u => u._id.toString());
+
+    // Marca para la siguiente sincronizacion: mayor updatedAt entregado
+    let watermark = desde;
+    usuarios.forEach(u => {
+      if (u.updatedAt && (!watermark || u.updatedAt > watermark)) {
+        watermark = u.updatedAt;
+      }
+    });
+
+    // Mismo predicado que tieneEncoding: API-IA compara este total con su
+    // galeria y fuerza una sincronizacion completa si no coincide
+    const total = desde ? await Usuario.countDocuments(filtroActivos) : data.length;
 
     res.json({
       success: true,
+      incremental: !!desde,
       data: data,
-      total: data.length
+      eliminados: eliminados,
+      watermark: watermark ? watermark.toISOString() : null,
+      total: total
     });
   } catch (error) {
     console.error('Error en getSyncEncodings:', error);
@@ -375,4 +412,4 @@ exports.getSyncEncodings = async (req, res) => {
       error: error.message
     });
   }
-};
\ No newline at end of file
+};
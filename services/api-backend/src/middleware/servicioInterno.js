@@ -0,0 +1,26 @@
+const crypto = require('crypto');
+
+// Identifica llamadas de servicios internos (API-IA) por un token compartido
+// en TOKEN_SERVICIO_INTERNO. Con el token correcto marca req.servicioInterno;
+// un token incorrecto se rechaza. Sin token la peticion sigue como publica.
+module.exports = function servicioInterno(req, res, next) {
+  const esperado = process.env.TOKEN_SERVICIO_INTERNO || '';
+  const recibido = req.get('X-Token-Servicio') || '';
+  req.servicioInterno = false;
+
+  if (!recibido) {
+    return next();
+  }
+
+  const a = Buffer.from(recibido);
+  const b = Buffer.from(esperado);
+  if (!esperado || a.length !== b.length || !crypto.timingSafeEqual(a, b)) {
+    return res.status(401).json({
+      success: false,
+      message: 'Token de servicio invalido'
+    });
+  }
+
+  req.servicioInterno = true;
+  next();
+};
@@ -52,6 +52,9 @@ const marcajeSchema = new mongoose.Schema({
   notificacionEnviada: {
     type: Boolean,
     default: false
+  },
+  claveIdempotencia: {
+    type: String // Generada por API-IA por cada marcaje; evita duplicados al reintentar
   }
 }, {
   timestamps: true
@@ -60,5 +63,6 @@ const marcajeSchema = new mongoose.Schema({
 // Índice para búsquedas rápidas
 marcajeSchema.index({ usuarioId: 1, fecha: -1 });
 marcajeSchema.index({ fecha: -1 });
+marcajeSchema.index({ claveIdempotencia: 1 }, { unique: true, sparse: true });
 
 module.exports = mongoose.model('Marcaje', marcajeSchema);
\ No newline at end of file
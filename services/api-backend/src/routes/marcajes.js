@@ -3,6 +3,7 @@ const router = express.Router();
 const {
   registrarMarcaje,
   registrarMarcajeReconocimiento,
+  registrarMarcajesReconocimientoLote,
   registrarMarcajeConCredenciales,
   getMarcajes,
   getMarcajesHoy,
@@ -10,10 +11,12 @@ const {
 } = require('../controllers/marcajeController');
 
 const { protect, authorize } = require('../middleware/auth');
+const servicioInterno = require('../middleware/servicioInterno');
 
 // Rutas públicas para terminales
 router.post('/registrar', registrarMarcaje);
 router.post('/reconocimiento', registrarMarcajeReconocimiento);
+router.post('/reconocimiento/lote', servicioInterno, registrarMarcajesReconocimientoLote);
 router.post('/credenciales', registrarMarcajeConCredenciales);
 
 // Rutas protegidas
@@ -0,0 +1,62 @@
+const servicioInterno = require('../src/middleware/servicioInterno');
+
+describe('servicioInterno middleware', () => {
+  const OLD_TOKEN = process.env.TOKEN_SERVICIO_INTERNO;
+
+  const crearReq = (token) => ({
+    get: (nombre) => (nombre === 'X-Token-Servicio' ? token : undefined)
+  });
+  const crearRes = () => ({
+    status: jest.fn().mockReturnThis(),
+    json: jest.fn()
+  });
+
+  beforeEach(() => {
+    process.env.TOKEN_SERVICIO_INTERNO = 'secreto';
+  });
+
+  afterEach(() => {
+    process.env.TOKEN_SERVICIO_INTERNO = OLD_TOKEN;
+  });
+
+  test('marks requests with the right token as internal', () => {
+    const req = crearReq('secreto');
+    const next = jest.fn();
+
+    servicioInterno(req, crearRes(), next);
+
+    expect(req.servicioInterno).toBe(true);
+    expect(next).toHaveBeenCalled();
+  });
+
+  test('lets requests without a token through as public', () => {
+    const req = crearReq(undefined);
+    const next = jest.fn();
+
+    servicioInterno(req, crearRes(), next);
+
+    expect(req.servicioInterno).toBe(false);
+    expect(next).toHaveBeenCalled();
+  });
+
+  test('rejects a wrong token', () => {
+    const res = crearRes();
+    const next = jest.fn();
+
+    servicioInterno(crearReq('otro'), res, next);
+
+    expect(res.status).toHaveBeenCalledWith(401);
+    expect(next).not.toHaveBeenCalled();
+  });
+
+  test('rejects any token when none is configured', () => {
+    delete process.env.TOKEN_SERVICIO_INTERNO;
+    const res = crearRes();
+    const next = jest.fn();
+
+    servicioInterno(crearReq('secreto'), res, next);
+
+    expect(res.status).toHaveBeenCalledWith(401);
+    expect(next).not.toHaveBeenCalled();
+  });
+});
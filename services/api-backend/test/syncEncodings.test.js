@@ -0,0 +1,66 @@
+jest.mock('../src/models/Usuario', () => ({
+  find: jest.fn(),
+  countDocuments: jest.fn()
+}));
+jest.mock('../src/models/Horario', () => ({}));
+
+const Usuario = require('../src/models/Usuario');
+const { getSyncEncodings } = require('../src/controllers/usuarioController');
+
+const consulta = filas => ({
+  select: () => ({ lean: () => Promise.resolve(filas) })
+});
+
+const respuesta = () => ({
+  status: jest.fn().mockReturnThis(),
+  json: jest.fn()
+});
+
+describe('getSyncEncodings', () => {
+  beforeEach(() => jest.clearAllMocks());
+
+  test('counts active users with the same predicate as the data query', async () => {
+    const ahora = new Date('2026-03-02T12:00:00Z');
+    Usuario.find.mockReturnValue(consulta([
+      { _id: 'a', nombre: 'Ana', apellido: 'Diaz', encodingFacial: 'xyz',
+        reconocimientoFacialActivo: true, updatedAt: ahora },
+      { _id: 'b', nombre: 'Luis', apellido: 'Paz', encodingFacial: '',
+        reconocimientoFacialActivo: true, updatedAt: ahora }
+    ]));
+    Usuario.countDocuments.mockResolvedValue(7);
+
+    const res = respuesta();
+    await getSyncEncodings({ query: { since: '2026-03-01T00:00:00Z' } }, res);
+
+    expect(Usuario.countDocuments).toHaveBeenCalledWith({
+      reconocimientoFacialActivo: true,
+      encodingFacial: { $nin: [null, ''] }
+    });
+    expect(res.json).toHaveBeenCalledWith(expect.objectContaining({
+      incremental: true,
+      eliminados: ['b'],
+      watermark: ahora.toISOString(),
+      total: 7
+    }));
+  });
+
+  test('full sync uses the active filter and reports its own length', async () => {
+    Usuario.find.mockReturnValue(consulta([
+      { _id: 'a', nombre: 'Ana', apellido: 'Diaz', encodingFacial: 'xyz',
+        reconocimientoFacialActivo: true }
+    ]));
+
+    const res = respuesta();
+    await getSyncEncodings({ query: {} }, res);
+
+    expect(Usuario.find).toHaveBeenCalledWith({
+      reconocimientoFacialActivo: true,
+      encodingFacial: { $nin: [null, ''] }
+    });
+    expect(Usuario.countDocuments).not.toHaveBeenCalled();
+    expect(res.json).toHaveBeenCalledWith(expect.objectContaining({
+      incremental: false,
+      total: 1
+    }));
+  });
+});
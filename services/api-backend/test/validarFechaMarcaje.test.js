@@ -0,0 +1,28 @@
+const { validarFechaMarcajeEnCola } = require('../src/controllers/marcajeController');
+
+describe('validarFechaMarcajeEnCola', () => {
+  const ahora = new Date('2026-03-02T12:00:00Z');
+
+  test('uses server time when fecha is missing', () => {
+    expect(validarFechaMarcajeEnCola(undefined, ahora)).toEqual({ fecha: ahora });
+  });
+
+  test('accepts a recent recognition time', () => {
+    const fecha = new Date(ahora - 5 * 60 * 1000);
+    expect(validarFechaMarcajeEnCola(fecha.toISOString(), ahora)).toEqual({ fecha });
+  });
+
+  test('rejects future dates', () => {
+    const fecha = new Date(ahora.getTime() + 10 * 60 * 1000);
+    expect(validarFechaMarcajeEnCola(fecha.toISOString(), ahora).error).toBeDefined();
+  });
+
+  test('rejects dates older than the max age', () => {
+    const fecha = new Date(ahora - 24 * 60 * 60 * 1000);
+    expect(validarFechaMarcajeEnCola(fecha.toISOString(), ahora).error).toBeDefined();
+  });
+
+  test('rejects invalid dates', () => {
+    expect(validarFechaMarcajeEnCola('ayer', ahora).error).toBeDefined();
+  });
+});
@@ -85,6 +85,16 @@ const mockData = {
   ]
 };
 
+// Identificador estable de este navegador: API-IA reparte su capacidad por terminal
+const obtenerTerminalId = () => {
+  let terminalId = localStorage.getItem('terminalId');
+  if (!terminalId) {
+    terminalId = crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    localStorage.setItem('terminalId', terminalId);
+  }
+  return terminalId;
+};
+
 // Configuración base de Axios
 const api = axios.create({
   baseURL: import.meta.env.VITE_API_URL || '/api/v1',
@@ -409,6 +419,8 @@ export const facialAPI = {
     const response = await axios.post('http://localhost:5000/recognize-and-mark', {
       image: imageBase64,
       tipo: 'entrada'
+    }, {
+      headers: { 'X-Terminal-Id': obtenerTerminalId() }
     });
     return response;
   },
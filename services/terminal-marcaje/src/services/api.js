@@ -2,10 +2,24 @@ import axios from 'axios';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:3000/api/v1';
 
+// Identificador estable de este kiosko: API-IA reparte su capacidad por terminal
+const obtenerTerminalId = () => {
+  if (import.meta.env.VITE_TERMINAL_ID) {
+    return import.meta.env.VITE_TERMINAL_ID;
+  }
+  let terminalId = localStorage.getItem('terminalId');
+  if (!terminalId) {
+    terminalId = crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    localStorage.setItem('terminalId', terminalId);
+  }
+  return terminalId;
+};
+
 const api = axios.create({
   baseURL: API_URL,
   headers: {
     'Content-Type': 'application/json',
+    'X-Terminal-Id': obtenerTerminalId(),
   },
 });
 